@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+doc_to_md 基准测试语料生成器
+按种子确定性地生成PDF（文本页、表格页、扫描页）和DOCX（标题、段落、列表、表格），
+大小、页数和表格密度各不相同；不依赖网络和第三方库，同一种子、同一 CORPUS_VERSION 生成的文件逐字节相同
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import sys
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# 生成规则变化时递增，不同版本的语料结果不可直接比较
+CORPUS_VERSION = 1
+
+MANIFEST_NAME = "corpus.json"
+
+# 大小档位：(权重, PDF 页数范围, DOCX 段落数范围)
+SIZE_CLASSES: Dict[str, Tuple[float, Tuple[int, int], Tuple[int, int]]] = {
+    "small": (0.6, (1, 4), (20, 80)),
+    "medium": (0.3, (10, 40), (300, 1000)),
+    "large": (0.1, (80, 200), (3000, 8000)),
+}
+
+# 表格密度：表格页（PDF）或表格块（DOCX）所占比例
+TABLE_DENSITIES = (0.0, 0.1, 0.3, 0.6)
+
+# 扫描件（整页图像、没有文本层）在PDF中的比例
+SCANNED_RATIO = 0.1
+
+_WORDS = (
+    "data model report analysis system process value result method table figure section "
+    "network memory storage request response latency throughput cluster record index "
+    "policy budget review contract quarterly revenue summary appendix protocol module "
+    "sample measure error signal channel output input stream buffer worker queue batch"
+).split()
+
+_ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+
+
+def _sentence(rng: random.Random, low: int = 6, high: int = 16) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(low, high))]
+    words[0] = words[0].capitalize()
+    return " ".join(words) + "."
+
+
+def _pick_class(rng: random.Random) -> str:
+    names = list(SIZE_CLASSES)
+    return rng.choices(names, weights=[SIZE_CLASSES[n][0] for n in names])[0]
+
+
+# ---------------------------------------------------------------- PDF
+
+def _pdf_text_page(rng: random.Random) -> bytes:
+    lines = [b"BT /F1 10 Tf 12 TL 56 770 Td"]
+    for _ in range(rng.randint(30, 58)):
+        lines.append(b"(" + _sentence(rng, 8, 14).encode("ascii") + b") Tj T*")
+    lines.append(b"ET")
+    return b"\n".join(lines)
+
+
+def _pdf_table_page(rng: random.Random) -> bytes:
+    rows, cols = rng.randint(10, 30), rng.randint(3, 6)
+    width, height = 500 / cols, min(24.0, 680 / rows)
+    ops = [b"0.5 w"]
+    for r in range(rows + 1):
+        y = 760 - r * height
+        ops.append(f"56 {y:.1f} m {56 + cols * width:.1f} {y:.1f} l S".encode())
+    for c in range(cols + 1):
+        x = 56 + c * width
+        ops.append(f"{x:.1f} 760 m {x:.1f} {760 - rows * height:.1f} l S".encode())
+    ops.append(b"BT /F1 8 Tf")
+    for r in range(rows):
+        for c in range(cols):
+            text = str(rng.randint(0, 99999)) if r and c else rng.choice(_WORDS)
+            x, y = 60 + c * width, 760 - (r + 1) * height + 6
+            ops.append(f"1 0 0 1 {x:.1f} {y:.1f} Tm ({text}) Tj".encode())
+    ops.append(b"ET")
+    return b"\n".join(ops)
+
+
+def _stream(data: bytes, extra: bytes = b"") -> bytes:
+    packed = zlib.compress(data, 6)
+    return (b"<< /Length %d /Filter /FlateDecode %s>>\nstream\n" % (len(packed), extra)) + packed + b"\nendstream"
+
+
+def make_pdf(path: Path, rng: random.Random, pages: int, table_density: float, scanned: bool) -> Dict:
+    """生成一个PDF，返回其描述"""
+    objects: List[bytes] = [b"<< /Type /Catalog /Pages 2 0 R >>", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    tables = 0
+    for _ in range(pages):
+        if scanned:
+            # 1 位灰度整页图像（伪随机内容，不可压缩，体积接近真实扫描件）
+            width, height = 1700, 2200
+            objects.append(
+                b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray"
+                b" /BitsPerComponent 1 /Length %d >>\nstream\n" % (width, height, width * height // 8)
+                + rng.randbytes(width * height // 8) + b"\nendstream")
+            image_ref = len(objects)
+            objects.append(_stream(b"q 612 0 0 792 0 0 cm /Im0 Do Q"))
+            resources = b"<< /XObject << /Im0 %d 0 R >> >>" % image_ref
+        else:
+            is_table = rng.random() < table_density
+            tables += is_table
+            objects.append(_stream(_pdf_table_page(rng) if is_table else _pdf_text_page(rng)))
+            resources = b"<< /Font << /F1 3 0 R >> >>"
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources %s /Contents %d 0 R >>"
+                       % (resources, len(objects)))
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+    return {"kind": "scanned" if scanned else "text", "pages": pages, "tables": tables}
+
+
+# ---------------------------------------------------------------- DOCX
+
+_W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '<Override PartName="/word/numbering.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.numbering+xml"/>'
+    '<Override PartName="/docProps/app.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.extended-properties+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/extended-properties" '
+    'Target="docProps/app.xml"/>'
+    '</Relationships>'
+)
+
+_DOC_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/numbering" '
+    'Target="numbering.xml"/>'
+    '</Relationships>'
+)
+
+_STYLES = (
+    f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:styles {_W}>'
+    + "".join(f'<w:style w:type="paragraph" w:styleId="Heading{n}"><w:name w:val="heading {n}"/></w:style>'
+              for n in (1, 2, 3))
+    + '</w:styles>'
+)
+
+_NUMBERING = (
+    f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:numbering {_W}>'
+    '<w:abstractNum w:abstractNumId="0"><w:lvl w:ilvl="0"><w:numFmt w:val="bullet"/></w:lvl>'
+    '<w:lvl w:ilvl="1"><w:numFmt w:val="bullet"/></w:lvl></w:abstractNum>'
+    '<w:abstractNum w:abstractNumId="1"><w:lvl w:ilvl="0"><w:numFmt w:val="decimal"/></w:lvl></w:abstractNum>'
+    '<w:num w:numId="1"><w:abstractNumId w:val="0"/></w:num>'
+    '<w:num w:numId="2"><w:abstractNumId w:val="1"/></w:num>'
+    '</w:numbering>'
+)
+
+
+def _docx_paragraph(text: str, style: str = "", num: Tuple[str, str] = None, bold_prefix: int = 0) -> str:
+    ppr = ""
+    if style:
+        ppr += f'<w:pStyle w:val="{style}"/>'
+    if num:
+        ppr += f'<w:numPr><w:ilvl w:val="{num[1]}"/><w:numId w:val="{num[0]}"/></w:numPr>'
+    runs = ""
+    if bold_prefix:
+        words = text.split(" ")
+        runs += f'<w:r><w:rPr><w:b/></w:rPr><w:t xml:space="preserve">{" ".join(words[:bold_prefix])} </w:t></w:r>'
+        text = " ".join(words[bold_prefix:])
+    runs += f'<w:r><w:t xml:space="preserve">{text}</w:t></w:r>'
+    return f'<w:p><w:pPr>{ppr}</w:pPr>{runs}</w:p>'
+
+
+def _docx_table(rng: random.Random) -> str:
+    rows, cols = rng.randint(5, 40), rng.randint(2, 6)
+    out = ["<w:tbl>"]
+    for r in range(rows):
+        out.append("<w:tr>")
+        for c in range(cols):
+            text = rng.choice(_WORDS) if r == 0 else str(rng.randint(0, 99999)) if c else _sentence(rng, 2, 5)
+            out.append(f"<w:tc>{_docx_paragraph(text)}</w:tc>")
+        out.append("</w:tr>")
+    out.append("</w:tbl>")
+    return "".join(out)
+
+
+def make_docx(path: Path, rng: random.Random, paragraphs: int, table_density: float) -> Dict:
+    """生成一个DOCX，返回其描述"""
+    body: List[str] = []
+    tables = 0
+    for i in range(paragraphs):
+        if i % 15 == 0:
+            body.append(_docx_paragraph(_sentence(rng, 2, 6), style=f"Heading{rng.randint(1, 3)}"))
+        roll = rng.random()
+        if roll < table_density / 5:
+            body.append(_docx_table(rng))
+            tables += 1
+        elif roll < 0.15:
+            body.append(_docx_paragraph(_sentence(rng, 3, 8), num=(rng.choice("12"), "0")))
+        else:
+            body.append(_docx_paragraph(" ".join(_sentence(rng) for _ in range(rng.randint(1, 4))),
+                                        bold_prefix=rng.choice((0, 0, 0, 2))))
+    document = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document {_W}><w:body>'
+                + "".join(body) + '<w:sectPr/></w:body></w:document>')
+    pages = max(1, paragraphs // 25)
+    app = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+           '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'
+           f'<Pages>{pages}</Pages></Properties>')
+    parts = [
+        ("[Content_Types].xml", _CONTENT_TYPES),
+        ("_rels/.rels", _ROOT_RELS),
+        ("word/_rels/document.xml.rels", _DOC_RELS),
+        ("word/document.xml", document),
+        ("word/styles.xml", _STYLES),
+        ("word/numbering.xml", _NUMBERING),
+        ("docProps/app.xml", app),
+    ]
+    with zipfile.ZipFile(path, 'w') as zf:
+        for name, data in parts:
+            # 固定时间戳和属性，保证逐字节可复现
+            info = zipfile.ZipInfo(name, date_time=_ZIP_DATE)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            zf.writestr(info, data)
+    return {"kind": "docx", "pages": pages, "tables": tables, "paragraphs": paragraphs}
+
+
+# ---------------------------------------------------------------- 语料
+
+def _file_sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def generate_corpus(out_dir: Path, seed: int = 1, pdf_count: int = 40, docx_count: int = 40,
+                    scanned_ratio: float = SCANNED_RATIO) -> Dict:
+    """
+    生成基准测试语料
+
+    参数:
+        out_dir: 输出目录（pdf/<档位>/ 和 docx/<档位>/ 子目录，以及 corpus.json）
+        seed: 随机种子
+        pdf_count, docx_count: 各类型的文件数
+        scanned_ratio: PDF中扫描件的比例
+
+    返回:
+        语料清单（同时写入 corpus.json）；digest 是全部文件内容的摘要，用于确认两次测试使用了相同的语料
+    """
+    files = []
+    for file_type, count in (("pdf", pdf_count), ("docx", docx_count)):
+        for index in range(count):
+            # 每个文件一个独立的随机流：调整某一类的数量不影响其他文件的内容
+            rng = random.Random(f"{CORPUS_VERSION}:{seed}:{file_type}:{index}")
+            size_class = _pick_class(rng)
+            _, page_range, paragraph_range = SIZE_CLASSES[size_class]
+            density = rng.choice(TABLE_DENSITIES)
+            path = out_dir / file_type / size_class / f"{file_type}_{index:04d}.{file_type}"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if file_type == "pdf":
+                scanned = rng.random() < scanned_ratio
+                info = make_pdf(path, rng, rng.randint(*page_range) if not scanned else rng.randint(1, 6),
+                                density, scanned)
+            else:
+                info = make_docx(path, rng, rng.randint(*paragraph_range), density)
+            info.update({
+                "path": str(path.relative_to(out_dir)),
+                "type": file_type,
+                "size_class": size_class,
+                "table_density": density,
+                "bytes": path.stat().st_size,
+                "sha256": _file_sha256(path),
+            })
+            files.append(info)
+
+    digest = hashlib.sha256("".join(f["sha256"] for f in files).encode()).hexdigest()
+    manifest = {
+        "version": CORPUS_VERSION,
+        "seed": seed,
+        "digest": digest,
+        "files": files,
+    }
+    (out_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding='utf-8')
+    return manifest
+
+
+def load_manifest(corpus_dir: Path) -> Dict:
+    return json.loads((corpus_dir / MANIFEST_NAME).read_text(encoding='utf-8'))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="生成 doc_to_md 基准测试语料（确定性、离线）")
+    parser.add_argument("out_dir", type=Path, help="输出目录")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子（默认1）")
+    parser.add_argument("--pdf", type=int, default=40, help="PDF 文件数（默认40）")
+    parser.add_argument("--docx", type=int, default=40, help="DOCX 文件数（默认40）")
+    parser.add_argument("--scanned-ratio", type=float, default=SCANNED_RATIO, help="PDF 中扫描件的比例")
+    args = parser.parse_args()
+
+    manifest = generate_corpus(args.out_dir, args.seed, args.pdf, args.docx, args.scanned_ratio)
+    total_mb = sum(f["bytes"] for f in manifest["files"]) / (1024 * 1024)
+    print(f"语料: {args.out_dir}  文件 {len(manifest['files'])} 个，{total_mb:.1f} MB，digest {manifest['digest'][:16]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
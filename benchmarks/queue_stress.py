@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+任务队列的多进程领取测试
+在一个 SQLite 任务库上入队一批虚拟文档，再启动多个独立进程（各自一个 JobQueue，与多台机器上的 worker 相同）
+并发领取、完成，检查每个任务恰好被领取一次且全部完成。
+任务库放在 NFS 等共享文件系统上时（--db），可以检验跨主机的锁是否可靠
+"""
+
+import argparse
+import multiprocessing as mp
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "doc_to_md"))
+
+from job_queue import JobQueue  # noqa: E402
+
+
+def worker(db_path: str, claim_batch: int, lease: float, results) -> None:
+    """领取到队列为空为止，把领取到的路径交回父进程"""
+    queue = JobQueue(Path(db_path), lease_seconds=lease)
+    queue.start_heartbeat()
+    claimed: List[str] = []
+    try:
+        while True:
+            batch = queue.claim(claim_batch)
+            if not batch:
+                if queue.active_leases() == 0:
+                    break
+                time.sleep(0.05)
+                continue
+            for doc_path in batch:
+                claimed.append(str(doc_path))
+                queue.complete(doc_path, True)
+    finally:
+        queue.close()
+    results.put(claimed)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="任务队列多进程领取测试：每个任务恰好领取一次且全部完成")
+    parser.add_argument("--db", type=Path, help="任务库路径（默认临时目录；放在共享文件系统上可测试跨主机锁）")
+    parser.add_argument("--processes", type=int, default=6, help="并发领取的进程数")
+    parser.add_argument("--jobs", type=int, default=300, help="任务数")
+    parser.add_argument("--claim-batch", type=int, default=4, help="每次领取的任务数")
+    parser.add_argument("--lease", type=float, default=30, help="租约时长（秒）")
+    args = parser.parse_args()
+
+    work = Path(tempfile.mkdtemp(prefix="doc_to_md_queue_"))
+    db_path = args.db or work / "queue.sqlite"
+    root = work / "docs"
+    root.mkdir()
+    queue = JobQueue(db_path, lease_seconds=args.lease)
+    added, _ = queue.enqueue(root, ((root / f"doc_{i:06d}.pdf", i) for i in range(args.jobs)))
+    queue.close()
+
+    results = mp.Queue()
+    t0 = time.perf_counter()
+    procs = [mp.Process(target=worker, args=(str(db_path), args.claim_batch, args.lease, results))
+             for _ in range(args.processes)]
+    for p in procs:
+        p.start()
+    claimed = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - t0
+
+    queue = JobQueue(db_path, lease_seconds=args.lease)
+    counts = queue.counts()
+    queue.close()
+    per_source = Counter(path for batch in claimed for path in batch)
+    duplicates = [path for path, n in per_source.items() if n > 1]
+
+    print(f"入队 {added} 个，{args.processes} 个进程共领取 {sum(per_source.values())} 次"
+          f"（{', '.join(str(len(batch)) for batch in claimed)}），耗时 {elapsed:.2f}s")
+    print("任务: " + "，".join(f"{state} {count}" for state, count in counts.items()))
+    errors = []
+    if duplicates:
+        errors.append(f"{len(duplicates)} 个任务被重复领取，例如 {duplicates[0]}")
+    if len(per_source) != added:
+        errors.append(f"领取到 {len(per_source)} 个不同的任务，应为 {added}")
+    if counts["done"] != added:
+        errors.append(f"完成 {counts['done']} 个，应为 {added}")
+    for error in errors:
+        print(f"失败: {error}", file=sys.stderr)
+    shutil.rmtree(work, ignore_errors=True)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
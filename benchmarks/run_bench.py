@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+doc_to_md 基准测试
+在确定性语料上，对每个可用的转换引擎、每个并发数运行一次完整的 doc_to_md（独立进程、强制转换、
+关闭缓存和升级），从逐文件运行记录中统计 docs/s、MB/s、单文件耗时分位数和峰值RSS，
+结果写成 JSON，可与其他提交的结果比较
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+DOC_TO_MD = REPO_ROOT / "doc_to_md"
+sys.path.insert(0, str(DOC_TO_MD))
+
+from corpus import CORPUS_VERSION, MANIFEST_NAME, generate_corpus, load_manifest  # noqa: E402
+from main import DEFAULT_TOOL_PRIORITY, converter_chain  # noqa: E402
+from run_log import percentile  # noqa: E402
+from tool_registry import ToolRegistry  # noqa: E402
+
+RESULT_VERSION = 1
+
+
+def git_revision() -> Tuple[str, bool]:
+    """当前提交和工作区是否有未提交的修改"""
+    try:
+        rev = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True,
+                             check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return rev, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "", False
+
+
+def available_engines(corpus_dir: Path, manifest: Dict, file_types: List[str], tools: ToolRegistry,
+                      only: Optional[List[str]]) -> List[Tuple[str, str]]:
+    """
+    列出要测试的 (文件类型, 引擎)
+
+    按 tool_priority 中的每个名字单独构造转换链，转换链确实选中该引擎时才算可用（与正式运行的判断一致）
+    """
+    pairs = []
+    for file_type in file_types:
+        sample = next((corpus_dir / f["path"] for f in manifest["files"] if f["type"] == file_type), None)
+        if sample is None:
+            continue
+        for name in DEFAULT_TOOL_PRIORITY[file_type]:
+            config = {"tool_priority": {file_type: [name]}, "fallback": {"enabled": False}}
+            chain = converter_chain(sample, tools, config)
+            if not chain or (file_type, chain[0]) in pairs:
+                continue
+            if chain[0] != name and not (name == "pdfminer" and chain[0] == "python"):
+                # 该工具不可用，转换链退回了内置后备引擎
+                continue
+            if only and name not in only and chain[0] not in only:
+                continue
+            pairs.append((file_type, chain[0]))
+    return pairs
+
+
+def link_tree(src: Path, dest: Path) -> None:
+    """用硬链接复制语料（不能硬链接时复制），转换输出写在副本里，语料本身保持不变"""
+    def link(s, d):
+        try:
+            os.link(s, d)
+        except OSError:
+            shutil.copy2(s, d)
+    shutil.copytree(src, dest, copy_function=link, ignore=shutil.ignore_patterns(MANIFEST_NAME))
+
+
+def clean_outputs(work_dir: Path) -> None:
+    for md in work_dir.rglob("*.md"):
+        md.unlink()
+    for name in (".doc_to_md_journal.jsonl", ".doc_to_md_manifest.sqlite"):
+        (work_dir / name).unlink(missing_ok=True)
+
+
+def run_once(work_dir: Path, file_type: str, engine: str, workers: int, session: Path,
+             memory_budget: int, timeout: float) -> Dict:
+    """运行一次 doc_to_md，返回统计结果"""
+    clean_outputs(work_dir)
+    run_log = session / f"run_{file_type}_{engine}_{workers}.jsonl"
+    run_log.unlink(missing_ok=True)
+    config = {
+        "file_types": [file_type],
+        "conversion": {"force": True, "incremental": False, "classify_pdfs": False,
+                       "reuse_outputs": False, "journal": False, "keep_outputs": False},
+        "performance": {"workers": workers, "run_log": str(run_log), "memory_budget_mb": memory_budget,
+                        "scratch_dir": str(session / "scratch"), "timeout": timeout},
+        "cache": {"dir": ""},
+        "tool_priority": {file_type: ["pdfminer" if engine == "python" else engine]},
+        "fallback": {"enabled": False},
+        "file_handling": {"delete_source": False},
+    }
+    config_path = session / "config.yaml"
+    config_path.write_text(yaml.safe_dump(config, allow_unicode=True), encoding='utf-8')
+
+    # 独立的缓存目录：工具探测、代价模型和PDF分类缓存不受用户环境影响
+    env = dict(os.environ, XDG_CACHE_HOME=str(session / "xdg"), NO_COLOR="1")
+    log_path = session / f"stdout_{file_type}_{engine}_{workers}.log"
+    t0 = time.perf_counter()
+    with open(log_path, 'w') as log:
+        proc = subprocess.Popen([sys.executable, str(DOC_TO_MD / "main.py"), "--config", str(config_path)],
+                                cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        _, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - t0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    records = []
+    if run_log.exists():
+        with open(run_log, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    ok = [r for r in records if r["status"] == "ok"]
+    latencies = sorted(r["seconds"] for r in ok)
+    input_mb = sum(r.get("bytes") or 0 for r in ok) / (1024 * 1024)
+    return {
+        "type": file_type,
+        "engine": engine,
+        "workers": workers,
+        "exit_code": proc.returncode,
+        "docs": len(records),
+        "ok": len(ok),
+        "failed": sum(1 for r in records if r["status"] == "failed"),
+        "wall_seconds": round(wall, 3),
+        "docs_per_sec": round(len(ok) / wall, 3) if wall > 0 else 0.0,
+        "mb_per_sec": round(input_mb / wall, 3) if wall > 0 else 0.0,
+        "p50_seconds": round(percentile(latencies, 0.50), 4),
+        "p95_seconds": round(percentile(latencies, 0.95), 4),
+        "p99_seconds": round(percentile(latencies, 0.99), 4),
+        # 编排进程及其已回收子孙进程中的最大RSS；单个转换子进程的最大RSS
+        "peak_rss_mb": round(rusage.ru_maxrss / 1024, 1),
+        "max_child_rss_mb": round(max((r.get("max_rss_mb") or 0 for r in ok), default=0.0), 1),
+        "cpu_seconds": round(rusage.ru_utime + rusage.ru_stime, 3),
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> bool:
+    """
+    打印与基线结果的对比
+
+    返回:
+        是否有吞吐下降或 p95 上升超过 threshold（比例）的组合
+    """
+    if current["corpus"]["digest"] != baseline.get("corpus", {}).get("digest"):
+        print("警告: 两次测试的语料不同，结果不可直接比较")
+    base = {(r["type"], r["engine"], r["workers"]): r for r in baseline.get("results", [])}
+    regressed = False
+    print(f"{'类型':<5} {'引擎':<15} {'并发':>4} {'docs/s':>18} {'p95(s)':>18}")
+    for r in current["results"]:
+        old = base.get((r["type"], r["engine"], r["workers"]))
+        if old is None:
+            continue
+        tput = (r["docs_per_sec"] / old["docs_per_sec"] - 1) if old["docs_per_sec"] else 0.0
+        p95 = (r["p95_seconds"] / old["p95_seconds"] - 1) if old["p95_seconds"] else 0.0
+        flag = ""
+        if tput < -threshold or p95 > threshold:
+            regressed = True
+            flag = "  <-- 变慢"
+        print(f"{r['type']:<5} {r['engine']:<15} {r['workers']:>4} "
+              f"{old['docs_per_sec']:>7.2f}→{r['docs_per_sec']:<7.2f}{tput:+5.0%} "
+              f"{old['p95_seconds']:>7.3f}→{r['p95_seconds']:<7.3f}{p95:+5.0%}{flag}")
+    return regressed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="doc_to_md 基准测试：各引擎 × 并发数的吞吐、延迟分位数和峰值RSS")
+    parser.add_argument("--corpus", type=Path, default=Path(tempfile.gettempdir()) / "doc_to_md_bench_corpus",
+                        help="语料目录（不存在或版本/种子不符时重新生成）")
+    parser.add_argument("--seed", type=int, default=1, help="语料随机种子")
+    parser.add_argument("--pdf", type=int, default=40, help="生成语料时的 PDF 文件数")
+    parser.add_argument("--docx", type=int, default=40, help="生成语料时的 DOCX 文件数")
+    parser.add_argument("--types", nargs="+", default=["pdf", "docx"], choices=["pdf", "docx"], help="测试的文件类型")
+    parser.add_argument("--engines", nargs="+", help="只测试这些引擎（默认全部可用引擎）")
+    parser.add_argument("--workers", type=str, default="1,2,4", help="并发数列表（逗号分隔）")
+    parser.add_argument("--repeat", type=int, default=1, help="每个组合重复次数，取 docs/s 最高的一次")
+    parser.add_argument("--memory-budget", type=int, default=-1, help="传给 doc_to_md 的内存预算（默认-1不限制）")
+    parser.add_argument("--timeout", type=float, default=600, help="单文件超时上限（秒）")
+    parser.add_argument("--keep-work", action="store_true", help="保留工作目录（各次运行的 stdout 和运行记录）")
+    parser.add_argument("--output", "-o", type=Path, help="结果 JSON 路径（默认打印到标准输出）")
+    parser.add_argument("--compare", type=Path, help="与之前的结果 JSON 比较")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="--compare 时判定变慢的比例（默认0.1）；有组合变慢时退出码为1")
+    args = parser.parse_args()
+
+    corpus_dir = args.corpus.resolve()
+    manifest = None
+    if (corpus_dir / MANIFEST_NAME).exists():
+        manifest = load_manifest(corpus_dir)
+        if (manifest.get("version"), manifest.get("seed")) != (CORPUS_VERSION, args.seed):
+            manifest = None
+    if manifest is None:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+        corpus_dir.mkdir(parents=True)
+        manifest = generate_corpus(corpus_dir, args.seed, args.pdf, args.docx)
+        print(f"已生成语料: {corpus_dir}（{len(manifest['files'])} 个文件）", file=sys.stderr)
+
+    worker_counts = [int(w) for w in args.workers.split(",") if w.strip()]
+    session = Path(tempfile.mkdtemp(prefix="doc_to_md_bench_"))
+    tools = ToolRegistry(cache_path=session / "tools.json")
+    engines = available_engines(corpus_dir, manifest, args.types, tools, args.engines)
+    if not engines:
+        print("没有可测试的引擎", file=sys.stderr)
+        return 2
+
+    results = []
+    try:
+        for file_type, engine in engines:
+            work_dir = session / f"work_{file_type}"
+            if not work_dir.exists():
+                link_tree(corpus_dir / file_type, work_dir)
+            # 预热一次：工具探测缓存、页缓存和 Python 字节码，不计入结果
+            run_once(work_dir, file_type, engine, worker_counts[0], session, args.memory_budget, args.timeout)
+            for workers in worker_counts:
+                runs = [run_once(work_dir, file_type, engine, workers, session, args.memory_budget, args.timeout)
+                        for _ in range(max(1, args.repeat))]
+                best = max(runs, key=lambda r: r["docs_per_sec"])
+                results.append(best)
+                print(f"{file_type:<5} {engine:<15} workers={workers:<3} {best['docs_per_sec']:8.2f} docs/s "
+                      f"{best['mb_per_sec']:8.2f} MB/s  p95 {best['p95_seconds']:.3f}s  "
+                      f"RSS {best['peak_rss_mb']:.0f}/{best['max_child_rss_mb']:.0f} MB"
+                      + (f"  失败 {best['failed']}" if best["failed"] else ""), file=sys.stderr)
+    finally:
+        if args.keep_work:
+            print(f"工作目录（各次运行的输出和日志）: {session}", file=sys.stderr)
+        else:
+            shutil.rmtree(session, ignore_errors=True)
+
+    rev, dirty = git_revision()
+    report = {
+        "version": RESULT_VERSION,
+        "git": {"commit": rev, "dirty": dirty},
+        "host": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "corpus": {
+            "version": manifest["version"],
+            "seed": manifest["seed"],
+            "digest": manifest["digest"],
+            "files": len(manifest["files"]),
+        },
+        "tools": {name: tools.get(name).version for _, name in engines if name in ("marker", "pdftotext", "pandoc")},
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.write_text(text + "\n", encoding='utf-8')
+    else:
+        print(text)
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding='utf-8'))
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
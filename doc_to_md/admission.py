@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+按内存预算的任务准入控制
+每种转换工具有一个内存权重（MB），运行中的任务按 max(权重, 实测RSS) 计入占用；
+只有在内存预算允许时才启动新的转换，重型工具（marker）自动降低并发，轻量工具（pdftotext）不受影响
+
+md_to_pdf 也使用这里的 MemoryGovernor（md-to-pdf 及其 Chromium 进程树按同样的方式测量）
+"""
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager, nullcontext, suppress
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+# 各工具的默认内存权重（MB）
+DEFAULT_WEIGHTS: Dict[str, int] = {
+    "marker": 4000,
+    "python": 500,
+    "pdftotext": 100,
+    "pandoc": 300,
+    "docx-converter": 150,
+    "antiword": 50,
+    "catdoc": 50,
+}
+DEFAULT_WEIGHT = 300
+
+# 等待准入时重新测量内存的间隔（秒）；协程等待者共用一次测量，不是每个等待者各测一次
+POLL_INTERVAL = 0.2
+
+
+def available_memory_mb() -> Optional[int]:
+    """系统当前可用内存（MB），无法获取时返回 None"""
+    try:
+        with open("/proc/meminfo", 'r') as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES") // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def _child_pids(pid: int) -> List[int]:
+    children: List[int] = []
+    task_dir = Path(f"/proc/{pid}/task")
+    try:
+        for task in task_dir.iterdir():
+            data = (task / "children").read_text()
+            children.extend(int(x) for x in data.split())
+    except (OSError, ValueError):
+        pass
+    return children
+
+
+def process_tree_rss_mb(pid: int) -> int:
+    """进程及其全部子孙进程的RSS之和（MB）；不支持 /proc 的系统返回0"""
+    total_kb = 0
+    stack = [pid]
+    seen = set()
+    while stack:
+        p = stack.pop()
+        if p in seen:
+            continue
+        seen.add(p)
+        try:
+            with open(f"/proc/{p}/status", 'r') as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except (OSError, ValueError, IndexError):
+            continue
+        stack.extend(_child_pids(p))
+    return total_kb // 1024
+
+
+class Slot:
+    """一个已准入的任务；启动子进程后用 attach() 登记 pid 以便测量实际内存"""
+
+    def __init__(self, engine: str, weight: int):
+        self.engine = engine
+        self.weight = weight
+        self.pids: List[int] = []
+
+    def attach(self, pid: int) -> None:
+        self.pids.append(pid)
+
+    def usage_mb(self) -> int:
+        measured = sum(process_tree_rss_mb(pid) for pid in self.pids)
+        return max(self.weight, measured)
+
+
+class MemoryGovernor:
+    """
+    内存准入控制器
+
+    admit(engine) 阻塞到 当前占用 + 该工具权重 <= 预算 为止；
+    没有任务在运行时总是准入，避免权重超过预算的任务永远等待
+    """
+
+    def __init__(self, budget_mb: int = 0, weights: Optional[Dict[str, int]] = None):
+        """
+        参数:
+            budget_mb: 内存预算（MB），0 表示取当前可用内存的 80%，负数表示不限制
+            weights: 各工具的内存权重（MB），覆盖默认值
+        """
+        if budget_mb == 0:
+            available = available_memory_mb()
+            budget_mb = int(available * 0.8) if available else 0
+        budget_mb = max(0, budget_mb)
+        self.budget_mb = budget_mb
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self._slots: List[Slot] = []
+        self._cond = threading.Condition()
+        self._generation = 0
+        self.max_wait = 0.0
+        # admit_async 的等待者（只在事件循环线程中访问），由一个采样任务每个周期测量一次后统一唤醒
+        self._waiters: List[Tuple[Slot, asyncio.Future]] = []
+        self._sampler: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_mb > 0
+
+    def weight_of(self, engine: str) -> int:
+        return int(self.weights.get(engine, DEFAULT_WEIGHT))
+
+    def usage_mb(self) -> int:
+        with self._cond:
+            slots = list(self._slots)
+        return sum(slot.usage_mb() for slot in slots)
+
+    def admission(self, engine: str, count: int = 1):
+        """未启用时返回空上下文，便于调用方统一使用 with"""
+        return self.admit(engine, count) if self.enabled else nullcontext(None)
+
+    @contextmanager
+    def admit(self, engine: str, count: int = 1) -> Iterator[Slot]:
+        """
+        准入一个任务，退出上下文时释放
+
+        参数:
+            engine: 工具名，决定内存权重
+            count: 该任务同时运行的工具进程数（如分段并行提取）
+        """
+        slot = Slot(engine, self.weight_of(engine) * max(1, count))
+        t0 = time.perf_counter()
+        with self._cond:
+            while self.enabled and self._slots:
+                generation = self._generation
+                slots = list(self._slots)
+                # 测量子进程内存时不持有锁
+                self._cond.release()
+                try:
+                    used = sum(s.usage_mb() for s in slots)
+                finally:
+                    self._cond.acquire()
+                if generation != self._generation:
+                    # 测量期间有任务进入或退出，重新测量
+                    continue
+                if used + slot.weight <= self.budget_mb:
+                    break
+                self._cond.wait(POLL_INTERVAL)
+            self._slots.append(slot)
+            self._generation += 1
+            self.max_wait = max(self.max_wait, time.perf_counter() - t0)
+        try:
+            yield slot
+        finally:
+            self._release(slot)
+
+    def admission_async(self, engine: str, count: int = 1):
+        """admission 的 asyncio 版本（用于 async with）"""
+        return self.admit_async(engine, count) if self.enabled else nullcontext(None)
+
+    @asynccontextmanager
+    async def admit_async(self, engine: str, count: int = 1) -> AsyncIterator[Slot]:
+        """
+        准入一个任务；等待时不占用线程
+
+        没有任务在运行时直接准入，否则排队等采样任务：每隔 POLL_INTERVAL（或有任务退出时立即）
+        在线程中测量一次运行中任务的内存，按这一份测量依次准入放得下的等待者
+        """
+        slot = Slot(engine, self.weight_of(engine) * max(1, count))
+        t0 = time.perf_counter()
+        with self._cond:
+            admitted = not self.enabled or not self._slots
+            if admitted:
+                self._slots.append(slot)
+                self._generation += 1
+        if not admitted:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._waiters.append((slot, future))
+            if self._sampler is None or self._sampler.done():
+                self._loop, self._wakeup = loop, asyncio.Event()
+                self._sampler = loop.create_task(self._sample())
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._release(slot)  # 准入与取消同时发生
+                else:
+                    with suppress(ValueError):
+                        self._waiters.remove((slot, future))
+                raise
+        with self._cond:
+            self.max_wait = max(self.max_wait, time.perf_counter() - t0)
+        try:
+            yield slot
+        finally:
+            self._release(slot)
+
+    async def _sample(self) -> None:
+        """为所有协程等待者测量内存并准入（同一时间只有一个，等待者为空时结束）"""
+        loop = asyncio.get_running_loop()
+        while self._waiters:
+            with self._cond:
+                slots = list(self._slots)
+            # 读 /proc 放到线程中，不阻塞事件循环
+            measured = await loop.run_in_executor(None, lambda: {id(s): s.usage_mb() for s in slots})
+            with self._cond:
+                # 测量期间新准入的任务按权重计，已退出的不再计入
+                used = sum(measured.get(id(s), s.weight) for s in self._slots)
+                for slot, future in list(self._waiters):
+                    if future.done():
+                        self._waiters.remove((slot, future))
+                        continue
+                    if self._slots and used + slot.weight > self.budget_mb:
+                        continue
+                    self._slots.append(slot)
+                    self._generation += 1
+                    used += slot.weight
+                    self._waiters.remove((slot, future))
+                    future.set_result(None)
+            if not self._waiters:
+                break
+            self._wakeup.clear()
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+
+    def _release(self, slot: Slot) -> None:
+        with self._cond:
+            self._slots.remove(slot)
+            self._generation += 1
+            self._cond.notify_all()
+            loop, wakeup = self._loop, self._wakeup
+        if loop is not None and wakeup is not None and self._waiters:
+            # 有任务退出：不等下一个周期，立即重新测量（_release 可能在其他线程中调用）
+            with suppress(RuntimeError):
+                loop.call_soon_threadsafe(wakeup.set)
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+asyncio 任务编排
+转换子进程由 subprocess.Popen 启动后在事件循环中等待（管道接入事件循环），不再为每个任务占用一个阻塞线程：
+- Orchestrator 按优先级从待办队列取任务，活动任务数不超过并发上限（--workers auto 时由调节器实时调整），
+  待办任务可以调整优先级或取消，运行中的任务可以取消
+- EngineSlots 为各引擎单独设并发上限（performance.engine_concurrency），如 marker 同一时间只运行一个
+- run_process 超时、超出资源限制或被取消时终止整个进程组；子进程输出边读边只保留末尾
+- 子进程由 run_process 自己用 pidfd + os.wait4 回收（同时取得资源使用），不依赖 asyncio 的 child watcher；
+  md_to_pdf 也通过 run_process 启动 md-to-pdf
+- 第一次 Ctrl-C 停止启动新任务、等待运行中的任务结束，第二次取消运行中的任务
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import signal
+import subprocess
+import time
+from contextlib import nullcontext, suppress
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+try:
+    from .limits import RSS_POLL_INTERVAL, EngineLimits, ResourceLimitExceeded, apply_limits, exit_reason, \
+        rss_watchdog
+except ImportError:
+    from limits import RSS_POLL_INTERVAL, EngineLimits, ResourceLimitExceeded, apply_limits, exit_reason, \
+        rss_watchdog
+
+# 每个输出流保留的末尾字节数（错误信息只用到末尾，上千个并发任务也不会积压输出）
+TAIL_BYTES = 64 * 1024
+
+# 调度器在没有任务结束时重新检查并发上限的间隔（秒）
+LIMIT_POLL = 0.5
+
+
+# ---------------------------------------------------------------------------
+# 子进程回收
+# ---------------------------------------------------------------------------
+
+async def _wait_child(proc: subprocess.Popen) -> Any:
+    """
+    等待子进程结束并用 os.wait4 回收，返回资源使用（不可用时为 None），退出码写入 proc.returncode
+
+    子进程由 subprocess.Popen 启动，不经过 asyncio 的 child watcher（其内部接口在各 Python 版本间不同），
+    只由这里回收：支持 pidfd（Linux 5.3+）时由事件循环监听 pidfd，否则在线程中阻塞等待
+    """
+    loop = asyncio.get_running_loop()
+    if not hasattr(os, "wait4"):
+        await loop.run_in_executor(None, proc.wait)
+        return None
+    pidfd = None
+    if hasattr(os, "pidfd_open"):
+        try:
+            pidfd = os.pidfd_open(proc.pid)
+        except OSError:
+            pidfd = None
+    if pidfd is None:
+        _, status, rusage = await loop.run_in_executor(None, os.wait4, proc.pid, 0)
+    else:
+        try:
+            exited = loop.create_future()
+            loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+            try:
+                await exited
+            finally:
+                loop.remove_reader(pidfd)
+        finally:
+            os.close(pidfd)
+        _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return rusage
+
+
+async def _stream_reader(pipe) -> Optional[asyncio.StreamReader]:
+    """把 Popen 的输出管道接到事件循环上"""
+    if pipe is None:
+        return None
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(loop=loop)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader, loop=loop), pipe)
+    return reader
+
+
+# ---------------------------------------------------------------------------
+# 子进程
+# ---------------------------------------------------------------------------
+
+def _kill_group(proc: subprocess.Popen) -> None:
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        with suppress(ProcessLookupError):
+            proc.kill()
+
+
+async def _read_tail(stream: Optional[asyncio.StreamReader], limit: int = TAIL_BYTES) -> str:
+    """读到 EOF，只保留最后 limit 字节"""
+    if stream is None:
+        return ""
+    tail = bytearray()
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        tail += chunk
+        if len(tail) > limit:
+            del tail[:len(tail) - limit]
+    return tail.decode("utf-8", errors="replace")
+
+
+async def run_process(
+    cmd: List[str],
+    timeout: Optional[float] = None,
+    limits: Optional[EngineLimits] = None,
+    on_start: Optional[Callable[[int], None]] = None,
+) -> Tuple[subprocess.CompletedProcess, Any]:
+    """
+    在事件循环中运行一个子进程（单独的 '>' 重定向由这里打开输出文件，其他含 '>' 的命令通过 shell 执行）
+
+    子进程在新的会话（进程组）中启动，启动后立即设置资源限制；等待期间按 rss_mb 检查进程树的常驻内存
+
+    参数:
+        limits: 子进程的资源限制和优先级
+        on_start: 子进程启动后以 pid 调用（登记到内存准入控制）
+
+    返回:
+        (CompletedProcess（stdout/stderr 只含末尾）, rusage)；rusage 不可用时为 None
+
+    异常:
+        subprocess.TimeoutExpired: 超时（进程组已终止）
+        ResourceLimitExceeded: 超出资源限制
+        asyncio.CancelledError: 任务被取消（进程组已终止）
+    """
+    limits = limits or EngineLimits()
+    options = dict(stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+    if '>' in cmd[:-1]:
+        # 单独的 '>' 重定向由这里打开输出文件，不经过 shell：资源限制直接设在工具进程上
+        index = cmd.index('>')
+        with open(cmd[index + 1], 'wb') as out:
+            proc = subprocess.Popen(cmd[:index], **dict(options, stdout=out))
+    elif '>' in ' '.join(cmd):
+        proc = subprocess.Popen(' '.join(cmd), shell=True, **options)
+    else:
+        proc = subprocess.Popen(cmd, **options)
+    if limits.active:
+        apply_limits(proc.pid, limits)
+    if on_start is not None:
+        on_start(proc.pid)
+    stdout_reader = await _stream_reader(proc.stdout)
+    stderr_reader = await _stream_reader(proc.stderr)
+
+    async def finish() -> Tuple[str, str, Any]:
+        stdout, stderr, rusage = await asyncio.gather(
+            _read_tail(stdout_reader), _read_tail(stderr_reader), _wait_child(proc))
+        return stdout, stderr, rusage
+
+    task = asyncio.ensure_future(finish())
+    watchdog = rss_watchdog(limits, proc.pid)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    reason = None
+    try:
+        while True:
+            wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if watchdog is not None:
+                wait = RSS_POLL_INTERVAL if wait is None else min(wait, RSS_POLL_INTERVAL)
+            done, _ = await asyncio.wait({task}, timeout=wait)
+            if done:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                # 连同 shell 或工具派生的子进程一起终止，否则它们持有管道会让读取一直等待
+                _kill_group(proc)
+                await task
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            reason = watchdog()
+            if reason:
+                _kill_group(proc)
+                break
+    except asyncio.CancelledError:
+        _kill_group(proc)
+        with suppress(Exception):
+            await task
+        raise
+
+    stdout, stderr, rusage = await task
+    reason = reason or exit_reason(limits, proc.returncode, stderr, rusage)
+    if reason:
+        raise ResourceLimitExceeded(cmd, reason, stdout, stderr, rusage)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr), rusage
+
+
+# ---------------------------------------------------------------------------
+# 引擎并发上限
+# ---------------------------------------------------------------------------
+
+class EngineSlots:
+    """各引擎的并发上限（没有配置的引擎只受总并发数限制）"""
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None):
+        self.limits = {engine: int(n) for engine, n in (limits or {}).items() if n and int(n) > 0}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def slot(self, engine: str):
+        """用于 async with 的上下文：该引擎运行中的任务数达到上限时等待"""
+        limit = self.limits.get(engine)
+        if limit is None:
+            return nullcontext()
+        semaphore = self._semaphores.get(engine)
+        if semaphore is None:
+            semaphore = self._semaphores[engine] = asyncio.Semaphore(limit)
+        return semaphore
+
+
+# ---------------------------------------------------------------------------
+# 调度
+# ---------------------------------------------------------------------------
+
+class Orchestrator:
+    """
+    优先级调度器
+
+    待办任务只保存协程工厂，开始运行时才创建协程，上万个待办任务也只占一个堆；
+    优先级数值小的先运行，同优先级按提交顺序。同一个 key 不会同时运行两次
+    """
+
+    def __init__(
+        self,
+        limit: Callable[[], int],
+        on_done: Callable[[Hashable, "asyncio.Task"], None],
+    ):
+        """
+        参数:
+            limit: 返回当前并发上限的函数（每次调度时读取，可在运行中变化）
+            on_done: 任务结束时调用 on_done(key, task)，task 可能已被取消或以异常结束
+        """
+        self.limit = limit
+        self.on_done = on_done
+        self._heap: List[list] = []
+        self._pending: Dict[Hashable, list] = {}
+        self._factories: Dict[Hashable, Callable[[], Awaitable[Any]]] = {}
+        self._running: Dict[Hashable, asyncio.Task] = {}
+        self._rerun: Dict[Hashable, Tuple[Callable[[], Awaitable[Any]], float]] = {}
+        self._counter = itertools.count()
+        self._stopping = False
+        self._open = False
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping
+
+    def submit(self, key: Hashable, factory: Callable[[], Awaitable[Any]], priority: float = 0) -> None:
+        """
+        提交任务；key 已在待办队列中时不重复排队，正在运行时等它结束后再运行一次
+        （监视模式下文件在转换期间又被修改）
+        """
+        if key in self._pending:
+            return
+        if key in self._running:
+            self._rerun[key] = (factory, priority)
+            return
+        entry = [priority, next(self._counter), key]
+        self._pending[key] = entry
+        self._factories[key] = factory
+        heapq.heappush(self._heap, entry)
+        self._wake()
+
+    def set_priority(self, key: Hashable, priority: float) -> bool:
+        """调整待办任务的优先级；任务已开始或不存在时返回 False"""
+        entry = self._pending.get(key)
+        if entry is None:
+            return False
+        entry[2] = None  # 旧条目作废，出堆时跳过
+        del self._pending[key]
+        factory = self._factories.pop(key)
+        self.submit(key, factory, priority)
+        return True
+
+    def cancel(self, key: Hashable) -> bool:
+        """取消待办任务（不再运行）或运行中的任务（终止其子进程）"""
+        entry = self._pending.pop(key, None)
+        if entry is not None:
+            entry[2] = None
+            self._factories.pop(key, None)
+            return True
+        task = self._running.get(key)
+        if task is not None:
+            self._rerun.pop(key, None)
+            task.cancel()
+            return True
+        return False
+
+    def stop(self) -> None:
+        """不再启动新任务，运行中的任务照常完成"""
+        self._stopping = True
+        self._wake()
+
+    def hold_open(self) -> None:
+        """待办队列为空时 run() 也不返回，直到 close()（任务由其他协程陆续提交时使用）"""
+        self._open = True
+
+    def close(self) -> None:
+        """不会再提交新任务：现有任务结束后 run() 返回"""
+        self._open = False
+        self._wake()
+
+    def cancel_running(self) -> None:
+        for task in list(self._running.values()):
+            task.cancel()
+
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        self._running.pop(key, None)
+        rerun = self._rerun.pop(key, None)
+        self.on_done(key, task)
+        if rerun is not None and not self._stopping:
+            self.submit(key, *rerun)
+        self._wake()
+
+    def _next(self) -> Optional[Tuple[Hashable, Callable[[], Awaitable[Any]]]]:
+        while self._heap:
+            _, _, key = heapq.heappop(self._heap)
+            if key is None:
+                continue
+            del self._pending[key]
+            return key, self._factories.pop(key)
+        return None
+
+    async def run(self) -> List[Hashable]:
+        """
+        运行到所有任务结束，或 stop() 后运行中的任务结束
+
+        返回:
+            因 stop() 而没有开始的任务
+        """
+        self._wakeup = asyncio.Event()
+        while True:
+            while not self._stopping and len(self._running) < max(1, self.limit()):
+                item = self._next()
+                if item is None:
+                    break
+                key, factory = item
+                task = asyncio.ensure_future(factory())
+                self._running[key] = task
+                task.add_done_callback(lambda t, k=key: self._finished(k, t))
+            if not self._running and (self._stopping or (not self._pending and not self._open)):
+                break
+            self._wakeup.clear()
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), LIMIT_POLL)
+        skipped = [entry[2] for entry in sorted(self._pending.values())]
+        self._pending.clear()
+        self._factories.clear()
+        self._heap.clear()
+        return skipped
+
+
+def install_interrupt_handler(
+    loop: asyncio.AbstractEventLoop,
+    orchestrator: Orchestrator,
+    report: Optional[Callable[[str], None]] = None,
+) -> bool:
+    """
+    Ctrl-C：第一次停止启动新任务并等待运行中的任务结束，第二次取消运行中的任务
+
+    返回:
+        是否安装成功（不支持信号处理的平台上沿用默认的 KeyboardInterrupt）
+    """
+    def handle() -> None:
+        if not orchestrator.stopping:
+            orchestrator.stop()
+            if report is not None:
+                report(f"已中断：不再启动新任务，等待运行中的 {orchestrator.running} 个任务结束（再按一次 Ctrl-C 立即终止）")
+        else:
+            orchestrator.cancel_running()
+            if report is not None:
+                report("再次中断：终止运行中的任务")
+
+    try:
+        loop.add_signal_handler(signal.SIGINT, handle)
+    except (NotImplementedError, RuntimeError):
+        return False
+    return True
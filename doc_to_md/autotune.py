@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+并发数自动调节（--workers auto）
+从保守的并发数开始，按窗口统计完成任务的吞吐和CPU利用率，
+爬山式地增减活动 worker 数，逼近吞吐峰值；CPU 连续几个窗口接近满载时回退。
+不用 loadavg 判断饱和：Linux 的负载包含等待 I/O 的进程，且是滞后约1分钟的平均值，
+I/O 密集的任务会被误判为饱和，窗口又远短于它的时间常数
+pdftotext 等 I/O 密集的工具因此会用到更多 worker，marker 等 CPU/内存密集的工具会用更少
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 一个统计窗口的最短和最长时间（秒）；最短时间内完成的任务太少时延长窗口，减少噪声
+MIN_WINDOW = 3.0
+MAX_WINDOW = 30.0
+
+# 吞吐变化小于该比例视为持平
+TOLERANCE = 0.05
+
+# 饱和判定：CPU利用率（iowait 计为空闲）
+SATURATED_CPU = 0.95
+
+# CPU 连续饱和多少个窗口后才减少 worker（单个窗口的峰值不触发回退）
+SATURATED_WINDOWS = 3
+
+# 连续持平多少个窗口后再向上试探一次
+PROBE_AFTER_FLAT = 3
+
+# 各并发数吞吐的滑动平均中新观测值的权重
+EWMA_ALPHA = 0.5
+
+
+def _read_cpu_times() -> Optional[Tuple[int, int]]:
+    """/proc/stat 中全部CPU的 (忙碌时间, 总时间)；不支持时返回 None"""
+    try:
+        with open("/proc/stat", 'r') as f:
+            fields = [int(x) for x in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)  # idle + iowait
+    total = sum(fields[:8])
+    return total - idle, total
+
+
+def _load_per_cpu() -> Optional[float]:
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (OSError, AttributeError):
+        return None
+
+
+class WorkerTuner:
+    """
+    爬山式并发调节器
+
+    后台线程每个窗口比较一次吞吐：上一步让吞吐明显上升就沿同一方向继续，明显下降就反向；
+    持平时回到记录中吞吐最高的并发数，已在最高点时连续持平若干窗口后向上试探一次；
+    CPU 连续 SATURATED_WINDOWS 个窗口饱和时无论吞吐如何都减少一个 worker
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int = 1,
+        maximum: int = 0,
+        report: Optional[Callable[[str], None]] = None,
+    ):
+        """
+        参数:
+            initial: 起始并发数
+            minimum, maximum: 并发数范围（maximum 为0表示 CPU 核数的4倍）
+            report: 并发数变化时的输出函数
+        """
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum or (os.cpu_count() or 4) * 4)
+        # 当前允许的活动 worker 数：调度器每次放行新任务前读取，只由调节线程修改（缩小时不打断运行中的任务）
+        self.workers = min(self.maximum, max(self.minimum, initial))
+        self.report = report
+        self.peak = self.workers
+        self.history: List[Tuple[int, float]] = []  # (并发数, 吞吐) 每个窗口一条
+
+        self._completed = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._direction = 1
+        self._last_throughput: Optional[float] = None
+        self._flat = 0
+        self._saturated = 0  # 连续饱和的窗口数
+        self._by_count: Dict[int, float] = {}  # 各并发数吞吐的滑动平均
+
+    def record_completion(self) -> None:
+        with self._lock:
+            self._completed += 1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="worker-tuner", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        window_start = time.monotonic()
+        cpu_start = _read_cpu_times()
+        with self._lock:
+            done_start = self._completed
+        while not self._stop.wait(1.0):
+            now = time.monotonic()
+            elapsed = now - window_start
+            with self._lock:
+                done = self._completed - done_start
+            # 窗口内至少完成 2 倍并发数的任务才比较，长任务时延长窗口
+            if elapsed < MIN_WINDOW or (done < 2 * self.workers and elapsed < MAX_WINDOW):
+                continue
+
+            cpu_end = _read_cpu_times()
+            cpu_util = None
+            if cpu_start and cpu_end and cpu_end[1] > cpu_start[1]:
+                cpu_util = (cpu_end[0] - cpu_start[0]) / (cpu_end[1] - cpu_start[1])
+            self._step(done / elapsed, cpu_util, _load_per_cpu())
+
+            window_start, cpu_start = now, cpu_end
+            with self._lock:
+                done_start = self._completed
+
+    def _step(self, throughput: float, cpu_util: Optional[float], load: Optional[float]) -> None:
+        """
+        根据一个窗口的观测决定下一步的并发数
+
+        参数:
+            load: 每核负载，只用于输出，不参与判断
+        """
+        current = self.workers
+        self.history.append((current, throughput))
+        previous = self._by_count.get(current)
+        self._by_count[current] = throughput if previous is None else \
+            EWMA_ALPHA * throughput + (1 - EWMA_ALPHA) * previous
+        best = max(self._by_count, key=self._by_count.get)
+        self._saturated = self._saturated + 1 if cpu_util is not None and cpu_util >= SATURATED_CPU else 0
+
+        if self._saturated >= SATURATED_WINDOWS:
+            target, reason = current - 1, f"CPU 连续 {self._saturated} 个窗口饱和"
+            self._direction = -1
+            self._saturated = 0
+        elif self._last_throughput is None:
+            target, reason = current + 1, "试探"
+        elif throughput > self._last_throughput * (1 + TOLERANCE):
+            target, reason = current + self._direction, "吞吐上升"
+            self._flat = 0
+        elif throughput < self._last_throughput * (1 - TOLERANCE):
+            self._direction = -self._direction
+            target, reason = current + self._direction, "吞吐下降"
+            self._flat = 0
+        elif best != current and self._by_count[best] > self._by_count[current] * (1 + TOLERANCE):
+            # 持平但之前有明显更好的并发数：回到那里，避免一路缓慢漂移
+            self._direction = 1 if best > current else -1
+            target, reason = best, "回到吞吐最高的并发数"
+            self._flat = 0
+        else:
+            self._flat += 1
+            if self._flat < PROBE_AFTER_FLAT:
+                target, reason = current, ""
+            else:
+                self._flat = 0
+                self._direction = 1
+                target, reason = current + 1, "持平，向上试探"
+        self._last_throughput = throughput
+        if self._saturated and target > current:
+            # CPU 已经满载（还没持续到需要回退）：不再增加
+            target, reason = current, ""
+
+        target = min(self.maximum, max(self.minimum, target))
+        if target != current:
+            self.workers = target
+            self.peak = max(self.peak, target)
+            if self.report is not None:
+                cpu = f"{cpu_util:.0%}" if cpu_util is not None else "-"
+                ld = f"{load:.2f}" if load is not None else "-"
+                self.report(f"workers {current} → {target}（{reason}；吞吐 {throughput:.2f}/s，CPU {cpu}，每核负载 {ld}）")
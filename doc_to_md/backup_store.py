@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+内容寻址的源文件备份库
+删除源文件之前把它放进备份目录：按内容的 SHA-256 命名，相同内容的文件只保存一份；
+同一文件系统上优先用 FICLONE 写时复制克隆（reflink，btrfs/XFS 等），
+不支持时（或跨文件系统）流式复制，复制时同时计算哈希，源文件只读一遍；硬链接需要显式启用。
+备份对象设为只读，去重时重新校验已有对象的哈希，被改动的对象用新内容替换。
+每次备份在 index.jsonl 中追加一行（源路径、哈希、大小、修改时间），按源路径恢复。
+
+备份在有界的后台队列中执行，转换不等待备份；队列满时提交方阻塞，积压不会无限增长
+"""
+
+import hashlib
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from .conversion_cache import HASH_CHUNK, clone_file, file_sha256
+except ImportError:
+    from conversion_cache import HASH_CHUNK, clone_file, file_sha256
+
+# 落地方式
+LINK_MODES = ("auto", "reflink", "copy", "hardlink")
+
+# 后台队列的默认线程数和容量
+DEFAULT_BACKUP_WORKERS = 2
+DEFAULT_BACKUP_QUEUE = 32
+
+
+def copy_and_hash(src: Path, dest: Path) -> str:
+    """流式复制 src 到新文件 dest，同时计算内容的 SHA-256"""
+    h = hashlib.sha256()
+    with open(src, 'rb') as s, open(dest, 'xb') as d:
+        while True:
+            chunk = s.read(HASH_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+            d.write(chunk)
+        d.flush()
+        os.fsync(d.fileno())
+    return h.hexdigest()
+
+
+def _fsync_dir(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class BackupStore:
+    """
+    内容寻址的备份目录
+
+    目录结构: <backup_dir>/objects/<哈希前两位>/<哈希>，<backup_dir>/index.jsonl
+    对象先在 objects 下的临时文件中落地再 os.replace，多个线程/进程并发备份相同内容是安全的
+    """
+
+    def __init__(self, backup_dir: Path, link_mode: str = "auto"):
+        """
+        参数:
+            backup_dir: 备份目录
+            link_mode: "auto" 或 "reflink"（reflink，不支持时复制）、"copy"（总是复制）
+                或 "hardlink"（reflink，其次硬链接，最后复制；硬链接与源文件共享 inode，
+                源文件未被删除而被原地修改时备份随之改变）
+        """
+        self.backup_dir = Path(backup_dir).expanduser()
+        self.objects_dir = self.backup_dir / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.backup_dir / "index.jsonl"
+        self.link_mode = link_mode
+        self.counts: Dict[str, int] = {}
+        self.bytes_copied = 0
+        self._lock = threading.Lock()
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest
+
+    def _materialize(self, source: Path, tmp: Path) -> Tuple[str, Optional[str]]:
+        """把 source 落地为 tmp，返回 (方式, 哈希)；链接方式不读取内容，哈希为 None"""
+        if self.link_mode != "copy":
+            try:
+                if clone_file(source, tmp):
+                    return "reflink", None
+            except OSError:
+                tmp.unlink(missing_ok=True)
+            if self.link_mode == "hardlink":
+                # 硬链接与源文件共享 inode：源文件随后被删除，数据留在备份中
+                try:
+                    os.link(source, tmp)
+                    return "hardlink", None
+                except OSError:
+                    pass
+        return "copy", copy_and_hash(source, tmp)
+
+    def _intact(self, obj: Path, digest: str) -> bool:
+        """已有对象的内容是否仍与哈希一致（硬链接的源文件被原地修改、对象被改写时不一致）"""
+        try:
+            if file_sha256(obj) == digest:
+                return True
+        except OSError:
+            return False
+        print(f"警告: 备份对象内容与哈希不符，用新内容替换: {obj}")
+        return False
+
+    def store(self, source: Path) -> Tuple[Path, str]:
+        """
+        备份一个文件
+
+        返回:
+            (对象路径, 方式)；方式为 reflink、hardlink、copy，或 dedup（已有相同内容，不占新空间）
+
+        异常:
+            OSError: 读取源文件或写入备份目录失败（此时不会留下临时文件）
+        """
+        st = source.stat()
+        tmp = self.objects_dir / f".{uuid.uuid4().hex}.tmp"
+        try:
+            method, digest = self._materialize(source, tmp)
+            if digest is None:
+                digest = file_sha256(tmp)
+            obj = self._object_path(digest)
+            obj.parent.mkdir(exist_ok=True)
+            if obj.exists() and self._intact(obj, digest):
+                tmp.unlink()
+                method = "dedup"
+            else:
+                if method != "hardlink":
+                    # 硬链接的权限属于源文件本身，不修改
+                    shutil.copystat(source, tmp)
+                    os.chmod(tmp, 0o444)
+                os.replace(tmp, obj)
+                _fsync_dir(obj.parent)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        self._record({
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "source": str(source.absolute()),
+            "sha256": digest,
+            "size": st.st_size,
+            "mtime": st.st_mtime,
+            "method": method,
+        })
+        with self._lock:
+            self.counts[method] = self.counts.get(method, 0) + 1
+            if method == "copy":
+                self.bytes_copied += st.st_size
+        return obj, method
+
+    def _record(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock, open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def entries(self) -> Iterator[Dict[str, Any]]:
+        """按备份顺序读取索引（跳过被截断的行）"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            return
+
+    def find(self, source: Path) -> Optional[Dict[str, Any]]:
+        """源路径最近一次备份的索引项"""
+        source_str = str(Path(source).absolute())
+        latest = None
+        for entry in self.entries():
+            if entry.get("source") == source_str:
+                latest = entry
+        return latest
+
+    def restore(self, source: Path, dest: Optional[Path] = None) -> Path:
+        """
+        把源路径最近一次备份的内容复制到 dest（默认恢复到原位置），并恢复修改时间
+
+        异常:
+            FileNotFoundError: 没有该路径的备份
+            FileExistsError: 目标已存在
+        """
+        entry = self.find(source)
+        if entry is None:
+            raise FileNotFoundError(f"没有备份: {source}")
+        dest = Path(dest or entry["source"])
+        if dest.exists():
+            raise FileExistsError(f"目标已存在: {dest}")
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            if not clone_file(self._object_path(entry["sha256"]), tmp):
+                shutil.copyfile(self._object_path(entry["sha256"]), tmp)
+            os.utime(tmp, (entry["mtime"], entry["mtime"]))
+            os.replace(tmp, dest)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return dest
+
+    def summary(self) -> str:
+        with self._lock:
+            parts = [f"{method} {count}" for method, count in sorted(self.counts.items())]
+            copied = self.bytes_copied
+        text = "，".join(parts) or "无"
+        if copied:
+            text += f"（复制 {copied / (1024 * 1024):.1f} MB）"
+        return text
+
+
+class BackupQueue:
+    """
+    有界的后台任务队列：固定数量的线程依次执行提交的任务（备份后删除源文件）
+
+    队列满时 submit 阻塞，提交方（转换线程）随之放慢，积压的任务数不超过 max_pending
+    """
+
+    def __init__(self, workers: int = DEFAULT_BACKUP_WORKERS, max_pending: int = DEFAULT_BACKUP_QUEUE):
+        self._queue: "queue.Queue[Optional[Tuple[Callable, tuple]]]" = queue.Queue(max(1, max_pending))
+        self._threads: List[threading.Thread] = []
+        for i in range(max(1, workers)):
+            thread = threading.Thread(target=self._run, name=f"backup-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                fn, args = item
+                try:
+                    fn(*args)
+                except Exception as e:
+                    print(f"后台备份任务失败: {e}")
+            finally:
+                self._queue.task_done()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.unfinished_tasks
+
+    def submit(self, fn: Callable, *args) -> None:
+        self._queue.put((fn, args))
+
+    def close(self) -> None:
+        """等待已提交的任务全部完成后停止线程"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+
+def main() -> None:
+    """查看或恢复备份：python doc_to_md/backup_store.py 备份目录 [源路径 [恢复到]]"""
+    import sys
+    if len(sys.argv) not in (2, 3, 4):
+        print("用法: python doc_to_md/backup_store.py 备份目录 [源路径 [恢复到]]")
+        sys.exit(2)
+    store = BackupStore(Path(sys.argv[1]))
+    if len(sys.argv) == 2:
+        objects = set()
+        for entry in store.entries():
+            objects.add(entry["sha256"])
+            print(f"{entry['time']}  {entry['sha256'][:12]}  {entry['size']:>12}  {entry['source']}")
+        print(f"共 {len(objects)} 个对象")
+        return
+    try:
+        dest = store.restore(Path(sys.argv[2]), Path(sys.argv[3]) if len(sys.argv) == 4 else None)
+    except (FileNotFoundError, FileExistsError) as e:
+        print(e)
+        sys.exit(1)
+    print(f"已恢复: {dest}")
+
+
+if __name__ == "__main__":
+    main()
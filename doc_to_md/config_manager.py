@@ -13,6 +13,15 @@ from pathlib import Path
 from typing import Dict, Any, List, Optional
 import argparse
 
+try:
+    from .limits import validate_engine_limits
+except ImportError:
+    from limits import validate_engine_limits
+
+# 已弃用的工具名 -> 替代它的引擎；加载配置时在 tool_priority 中替换并提示
+# python-docx：早期版本用 python-docx 库转换 DOCX，已由内置的 docx-converter 取代
+DEPRECATED_TOOLS = {"python-docx": "docx-converter"}
+
 
 class ConfigManager:
     """配置文件管理器"""
@@ -56,6 +65,23 @@ class ConfigManager:
             print(f"警告: 无法加载配置文件 {self.config_path}: {e}")
             print("使用默认配置")
             self.config = default_config
+            return
+        
+        self._replace_deprecated_tools()
+    
+    def _replace_deprecated_tools(self) -> None:
+        """把 tool_priority 中已弃用的工具名换成替代的引擎（保持顺序，去掉因此产生的重复项）"""
+        for file_type, names in (self.config.get("tool_priority") or {}).items():
+            if not isinstance(names, list):
+                continue
+            replaced: List[str] = []
+            for name in names:
+                if name in DEPRECATED_TOOLS:
+                    print(f"警告: tool_priority.{file_type} 中的 {name} 已弃用，改用 {DEPRECATED_TOOLS[name]}")
+                    name = DEPRECATED_TOOLS[name]
+                if name not in replaced:
+                    replaced.append(name)
+            self.config["tool_priority"][file_type] = replaced
     
     def _deep_merge(self, default: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
         """深度合并两个字典，override中的值覆盖default中的值"""
@@ -85,11 +111,35 @@ class ConfigManager:
                 "force": False,
                 "include_hidden": False,
                 "keep_outputs": False,
-                "verbose_cmd": False
+                "verbose_cmd": False,
+                "incremental": False,  # 按清单判断源文件是否变化
+                "manifest_hash": False,  # 清单中同时记录内容哈希
+                "classify_pdfs": True,  # 预先抽样判断PDF有无文本层，扫描件直接交给 marker
+                "reuse_outputs": True,  # 复用临时目录中源文件未变化的完整 marker 输出
+                "journal": True  # 在根目录的 .doc_to_md_journal.jsonl 中记录运行日志（供 --resume 使用）
             },
             "performance": {
-                "workers": 0,  # 0表示自动检测
-                "timeout": 0   # 0表示不设超时
+                "workers": 0,  # 0表示CPU核数，"auto"表示按实测吞吐自动调节
+                "timeout": 0,  # 单文件超时上限（秒），0表示不设上限
+                "adaptive_timeout": True,  # 按估算耗时为每个文件计算超时
+                "timeout_factor": 4.0,  # 自适应超时的安全系数
+                "timeout_min": 30,  # 自适应超时的下限（秒）
+                "probe_cache": True,  # 缓存转换工具探测结果
+                "python_workers": 0,  # Python引擎进程池大小，0表示与workers相同
+                "worker_max_jobs": 50,  # 每个进程处理多少个文档后回收，0表示不回收
+                "split_pages_threshold": 500,  # 页数达到该值的PDF分段并行提取，0表示不分段
+                "split_chunk_pages": 100,  # 每段页数
+                "split_workers": 0,  # 单个PDF分段提取的并行数，0表示CPU核数
+                "marker_batch_size": 8,  # 每个 marker 进程转换的PDF数，1表示不批处理
+                "marker_batch_linger": 2.0,  # 升级到 marker 的文档凑批的最长等待（秒）
+                "schedule": "longest_first",  # 调度顺序：longest_first（估算代价最大的先做）或 path
+                "scratch_dir": "",  # 中间输出目录，空表示自动（$XDG_RUNTIME_DIR 或 /dev/shm，空间不足时用根目录下的 _marker_outputs）
+                "scratch_min_free_mb": 1024,  # 自动选择临时目录时要求的最小可用空间
+                "run_log": "",  # 逐文件运行记录（JSON Lines）路径，空表示不记录
+                "memory_budget_mb": 0,  # 转换任务的内存预算，0表示可用内存的80%，负数表示不限制
+                "memory_weights": {},  # 各工具的内存权重（MB），覆盖内置默认值
+                "engine_limits": {},  # 各引擎子进程的资源限制和优先级（default 项适用于所有引擎）
+                "engine_concurrency": {}  # 各引擎同时运行的任务数上限，没有配置的引擎只受 workers 限制
             },
             "file_handling": {
                 "delete_source": False,
@@ -98,6 +148,9 @@ class ConfigManager:
                 "batch_confirmation": "interactive",
                 "backup_enabled": False,
                 "backup_dir": "./backup",
+                "backup_link_mode": "auto",  # 备份落地方式：auto（reflink，不支持时复制）、copy 或 hardlink
+                "backup_workers": 2,  # 后台备份线程数
+                "backup_queue_size": 32,  # 等待备份的源文件数上限，队列满时转换等待
                 "use_trash": True,
                 "verify_before_delete": True,
                 "exclude_dirs": [
@@ -105,6 +158,28 @@ class ConfigManager:
                     "dist", "build", "__pycache__", "_marker_outputs"
                 ]
             },
+            "cache": {
+                "dir": "",  # 转换缓存目录，空表示不启用
+                "max_size_mb": 10240,  # 缓存总大小上限（MB），0表示不限制
+                "link_mode": "reflink"  # 命中时的落地方式：reflink（不支持时复制）、copy 或 hardlink
+            },
+            "queue": {
+                "db": "",  # 多机共享的任务库路径，空表示不使用任务队列
+                "lease_seconds": 300,  # 租约时长（秒），worker 每三分之一租约续租一次
+                "max_attempts": 3,  # 一个任务最多被领取的次数
+                "claim_batch": 0  # 每次领取的任务数，0表示并发数的2倍
+            },
+            "watch": {
+                "settle_seconds": 2.0,  # 文件最后一次变化后静默多久才开始转换（等待复制或保存完成）
+                "poll_interval": 5.0,  # 轮询模式下的扫描间隔（秒）
+                "force_poll": False  # 总是轮询（网络文件系统上远端写入不产生 inotify 事件）
+            },
+            "serve": {
+                "listen": "127.0.0.1:8765",  # 监听地址：主机:端口 或 unix:套接字路径
+                "max_upload_mb": 512,  # 上传文件大小上限（MB），0表示不限制
+                "batch_window": 0.2,  # 收集同时到达的请求的时间（秒），用于合并 marker 批次
+                "upload_dir": ""  # 上传文件的临时目录，空表示使用临时目录下的 _uploads
+            },
             "output": {
                 "directory_mode": "same",
                 "relative_path": "./converted",
@@ -112,9 +187,17 @@ class ConfigManager:
             },
             "tool_priority": {
                 "pdf": ["marker", "pdftotext", "pdfminer"],
-                "docx": ["pandoc", "python-docx", "antiword", "catdoc"],
+                "docx": ["pandoc", "docx-converter", "antiword", "catdoc"],
                 "doc": ["antiword", "catdoc", "pandoc"]
             },
+            "fallback": {
+                "enabled": True,  # 按 tool_priority 依次尝试，失败或输出不合格时换下一个工具
+                "cheap_first": True,  # 廉价工具优先，昂贵工具（marker）只用于升级
+                "cheap_timeout": 60,  # 廉价工具后面还有候选时的超时上限（秒），0表示不限
+                "min_chars": 20,  # 输出正文最少字符数
+                "min_chars_per_page": 30,  # 每页平均最少字符数
+                "max_garbage_ratio": 0.1  # 乱码字符占正文的最大比例
+            },
             "logging": {
                 "level": "info",
                 "color": True,
@@ -164,12 +247,67 @@ class ConfigManager:
             self.config["conversion"]["keep_outputs"] = args.keep_outputs
         if hasattr(args, 'verbose_cmd'):
             self.config["conversion"]["verbose_cmd"] = args.verbose_cmd
+        if hasattr(args, 'incremental') and args.incremental:
+            self.config["conversion"]["incremental"] = True
+        if hasattr(args, 'manifest_hash') and args.manifest_hash:
+            self.config["conversion"]["incremental"] = True
+            self.config["conversion"]["manifest_hash"] = True
         
         # 更新性能设置
         if hasattr(args, 'workers') and args.workers:
             self.config["performance"]["workers"] = args.workers
-        if hasattr(args, 'timeout'):
+        if hasattr(args, 'timeout') and args.timeout is not None:
             self.config["performance"]["timeout"] = args.timeout
+        if hasattr(args, 'fixed_timeout') and args.fixed_timeout:
+            self.config["performance"]["adaptive_timeout"] = False
+        if hasattr(args, 'python_workers') and args.python_workers is not None:
+            self.config["performance"]["python_workers"] = args.python_workers
+        if hasattr(args, 'split_threshold') and args.split_threshold is not None:
+            self.config["performance"]["split_pages_threshold"] = args.split_threshold
+        if hasattr(args, 'split_chunk') and args.split_chunk:
+            self.config["performance"]["split_chunk_pages"] = args.split_chunk
+        if hasattr(args, 'marker_batch_size') and args.marker_batch_size:
+            self.config["performance"]["marker_batch_size"] = args.marker_batch_size
+        if hasattr(args, 'schedule') and args.schedule:
+            self.config["performance"]["schedule"] = args.schedule
+        if hasattr(args, 'run_log') and args.run_log:
+            self.config["performance"]["run_log"] = args.run_log
+        if hasattr(args, 'scratch_dir') and args.scratch_dir:
+            self.config["performance"]["scratch_dir"] = args.scratch_dir
+        if hasattr(args, 'memory_budget') and args.memory_budget is not None:
+            self.config["performance"]["memory_budget_mb"] = args.memory_budget
+        if hasattr(args, 'no_classify') and args.no_classify:
+            self.config["conversion"]["classify_pdfs"] = False
+        if hasattr(args, 'no_reuse') and args.no_reuse:
+            self.config["conversion"]["reuse_outputs"] = False
+        if hasattr(args, 'no_fallback') and args.no_fallback:
+            self.config["fallback"]["enabled"] = False
+        if hasattr(args, 'priority_order') and args.priority_order:
+            self.config["fallback"]["cheap_first"] = False
+        if hasattr(args, 'no_probe_cache') and args.no_probe_cache:
+            self.config["performance"]["probe_cache"] = False
+        
+        # 更新缓存设置
+        if hasattr(args, 'cache_dir') and args.cache_dir:
+            self.config["cache"]["dir"] = args.cache_dir
+        if hasattr(args, 'cache_max_size') and args.cache_max_size is not None:
+            self.config["cache"]["max_size_mb"] = args.cache_max_size
+        
+        # 更新任务队列设置
+        if hasattr(args, 'queue') and args.queue:
+            self.config["queue"]["db"] = args.queue
+        if hasattr(args, 'lease') and args.lease is not None:
+            self.config["queue"]["lease_seconds"] = args.lease
+        
+        # 更新监视设置
+        if hasattr(args, 'settle') and args.settle is not None:
+            self.config["watch"]["settle_seconds"] = args.settle
+        if hasattr(args, 'watch_poll') and args.watch_poll:
+            self.config["watch"]["force_poll"] = True
+        
+        # 更新服务设置
+        if hasattr(args, 'serve') and args.serve:
+            self.config["serve"]["listen"] = args.serve
         
         # 更新文件处理选项
         if hasattr(args, 'delete_source'):
@@ -234,6 +372,70 @@ class ConfigManager:
         if batch_confirmation and batch_confirmation not in ["interactive", "yes_all", "no_all"]:
             errors.append(f"无效的批量确认模式: {batch_confirmation}")
         
+        # 验证备份设置
+        backup_link_mode = self.get("file_handling.backup_link_mode")
+        if backup_link_mode and backup_link_mode not in ["auto", "reflink", "copy", "hardlink"]:
+            errors.append(f"无效的备份落地方式: {backup_link_mode}")
+        if self.get("file_handling.backup_workers", 2) < 1:
+            errors.append("file_handling.backup_workers 必须至少为1")
+        if self.get("file_handling.backup_queue_size", 32) < 1:
+            errors.append("file_handling.backup_queue_size 必须至少为1")
+        
+        # 验证缓存落地方式
+        link_mode = self.get("cache.link_mode")
+        if link_mode and link_mode not in ["reflink", "copy", "hardlink"]:
+            errors.append(f"无效的缓存落地方式: {link_mode}")
+        
+        # 验证调度顺序
+        schedule = self.get("performance.schedule")
+        if schedule and schedule not in ["longest_first", "path"]:
+            errors.append(f"无效的调度顺序: {schedule}")
+        
+        # 验证转换链设置
+        ratio = self.get("fallback.max_garbage_ratio", 0.1)
+        if not isinstance(ratio, (int, float)) or not 0 <= ratio <= 1:
+            errors.append("fallback.max_garbage_ratio 必须在0到1之间")
+        
+        # 验证超时设置
+        if self.get("performance.timeout_factor", 4.0) <= 0:
+            errors.append("performance.timeout_factor 必须大于0")
+        
+        # 验证并发设置
+        workers = self.get("performance.workers", 0)
+        if workers != "auto" and (not isinstance(workers, int) or workers < 0):
+            errors.append("performance.workers 必须是非负整数或 auto")
+        
+        # 验证资源限制
+        limits_error = validate_engine_limits(self.get("performance.engine_limits"))
+        if limits_error:
+            errors.append(limits_error)
+        concurrency = self.get("performance.engine_concurrency") or {}
+        if not isinstance(concurrency, dict) or \
+                any(not isinstance(n, int) or n < 0 for n in concurrency.values()):
+            errors.append("performance.engine_concurrency 必须是 引擎名 -> 非负整数 的映射")
+        
+        # 验证任务队列设置
+        if self.get("queue.lease_seconds", 300) <= 0:
+            errors.append("queue.lease_seconds 必须大于0")
+        if self.get("queue.max_attempts", 3) < 1:
+            errors.append("queue.max_attempts 必须至少为1")
+        
+        # 验证监视设置
+        if self.get("watch.settle_seconds", 2.0) < 0:
+            errors.append("watch.settle_seconds 不能为负数")
+        if self.get("watch.poll_interval", 5.0) <= 0:
+            errors.append("watch.poll_interval 必须大于0")
+        
+        # 验证服务设置
+        if self.get("serve.max_upload_mb", 512) < 0:
+            errors.append("serve.max_upload_mb 不能为负数")
+        if self.get("serve.batch_window", 0.2) < 0:
+            errors.append("serve.batch_window 不能为负数")
+        
+        # 验证分段提取设置
+        if self.get("performance.split_chunk_pages", 100) <= 0:
+            errors.append("performance.split_chunk_pages 必须大于0")
+        
         # 验证日志级别
         log_level = self.get("logging.level")
         if log_level and log_level not in ["debug", "info", "warning", "error"]:
@@ -246,6 +448,7 @@ class ConfigManager:
         print("配置摘要:")
         print(f"  文件类型: {', '.join(self.get('file_types', []))}")
         print(f"  强制转换: {self.get('conversion.force', False)}")
+        print(f"  增量模式: {self.get('conversion.incremental', False)}")
         print(f"  删除源文件: {self.get('file_handling.delete_source', False)}")
         print(f"  删除模式: {self.get('file_handling.delete_mode', 'after_conversion')}")
         print(f"  交互式删除: {self.get('file_handling.ask_before_delete', True)}")
@@ -253,8 +456,23 @@ class ConfigManager:
         print(f"  备份功能: {self.get('file_handling.backup_enabled', False)}")
         print(f"  使用回收站: {self.get('file_handling.use_trash', True)}")
         print(f"  删除前验证: {self.get('file_handling.verify_before_delete', True)}")
-        print(f"  工作线程: {self.get('performance.workers', 0)}")
-        print(f"  超时时间: {self.get('performance.timeout', 0)}秒")
+        print(f"  并发任务: {self.get('performance.workers', 0)}")
+        print(f"  超时时间: {self.get('performance.timeout', 0)}秒"
+              f"{'（上限，按估算耗时自适应）' if self.get('performance.adaptive_timeout', True) else ''}")
+        print(f"  转换缓存: {self.get('cache.dir', '') or '未启用'}")
+
+
+def workers_arg(value: str):
+    """--workers 的取值：非负整数或 auto"""
+    if value == "auto":
+        return value
+    try:
+        workers = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的并发数: {value}（应为整数或 auto）")
+    if workers < 0:
+        raise argparse.ArgumentTypeError(f"无效的并发数: {value}")
+    return workers
 
 
 def create_arg_parser() -> argparse.ArgumentParser:
@@ -272,6 +490,20 @@ def create_arg_parser() -> argparse.ArgumentParser:
   %(prog)s --delete-source         # 转换成功后删除源文件
   %(prog)s --dry-run               # 只显示计划，不执行
   
+多机转换示例:
+  %(prog)s --queue /mnt/share/jobs.sqlite --enqueue   # 在根目录下扫描并入队（执行一次）
+  %(prog)s --queue /mnt/share/jobs.sqlite             # 在任意机器上启动 worker（可同时运行多个）
+  
+监视示例:
+  %(prog)s --watch                 # 转换现有文档后持续监视，新增或修改的文档写完后自动转换
+  %(prog)s --watch --watch-poll    # 网络共享目录上改用轮询
+  
+服务示例:
+  %(prog)s --serve                             # 在 127.0.0.1:8765 上提供转换服务
+  %(prog)s --serve unix:/run/doc_to_md.sock    # 在 Unix 套接字上提供服务
+  curl -d '{"path": "a/b.pdf"}' http://127.0.0.1:8765/convert
+  curl --data-binary @b.pdf 'http://127.0.0.1:8765/upload?name=b.pdf'
+  
 删除选项示例:
   %(prog)s --delete-source --delete-mode before_conversion  # 转换前删除
   %(prog)s --delete-source --yes                           # 自动确认所有删除
@@ -292,11 +524,78 @@ def create_arg_parser() -> argparse.ArgumentParser:
     parser.add_argument("--force", action="store_true", help="即使目标 .md 已存在也强制重跑")
     parser.add_argument("--include-hidden", action="store_true", help="包含隐藏目录/文件（以 . 开头）")
     parser.add_argument("--verbose-cmd", action="store_true", help="日志里输出完整命令")
-    parser.add_argument("--keep-outputs", action="store_true", help="保留 _marker_outputs/ 下的原始输出（便于调试）")
+    parser.add_argument("--keep-outputs", action="store_true", help="保留临时目录下各工具的原始输出（便于调试）")
+    parser.add_argument("--incremental", action="store_true",
+                       help="增量模式：按清单记录的源文件大小和修改时间，只重新转换变化或新增的文件")
+    parser.add_argument("--manifest-hash", action="store_true",
+                       help="增量模式下同时比较内容哈希（隐含 --incremental）")
     
     # 性能设置
-    parser.add_argument("--workers", type=int, help="并发线程数（0=自动检测，覆盖配置文件设置）")
-    parser.add_argument("--timeout", type=int, default=0, help="单个文件超时秒数（0=不设超时）")
+    parser.add_argument("--workers", type=workers_arg,
+                       help="同时运行的转换任务数（0=CPU核数，auto=按实测吞吐和CPU利用率在运行中自动调节）")
+    parser.add_argument("--timeout", type=int,
+                       help="单个文件超时秒数上限（0=不设上限）；自适应超时按估算耗时为每个文件计算超时")
+    parser.add_argument("--fixed-timeout", action="store_true",
+                       help="关闭自适应超时，所有文件使用 --timeout 的固定值")
+    parser.add_argument("--python-workers", type=int,
+                       help="Python后备引擎（pdfminer、内置 DOCX 引擎）的常驻进程数（0=与--workers相同）")
+    parser.add_argument("--split-threshold", type=int,
+                       help="页数达到该值的PDF按页码范围分段并行提取（0=不分段）")
+    parser.add_argument("--split-chunk", type=int,
+                       help="分段提取时每段的页数")
+    parser.add_argument("--marker-batch-size", type=int,
+                       help="每个 marker 进程批量转换的PDF数（模型只加载一次；1=不批处理，内存紧张时调小）")
+    parser.add_argument("--schedule", type=str, choices=["longest_first", "path"],
+                       help="调度顺序：longest_first（按估算代价从大到小，默认）或 path（按路径）")
+    parser.add_argument("--run-log", type=str,
+                       help="逐文件运行记录（JSON Lines）：引擎、输入大小、页数、各阶段耗时、子进程CPU时间和峰值RSS")
+    parser.add_argument("--scratch-dir", type=str,
+                       help="中间输出目录（默认 $XDG_RUNTIME_DIR 或 /dev/shm，根目录在网络存储上时避免往返）")
+    parser.add_argument("--memory-budget", type=int,
+                       help="转换任务的内存预算MB（0=可用内存的80%%，-1=不限制）；重型工具按预算自动降低并发")
+    parser.add_argument("--no-classify", action="store_true",
+                       help="不预先对PDF分类（有文本层/扫描件），所有PDF按同一转换链处理")
+    parser.add_argument("--no-reuse", action="store_true",
+                       help="不复用临时目录中上次保留或中断时留下的 marker 输出，总是重新运行 marker")
+    parser.add_argument("--no-fallback", action="store_true",
+                       help="只使用转换链中的第一个工具，失败时不尝试其他工具")
+    parser.add_argument("--priority-order", action="store_true",
+                       help="严格按 tool_priority 顺序尝试（默认廉价工具优先，marker 只在输出不合格时使用）")
+    parser.add_argument("--no-probe-cache", action="store_true",
+                       help="不使用磁盘上的转换工具探测缓存（强制重新探测）")
+    
+    # 缓存设置
+    cache_group = parser.add_argument_group("缓存选项")
+    cache_group.add_argument("--cache-dir", type=str,
+                            help="转换缓存目录（按内容哈希复用结果，可放在多台机器共享的挂载上）")
+    cache_group.add_argument("--cache-max-size", type=int,
+                            help="转换缓存大小上限（MB，0=不限制），超出时淘汰最久未使用的条目")
+    
+    # 多机任务队列
+    queue_group = parser.add_argument_group("任务队列选项")
+    queue_group.add_argument("--queue", type=str,
+                            help="共享文件系统上的任务库（SQLite）：不带 --enqueue 时作为 worker 领取并转换任务")
+    queue_group.add_argument("--enqueue", action="store_true",
+                            help="扫描当前目录，把文档加入 --queue 指定的任务库后退出")
+    queue_group.add_argument("--retry-failed", action="store_true",
+                            help="入队时把任务库中已失败的任务重新置为待领取")
+    queue_group.add_argument("--lease", type=int,
+                            help="任务租约秒数（默认300）；worker 崩溃后任务在租约过期时被其他 worker 接手")
+    
+    # 监视模式
+    watch_group = parser.add_argument_group("监视选项")
+    watch_group.add_argument("--watch", action="store_true",
+                            help="转换完现有文档后继续运行，只转换新增或修改的文档（Ctrl-C 退出）")
+    watch_group.add_argument("--settle", type=float,
+                            help="文件静默多少秒后才转换（默认2），避免转换仍在复制中的文件")
+    watch_group.add_argument("--watch-poll", action="store_true",
+                            help="不使用 inotify，按间隔轮询目录（用于 NFS/SMB 等网络文件系统）")
+    
+    # 常驻服务
+    serve_group = parser.add_argument_group("服务选项")
+    serve_group.add_argument("--serve", nargs="?", const="", default=None, metavar="ADDR",
+                            help="作为常驻转换服务运行（HTTP），ADDR 为 主机:端口 或 unix:套接字路径"
+                                 "（默认 serve.listen，即 127.0.0.1:8765）")
     
     # 文件处理选项 - 删除相关
     delete_group = parser.add_argument_group("删除选项")
@@ -335,6 +634,8 @@ def create_arg_parser() -> argparse.ArgumentParser:
     
     # 其他选项
     parser.add_argument("--dry-run", action="store_true", help="只打印计划，不执行")
+    parser.add_argument("--resume", action="store_true",
+                       help="按上次运行的日志断点续跑：跳过输出校验一致的已完成文档，重新转换中断的文档")
     parser.add_argument("--show-config", action="store_true", help="显示配置摘要后退出")
     parser.add_argument("--preview-delete", action="store_true", 
                        help="预览删除操作（显示将要删除的文件但不执行）")
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+内容寻址的转换结果缓存
+以（源文件内容哈希、工具名、工具版本、相关选项）为键保存转换得到的 Markdown，
+跨运行、跨目录复用：同一份 PDF 被复制到多个项目目录或被移动/改名后无需重新转换
+缓存目录可放在共享挂载上供多台机器共用，总大小超过上限时按最近使用时间淘汰
+"""
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台没有 reflink，退回复制
+    fcntl = None
+
+# 缓存条目格式版本，Markdown 后处理逻辑变化时递增以使旧条目失效
+CACHE_FORMAT = 1
+
+HASH_CHUNK = 1024 * 1024
+
+# ioctl(dest_fd, FICLONE, src_fd)：_IOW(0x94, 9, int)，Linux 4.5+
+FICLONE = 0x40049409
+
+# 命中时的落地方式
+LINK_MODES = ("reflink", "copy", "hardlink")
+
+
+def clone_file(src: Path, dest: Path) -> bool:
+    """
+    用 FICLONE 把 src 克隆为新文件 dest（共享数据块，之后任一方被修改都不影响另一方）
+
+    返回:
+        是否克隆成功；文件系统不支持或跨文件系统时返回 False，dest 不会留下
+    """
+    if fcntl is None:
+        return False
+    with open(src, 'rb') as s, open(dest, 'xb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            os.fsync(d.fileno())
+            return True
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL,
+                               errno.ENOSYS, errno.EPERM, errno.EBADF):
+                raise
+    dest.unlink()
+    return False
+
+
+def file_sha256(path: Path) -> str:
+    """流式计算文件内容的 SHA-256"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ConversionCache:
+    """
+    转换结果缓存
+
+    目录结构: <cache_dir>/objects/<key前两位>/<key>.md
+    写入先落到临时文件再 os.replace，多个进程/机器并发写同一个键也是安全的；
+    命中时更新条目的 mtime，淘汰时按 mtime 从旧到新删除
+    """
+
+    def __init__(self, cache_dir: Path, max_size_mb: int = 10240, link_mode: str = "reflink"):
+        """
+        参数:
+            cache_dir: 缓存目录
+            max_size_mb: 缓存总大小上限（MB），0 表示不限制
+            link_mode: 命中时的落地方式："reflink"（写时复制克隆，不支持时复制）、"copy"，
+                或 "hardlink"（失败时退回复制；落地的文件与缓存条目共享 inode，
+                原地编辑输出会同时改写缓存条目，只在输出不会被原地修改时使用）
+        """
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.objects_dir = self.cache_dir / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max(0, int(max_size_mb)) * 1024 * 1024
+        self.link_mode = link_mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+
+    def make_key(self, doc_path: Path, tool_name: str, tool_version: str,
+                 options: Optional[Dict[str, Any]] = None, content_hash: Optional[str] = None) -> str:
+        """计算缓存键（content_hash 为 None 时读取文件计算）"""
+        payload = json.dumps({
+            "format": CACHE_FORMAT,
+            "content": content_hash or file_sha256(doc_path),
+            "tool": tool_name,
+            "version": tool_version,
+            "options": options or {},
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _object_path(self, key: str) -> Path:
+        return self.objects_dir / key[:2] / f"{key}.md"
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """查找缓存条目，命中返回条目路径"""
+        path = self._object_path(key)
+        if path.is_file():
+            try:
+                os.utime(path)  # 记录最近使用时间，供 LRU 淘汰
+            except OSError:
+                pass
+            with self._lock:
+                self.hits += 1
+            return path
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def contains(self, key: str) -> bool:
+        """是否存在缓存条目（不计入命中统计）"""
+        return self._object_path(key).is_file()
+
+    def materialize(self, key: str, dest: Path) -> bool:
+        """把缓存条目落地到 dest（按 link_mode 克隆、硬链接或复制），未命中返回 False"""
+        src = self.lookup(key)
+        if src is None:
+            return False
+
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            linked = False
+            if self.link_mode == "hardlink":
+                try:
+                    os.link(src, tmp)
+                    linked = True
+                except OSError:
+                    pass
+            elif self.link_mode == "reflink":
+                linked = clone_file(src, tmp)
+            if not linked:
+                shutil.copyfile(src, tmp)
+            os.replace(tmp, dest)
+            return True
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            return False
+
+    def store(self, key: str, produced_file: Path) -> Optional[Path]:
+        """把转换结果写入缓存，返回条目路径（写入失败返回 None）"""
+        path = self._object_path(key)
+        if path.exists():
+            return path
+
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+            shutil.copyfile(produced_file, tmp)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"警告: 无法写入转换缓存 {path}: {e}")
+            return None
+
+        if self.max_bytes:
+            with self._lock:
+                if self._size is None:
+                    self._size = sum(size for _, size, _ in self._entries())
+                else:
+                    self._size += path.stat().st_size
+                over_budget = self._size > self.max_bytes
+            if over_budget:
+                self.evict()
+        return path
+
+    def _entries(self) -> List[Tuple[float, int, Path]]:
+        entries = []
+        for p in self.objects_dir.glob("*/*.md"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        return entries
+
+    def evict(self) -> int:
+        """淘汰最久未使用的条目，直到总大小降到上限的 90% 以下，返回删除的条目数"""
+        if not self.max_bytes:
+            return 0
+
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            target = int(self.max_bytes * 0.9)
+            removed = 0
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    path.unlink()
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            self._size = total
+            return removed
+
+    def summary(self) -> str:
+        return f"缓存命中 {self.hits}，未命中 {self.misses}（{self.cache_dir}）"
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+转换任务代价模型
+按文件类型、字节数、页数（PDF 从页树根节点快速读取，DOCX 从 docProps/app.xml 读取）
+以及以往运行记录的耗时估算每个任务的秒数，用于“最长任务优先”调度和进度行里的剩余时间估计
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    from .pdf_info import count_pdf_pages
+except ImportError:
+    from pdf_info import count_pdf_pages
+
+# 各引擎的初始系数：固定开销（秒）+ 每页秒数（页数未知时按每MB秒数）
+DEFAULT_RATES: Dict[str, Dict[str, float]] = {
+    "marker": {"base": 8.0, "per_page": 1.5, "per_mb": 3.0},
+    "pdftotext": {"base": 0.05, "per_page": 0.01, "per_mb": 0.05},
+    "python": {"base": 0.3, "per_page": 0.15, "per_mb": 0.8},
+    "pandoc": {"base": 0.3, "per_page": 0.02, "per_mb": 0.5},
+    "docx-converter": {"base": 0.2, "per_page": 0.01, "per_mb": 0.3},
+    "antiword": {"base": 0.05, "per_page": 0.005, "per_mb": 0.1},
+    "catdoc": {"base": 0.05, "per_page": 0.005, "per_mb": 0.1},
+}
+FALLBACK_RATE = {"base": 0.5, "per_page": 0.1, "per_mb": 1.0}
+
+# 新观测值在滑动平均中的权重
+EWMA_ALPHA = 0.2
+
+# 每个引擎保留的最近“实际耗时/估算耗时”比值个数，用于校准超时
+RATIO_HISTORY = 50
+
+# 校准超时所需的最少样本数；不足时按比值1计算
+MIN_RATIO_SAMPLES = 5
+
+
+@dataclass(frozen=True)
+class JobEstimate:
+    """单个文档的代价估算"""
+    doc_path: Path
+    engine: str
+    size_bytes: int
+    pages: Optional[int]
+    seconds: float
+
+
+def count_docx_pages(docx_path: Path) -> Optional[int]:
+    """从 docProps/app.xml 读取 Word 记录的页数（只读 zip 目录和一个小文件）"""
+    try:
+        with zipfile.ZipFile(docx_path) as zf:
+            data = zf.read("docProps/app.xml")
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return None
+    m = re.search(rb"<(?:\w+:)?Pages>(\d+)</", data)
+    return int(m.group(1)) if m else None
+
+
+def count_pages(doc_path: Path) -> Optional[int]:
+    suffix = doc_path.suffix.lower()
+    if suffix == ".pdf":
+        return count_pdf_pages(doc_path, deep=False)
+    if suffix == ".docx":
+        return count_docx_pages(doc_path)
+    return None
+
+
+def default_history_path() -> Path:
+    """耗时记录的默认位置：$XDG_CACHE_HOME/doc_to_md/timings.json"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(cache_home) / "doc_to_md" / "timings.json"
+
+
+class CostModel:
+    """
+    代价模型
+
+    每个引擎维护 base / per_page / per_mb 三个系数；每完成一个任务，
+    用实际耗时对相应的单位耗时做指数滑动平均，结果保存到耗时记录文件供下次运行使用
+    """
+
+    def __init__(self, history_path: Optional[Path] = None):
+        self.history_path = Path(history_path) if history_path else default_history_path()
+        self.rates: Dict[str, Dict[str, float]] = {k: dict(v) for k, v in DEFAULT_RATES.items()}
+        self.samples: Dict[str, int] = {}
+        self.ratios: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.history_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for engine, entry in data.get("engines", {}).items():
+            rate = self.rates.setdefault(engine, dict(FALLBACK_RATE))
+            for key in ("base", "per_page", "per_mb"):
+                if isinstance(entry.get(key), (int, float)):
+                    rate[key] = float(entry[key])
+            self.samples[engine] = int(entry.get("samples", 0))
+            ratios = entry.get("ratios", [])
+            if isinstance(ratios, list):
+                self.ratios[engine] = [float(r) for r in ratios if isinstance(r, (int, float))][-RATIO_HISTORY:]
+
+    def save(self) -> None:
+        """保存系数（原子替换）"""
+        data = {"updated": time.time(), "engines": {
+            engine: {**rate, "samples": self.samples.get(engine, 0), "ratios": self.ratios.get(engine, [])}
+            for engine, rate in self.rates.items()
+        }}
+        try:
+            self.history_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.history_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp, self.history_path)
+        except OSError as e:
+            print(f"警告: 无法保存耗时记录 {self.history_path}: {e}")
+
+    def rate(self, engine: str) -> Dict[str, float]:
+        with self._lock:
+            return dict(self.rates.get(engine, FALLBACK_RATE))
+
+    def estimate(self, doc_path: Path, engine: str, size_bytes: Optional[int] = None,
+                 pages: Optional[int] = None) -> JobEstimate:
+        """估算一个文档的转换秒数（未给出的字节数/页数会从文件读取）"""
+        if size_bytes is None:
+            try:
+                size_bytes = doc_path.stat().st_size
+            except OSError:
+                size_bytes = 0
+        if pages is None:
+            pages = count_pages(doc_path)
+        r = self.rate(engine)
+        if pages:
+            seconds = r["base"] + r["per_page"] * pages
+        else:
+            seconds = r["base"] + r["per_mb"] * size_bytes / (1024 * 1024)
+        return JobEstimate(doc_path, engine, size_bytes, pages, seconds)
+
+    def observe(self, estimate: JobEstimate, seconds: float) -> None:
+        """
+        用一次实际耗时更新该引擎的系数
+
+        base 与每页/每MB耗时一起按归一化的最小均方步长修正（估算误差按 1 : 页数 的比例分给两者）：
+        小文档的误差主要修正 base，大文档的主要修正单位耗时，页数不同的文档积累下来逼近实际的固定开销。
+        base 只按估算实际使用的那一项（有页数时按页，否则按MB）修正；没有页数和大小时全部计入 base
+        """
+        with self._lock:
+            if estimate.seconds > 0:
+                ratios = self.ratios.setdefault(estimate.engine, [])
+                ratios.append(round(seconds / estimate.seconds, 3))
+                del ratios[:-RATIO_HISTORY]
+            rate = self.rates.setdefault(estimate.engine, dict(FALLBACK_RATE))
+            base = rate["base"]
+            mb = estimate.size_bytes / (1024 * 1024) if estimate.size_bytes else 0.0
+            terms = [(key, units) for key, units in (("per_page", estimate.pages or 0), ("per_mb", mb))
+                     if units and (key == "per_page" or units >= 0.01)]
+            if not terms:
+                rate["base"] += EWMA_ALPHA * (seconds - base)
+            for i, (key, units) in enumerate(terms):
+                error = seconds - (base + rate[key] * units)
+                step = EWMA_ALPHA * error / (1 + units * units)
+                rate[key] = max(0.0, rate[key] + step * units)
+                if i == 0:
+                    rate["base"] = max(0.0, base + step)
+            self.samples[estimate.engine] = self.samples.get(estimate.engine, 0) + 1
+
+    def spread(self, engine: str, quantile: float = 0.95) -> float:
+        """该引擎“实际耗时/估算耗时”比值的高分位数（至少为1），反映估算的偏差范围"""
+        with self._lock:
+            ratios = sorted(self.ratios.get(engine, []))
+        if len(ratios) < MIN_RATIO_SAMPLES:
+            return 1.0
+        return max(1.0, ratios[min(len(ratios) - 1, int(quantile * len(ratios)))])
+
+    def timeout_for(self, estimate: JobEstimate, factor: float = 4.0, minimum: float = 30.0,
+                    maximum: float = 0.0) -> float:
+        """
+        按估算耗时计算单个任务的超时秒数
+
+        参数:
+            factor: 安全系数，乘在 估算耗时 × 该引擎历史偏差分位数 上
+            minimum: 超时下限（秒），覆盖进程启动等固定开销的波动
+            maximum: 超时上限（秒），0表示不设上限
+
+        返回:
+            超时秒数
+        """
+        seconds = max(minimum, estimate.seconds * self.spread(estimate.engine) * factor)
+        return min(seconds, maximum) if maximum > 0 else seconds
+
+
+class ProgressEstimator:
+    """
+    按估算代价计算剩余时间：已完成任务的实际墙钟时间 / 已完成的估算代价 × 剩余估算代价，
+    并发度和模型整体偏差都自然包含在比例里
+    """
+
+    def __init__(self, total_seconds: float):
+        self.remaining = total_seconds
+        self.done = 0.0
+        self.start = time.perf_counter()
+
+    def add(self, seconds: float) -> None:
+        """运行中加入了新任务（从任务队列陆续领取时）"""
+        self.remaining += seconds
+
+    def finish(self, estimate: Optional[JobEstimate], skipped: bool = False) -> None:
+        cost = estimate.seconds if estimate else 0.0
+        self.remaining = max(0.0, self.remaining - cost)
+        if not skipped:
+            self.done += cost
+
+    def eta_seconds(self) -> Optional[float]:
+        if self.done <= 0:
+            return None
+        elapsed = time.perf_counter() - self.start
+        return elapsed / self.done * self.remaining
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "ETA --:--"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"ETA {seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    return f"ETA {seconds // 60:02d}:{seconds % 60:02d}"
@@ -9,11 +9,16 @@
 import os
 import sys
 import shutil
-import time
+import threading
 from pathlib import Path
 from typing import Dict, Any, List, Optional, Tuple
 import subprocess
 
+try:
+    from .backup_store import BackupQueue, BackupStore, DEFAULT_BACKUP_QUEUE, DEFAULT_BACKUP_WORKERS
+except ImportError:
+    from backup_store import BackupQueue, BackupStore, DEFAULT_BACKUP_QUEUE, DEFAULT_BACKUP_WORKERS
+
 
 class DeleteManager:
     """删除管理器，负责安全地删除源文件"""
@@ -28,6 +33,7 @@ class DeleteManager:
         self.config = config
         self.deleted_files: List[Path] = []
         self.failed_deletes: List[Tuple[Path, str]] = []
+        self._lock = threading.Lock()
         
         # 辅助函数：从嵌套字典获取值
         def get_nested(config_dict: Dict[str, Any], key_path: str, default: Any = None) -> Any:
@@ -53,6 +59,9 @@ class DeleteManager:
         self.backup_dir = Path(backup_dir_str)
         self.use_trash = get_nested(config, "file_handling.use_trash", True)
         self.verify_before_delete = get_nested(config, "file_handling.verify_before_delete", True)
+        self.backup_link_mode = get_nested(config, "file_handling.backup_link_mode", "auto")
+        self.backup_workers = get_nested(config, "file_handling.backup_workers", DEFAULT_BACKUP_WORKERS)
+        self.backup_queue_size = get_nested(config, "file_handling.backup_queue_size", DEFAULT_BACKUP_QUEUE)
         
         # 调试日志：显示配置（已禁用）
         # print(f"[DEBUG] DeleteManager配置:")
@@ -62,9 +71,11 @@ class DeleteManager:
         # print(f"[DEBUG]   batch_confirmation: {self.batch_confirmation}")
         # print(f"[DEBUG]   verify_before_delete: {self.verify_before_delete}")
         
-        # 确保备份目录存在
+        # 内容寻址的备份库（创建备份目录）；转换后删除模式下备份和删除在后台队列中进行
+        self.backup_store: Optional[BackupStore] = None
+        self._backup_queue: Optional[BackupQueue] = None
         if self.backup_enabled:
-            self.backup_dir.mkdir(parents=True, exist_ok=True)
+            self.backup_store = BackupStore(self.backup_dir, self.backup_link_mode)
     
     def should_delete(self, doc_path: Path, md_path: Path, dry_run: bool = False) -> Tuple[bool, str]:
         """
@@ -162,25 +173,19 @@ class DeleteManager:
     
     def backup_file(self, doc_path: Path) -> Optional[Path]:
         """
-        备份文件到备份目录
+        备份文件到备份库（按内容寻址，相同内容只保存一份；优先 reflink，不支持或跨文件系统时复制）
         
         参数:
             doc_path: 要备份的文件路径
             
         返回:
-            Optional[Path]: 备份文件路径，如果备份失败则返回None
+            Optional[Path]: 备份对象路径，如果备份失败则返回None
         """
-        if not self.backup_enabled:
+        if self.backup_store is None:
             return None
         
         try:
-            # 创建唯一的备份文件名
-            timestamp = int(time.time())
-            backup_name = f"{doc_path.stem}_{timestamp}{doc_path.suffix}"
-            backup_path = self.backup_dir / backup_name
-            
-            # 复制文件
-            shutil.copy2(doc_path, backup_path)
+            backup_path, _ = self.backup_store.store(doc_path)
             return backup_path
         except Exception as e:
             print(f"备份失败 {doc_path}: {e}")
@@ -253,22 +258,35 @@ class DeleteManager:
         if dry_run:
             return True, "DRY-RUN: 将删除源文件"
         
+        # 转换后删除：备份（读取或复制整个源文件）和删除交给后台队列，转换不等待；
+        # 转换前删除必须在转换开始之前完成，仍然同步执行
+        if self.backup_store is not None and self.delete_mode == "after_conversion":
+            if self._backup_queue is None:
+                self._backup_queue = BackupQueue(self.backup_workers, self.backup_queue_size)
+            self._backup_queue.submit(self._backup_and_delete, doc_path)
+            return True, "已加入备份队列（备份完成后删除）"
+        return self._backup_and_delete(doc_path)
+    
+    def _backup_and_delete(self, doc_path: Path) -> Tuple[bool, str]:
+        """备份（如果启用）后删除文件；备份失败时保留源文件"""
         try:
             # 1. 备份文件（如果启用）
             backup_path = None
             if self.backup_enabled:
                 backup_path = self.backup_file(doc_path)
-                if backup_path:
-                    print(f"已备份到: {backup_path}")
+                if backup_path is None:
+                    return self._failed(doc_path, "备份失败，未删除源文件")
             
             # 2. 尝试移动到回收站（如果启用）
             if self.use_trash and self.move_to_trash(doc_path):
-                self.deleted_files.append(doc_path)
+                with self._lock:
+                    self.deleted_files.append(doc_path)
                 return True, "已移动到回收站"
             
             # 3. 直接删除
             doc_path.unlink()
-            self.deleted_files.append(doc_path)
+            with self._lock:
+                self.deleted_files.append(doc_path)
             
             message = "已删除源文件"
             if backup_path:
@@ -277,9 +295,22 @@ class DeleteManager:
             return True, message
             
         except Exception as e:
-            error_msg = f"删除失败: {e}"
+            return self._failed(doc_path, f"删除失败: {e}")
+    
+    def _failed(self, doc_path: Path, error_msg: str) -> Tuple[bool, str]:
+        with self._lock:
             self.failed_deletes.append((doc_path, error_msg))
-            return False, error_msg
+        return False, error_msg
+    
+    def close(self) -> None:
+        """等待后台队列中的备份和删除全部完成（在打印摘要之前调用）"""
+        if self._backup_queue is None:
+            return
+        pending = self._backup_queue.pending
+        if pending:
+            print(f"等待 {pending} 个源文件备份完成...")
+        self._backup_queue.close()
+        self._backup_queue = None
     
     def delete_source_file(self, doc_path: Path, md_path: Path, 
                           dry_run: bool = False, user_confirmed: bool = False) -> Tuple[bool, str]:
@@ -330,6 +361,8 @@ class DeleteManager:
         print("=" * 60)
         print(f"成功删除: {summary['total_deleted']} 个文件")
         print(f"删除失败: {summary['total_failed']} 个文件")
+        if self.backup_store is not None:
+            print(f"备份: {self.backup_store.summary()}")
         
         if summary['failed_deletes']:
             print("\n删除失败的文件:")
@@ -7,16 +7,271 @@ Word文档转换器模块
 """
 
 import os
+import re
 import sys
+import zipfile
+import xml.etree.ElementTree as ET
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, TextIO, Tuple
 import subprocess
 import shutil
 
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_P, _R, _T, _TBL, _TR, _TC = (W_NS + tag for tag in ("p", "r", "t", "tbl", "tr", "tc"))
+
+# 不属于正文的元素（删除的修订、域代码）
+_SKIP_TEXT = {W_NS + "delText", W_NS + "instrText"}
+
+
+def _val(elem: Optional[ET.Element]) -> Optional[str]:
+    return None if elem is None else elem.get(W_NS + "val")
+
+
+def _flag(rpr: Optional[ET.Element], tag: str) -> bool:
+    """粗体/斜体等开关属性：存在且 w:val 不是 0/false"""
+    if rpr is None:
+        return False
+    elem = rpr.find(W_NS + tag)
+    return elem is not None and _val(elem) not in ("0", "false", "none")
+
+
+def _load_heading_styles(zf: zipfile.ZipFile) -> Dict[str, int]:
+    """从 styles.xml 读取标题样式：样式ID -> 标题级别"""
+    headings: Dict[str, int] = {}
+    try:
+        root = ET.fromstring(zf.read("word/styles.xml"))
+    except (KeyError, ET.ParseError):
+        return headings
+    for style in root.iter(W_NS + "style"):
+        style_id = style.get(W_NS + "styleId")
+        name = (_val(style.find(W_NS + "name")) or "").lower()
+        outline = _val(style.find(f"{W_NS}pPr/{W_NS}outlineLvl"))
+        m = re.fullmatch(r"heading (\d)", name)
+        if m:
+            headings[style_id] = int(m.group(1))
+        elif name == "title":
+            headings[style_id] = 1
+        elif outline is not None and outline.isdigit() and int(outline) < 9:
+            headings[style_id] = int(outline) + 1
+    return headings
+
+
+def _load_numbering(zf: zipfile.ZipFile) -> Dict[Tuple[str, str], str]:
+    """从 numbering.xml 读取列表格式：(numId, ilvl) -> numFmt（bullet、decimal 等）"""
+    formats: Dict[Tuple[str, str], str] = {}
+    try:
+        root = ET.fromstring(zf.read("word/numbering.xml"))
+    except (KeyError, ET.ParseError):
+        return formats
+    abstract: Dict[str, Dict[str, str]] = {}
+    for absnum in root.iter(W_NS + "abstractNum"):
+        levels = abstract.setdefault(absnum.get(W_NS + "abstractNumId"), {})
+        for lvl in absnum.iter(W_NS + "lvl"):
+            levels[lvl.get(W_NS + "ilvl")] = _val(lvl.find(W_NS + "numFmt")) or "bullet"
+    for num in root.iter(W_NS + "num"):
+        levels = abstract.get(_val(num.find(W_NS + "abstractNumId")), {})
+        for ilvl, fmt in levels.items():
+            formats[(num.get(W_NS + "numId"), ilvl)] = fmt
+    return formats
+
+
+def _runs_markdown(p: ET.Element) -> str:
+    """段落中各文本段按正文顺序拼接，相邻同格式的文本段合并后再加粗体/斜体标记"""
+    segments: List[List] = []
+    for run in p.iter(_R):
+        rpr = run.find(W_NS + "rPr")
+        bold, italic = _flag(rpr, "b"), _flag(rpr, "i")
+        parts = []
+        for child in run:
+            if child.tag == _T:
+                parts.append(child.text or "")
+            elif child.tag == W_NS + "tab":
+                parts.append("\t")
+            elif child.tag in (W_NS + "br", W_NS + "cr"):
+                parts.append("\n")
+            elif child.tag == W_NS + "noBreakHyphen":
+                parts.append("-")
+        text = "".join(parts)
+        if not text:
+            continue
+        if segments and segments[-1][1] == bold and segments[-1][2] == italic:
+            segments[-1][0] += text
+        else:
+            segments.append([text, bold, italic])
+
+    out = []
+    for text, bold, italic in segments:
+        mark = ("**" if bold else "") + ("*" if italic else "")
+        stripped = text.strip()
+        if mark and stripped:
+            # 标记紧贴文字，前后空白留在标记外
+            lead = text[:len(text) - len(text.lstrip())]
+            trail = text[len(text.rstrip()):]
+            text = f"{lead}{mark}{stripped}{mark[::-1]}{trail}"
+        out.append(text)
+    return "".join(out).strip()
+
+
+def _paragraph_markdown(p: ET.Element, headings: Dict[str, int],
+                        numbering: Dict[Tuple[str, str], str]) -> Tuple[str, bool]:
+    """返回 (Markdown 文本, 是否为列表项)"""
+    text = _runs_markdown(p)
+    if not text:
+        return "", False
+    ppr = p.find(W_NS + "pPr")
+    if ppr is None:
+        return text, False
+
+    style = _val(ppr.find(W_NS + "pStyle"))
+    level = headings.get(style) if style else None
+    if level is None and style:
+        m = re.fullmatch(r"(?i)heading(\d)", style)
+        level = int(m.group(1)) if m else None
+    outline = _val(ppr.find(W_NS + "outlineLvl"))
+    if level is None and outline is not None and outline.isdigit() and int(outline) < 9:
+        level = int(outline) + 1
+    if level:
+        return f"{'#' * min(level, 6)} {' '.join(text.split())}", False
+
+    numpr = ppr.find(W_NS + "numPr")
+    if numpr is not None:
+        num_id = _val(numpr.find(W_NS + "numId"))
+        ilvl = _val(numpr.find(W_NS + "ilvl")) or "0"
+        if num_id and num_id != "0":
+            fmt = numbering.get((num_id, ilvl), "bullet")
+            marker = "-" if fmt in ("bullet", "none") else "1."
+            indent = "  " * int(ilvl) if ilvl.isdigit() else ""
+            return f"{indent}{marker} {text}", True
+    return text, False
+
+
+def write_docx_markdown(docx_path: Path, out: TextIO) -> int:
+    """
+    流式转换DOCX：用 iterparse 逐个读取 word/document.xml 中的段落和表格行，
+    按正文顺序写出标题、列表、表格和段落，处理完的元素立即从树中移除
+
+    参数:
+        docx_path: DOCX 文件
+        out: 写入 Markdown 的文本流
+
+    返回:
+        写出的段落和表格数
+    """
+    blocks = 0
+    with zipfile.ZipFile(docx_path) as zf:
+        headings = _load_heading_styles(zf)
+        numbering = _load_numbering(zf)
+
+        stack: List[ET.Element] = []
+        in_list = False
+        table_depth = 0
+        cell_parts: List[str] = []
+        row_cells: List[str] = []
+        columns = 0
+
+        with zf.open("word/document.xml") as xml_file:
+            for event, elem in ET.iterparse(xml_file, events=("start", "end")):
+                if event == "start":
+                    stack.append(elem)
+                    if elem.tag == _TBL:
+                        table_depth += 1
+                    continue
+
+                stack.pop()
+                parent = stack[-1] if stack else None
+                tag = elem.tag
+
+                if tag == _P:
+                    if table_depth:
+                        # 单元格内的段落（含嵌套表格）合并到最外层单元格
+                        text = " ".join(_runs_markdown(elem).split())
+                        if text:
+                            cell_parts.append(text.replace("|", "\\|"))
+                        elem.clear()
+                    else:
+                        text, is_list = _paragraph_markdown(elem, headings, numbering)
+                        if text:
+                            # 连续的列表项之间不空行，列表结束后补一个空行
+                            if in_list and not is_list:
+                                out.write("\n")
+                            out.write(text + ("\n" if is_list else "\n\n"))
+                            in_list = is_list
+                            blocks += 1
+                        elem.clear()
+                        if parent is not None:
+                            parent.remove(elem)
+
+                elif tag == _TC and table_depth == 1:
+                    row_cells.append("<br>".join(cell_parts))
+                    cell_parts = []
+                    # 横向合并的单元格补齐空列，保持列数一致
+                    span = _val(elem.find(f"{W_NS}tcPr/{W_NS}gridSpan"))
+                    if span and span.isdigit():
+                        row_cells.extend([""] * (int(span) - 1))
+
+                elif tag == _TR and table_depth == 1:
+                    if not columns:
+                        if in_list:
+                            out.write("\n")
+                            in_list = False
+                        columns = len(row_cells)
+                        out.write("| " + " | ".join(row_cells) + " |\n")
+                        out.write("|" + "---|" * columns + "\n")
+                    else:
+                        row_cells += [""] * (columns - len(row_cells))
+                        out.write("| " + " | ".join(row_cells) + " |\n")
+                    row_cells = []
+                    elem.clear()
+                    if parent is not None:
+                        parent.remove(elem)
+
+                elif tag == _TBL:
+                    table_depth -= 1
+                    if table_depth == 0:
+                        if columns:
+                            out.write("\n")
+                            blocks += 1
+                        columns = 0
+                        elem.clear()
+                        if parent is not None:
+                            parent.remove(elem)
+
+                elif tag in _SKIP_TEXT:
+                    elem.clear()
+        if in_list:
+            out.write("\n")
+    return blocks
+
+
+def convert_docx_builtin(docx_path: Path, out_dir: Path) -> Tuple[bool, str, Optional[Path]]:
+    """
+    用内置流式引擎将DOCX转换为Markdown（不调用任何外部工具）
+
+    按正文顺序输出，内存占用与文档大小无关；转换链中的 docx-converter 引擎直接使用这里，
+    pandoc 失败后回退到它时不会再次运行 pandoc
+
+    返回:
+        (success, message, output_file)
+    """
+    docx_path = Path(docx_path)
+    out_dir = Path(out_dir)
+    if docx_path.suffix.lower() != '.docx':
+        return False, f"内置引擎只支持 .docx: {docx_path.name}", None
+    out_dir.mkdir(parents=True, exist_ok=True)
+    output_file = out_dir / f"{docx_path.stem}.md"
+    try:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(f"# {docx_path.stem}\n\n")
+            blocks = write_docx_markdown(docx_path, f)
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        output_file.unlink(missing_ok=True)
+        return False, f"无法解析DOCX: {e}", None
+    return True, f"使用内置流式引擎转换成功（{blocks} 个段落/表格）", output_file
+
 
 def convert_docx_to_markdown(docx_path: Path, out_dir: Path) -> Tuple[bool, str, Optional[Path]]:
     """
-    将Word文档转换为Markdown
+    将Word文档转换为Markdown（独立运行时使用：pandoc 优先，其次内置引擎、antiword）
     
     参数:
         docx_path: Word文档路径
@@ -62,47 +317,9 @@ def convert_docx_to_markdown(docx_path: Path, out_dir: Path) -> Tuple[bool, str,
             except Exception as e:
                 return False, f"pandoc执行异常: {e}", None
         
-        # 方法2: 尝试使用python-docx
-        try:
-            import docx
-            
-            doc = docx.Document(str(docx_path_obj))
-            output_file = out_dir_obj / f"{docx_path_obj.stem}.md"
-            
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(f"# {docx_path_obj.stem}\n\n")
-                
-                for para in doc.paragraphs:
-                    text = para.text.strip()
-                    if text:
-                        # 简单的格式检测
-                        if para.style.name.startswith('Heading'):
-                            level = 1
-                            if para.style.name == 'Heading 2':
-                                level = 2
-                            elif para.style.name == 'Heading 3':
-                                level = 3
-                            f.write(f"{'#' * level} {text}\n\n")
-                        else:
-                            f.write(f"{text}\n\n")
-                
-                # 处理表格
-                for table in doc.tables:
-                    f.write("\n|")
-                    # 简单的表格处理
-                    for row in table.rows:
-                        row_text = "|".join([cell.text.strip() for cell in row.cells])
-                        f.write(f"{row_text}|\n")
-                    f.write("\n")
-            
-            return True, "使用python-docx转换成功", output_file
-            
-        except ImportError:
-            # python-docx不可用
-            pass
-        except Exception as e:
-            # python-docx处理出错
-            pass
+        # 方法2: 内置流式引擎（DOCX），按正文顺序输出，内存占用与文档大小无关
+        if docx_path_obj.suffix.lower() == '.docx':
+            return convert_docx_builtin(docx_path_obj, out_dir_obj)
         
         # 方法3: 尝试使用antiword（针对.doc文件）
         if docx_path_obj.suffix.lower() == '.doc' and shutil.which("antiword") is not None:
@@ -141,46 +358,7 @@ def convert_docx_to_markdown(docx_path: Path, out_dir: Path) -> Tuple[bool, str,
             except Exception as e:
                 return False, f"antiword执行异常: {e}", None
         
-        # 方法4: 最后尝试使用文本提取
-        try:
-            # 尝试使用catdoc或其他文本提取工具
-            output_file = out_dir_obj / f"{docx_path_obj.stem}.md"
-            
-            # 简单的文本提取（作为最后手段）
-            import zipfile
-            if docx_path_obj.suffix.lower() == '.docx':
-                # DOCX文件实际上是ZIP文件
-                with zipfile.ZipFile(docx_path_obj, 'r') as zip_ref:
-                    # 查找文档内容
-                    if 'word/document.xml' in zip_ref.namelist():
-                        import xml.etree.ElementTree as ET
-                        from xml.etree.ElementTree import QName
-                        
-                        with zip_ref.open('word/document.xml') as xml_file:
-                            tree = ET.parse(xml_file)
-                            root = tree.getroot()
-                            
-                            # 简单的文本提取
-                            namespaces = {
-                                'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
-                            }
-                            
-                            texts = []
-                            for elem in root.iter():
-                                if elem.tag.endswith('}t'):  # 文本元素
-                                    if elem.text:
-                                        texts.append(elem.text)
-                            
-                            with open(output_file, 'w', encoding='utf-8') as f:
-                                f.write(f"# {docx_path_obj.stem}\n\n")
-                                f.write("\n".join(texts))
-                            
-                            return True, "使用简单文本提取转换成功", output_file
-            
-            return False, "没有可用的Word文档转换工具", None
-            
-        except Exception as e:
-            return False, f"文本提取失败: {e}", None
+        return False, "没有可用的Word文档转换工具", None
             
     except Exception as e:
         return False, f"转换过程异常: {e}", None
@@ -197,13 +375,6 @@ def ensure_word_converter_exists() -> bool:
     if shutil.which("pandoc") is not None:
         return True
     
-    # 检查python-docx
-    try:
-        import docx
-        return True
-    except ImportError:
-        pass
-    
     # 检查antiword
     if shutil.which("antiword") is not None:
         return True
@@ -227,14 +398,13 @@ def get_word_converter_help() -> str:
    - Ubuntu/Debian: sudo apt-get install pandoc
    - Windows: 从 https://pandoc.org/installing.html 下载
 
-2. python-docx（Python库）:
-   pip install python-docx
+（.docx 始终可以用内置流式引擎转换，以下工具用于 .doc 或更高质量的输出）
 
-3. antiword（针对.doc文件）:
+2. antiword（针对.doc文件）:
    - macOS: brew install antiword
    - Ubuntu/Debian: sudo apt-get install antiword
 
-4. catdoc（文本提取）:
+3. catdoc（文本提取）:
    - macOS: brew install catdoc
    - Ubuntu/Debian: sudo apt-get install catdoc
 """
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+多机共享的任务队列
+一台机器扫描目录后把文档写入共享文件系统上的 SQLite 任务库（--queue 库 --enqueue），
+任意多台机器上的 worker（--queue 库）以租约方式原子地领取任务，后台线程定期续租；
+worker 崩溃或失联后租约过期，任务重新回到待领取状态，由其他 worker 接手。
+
+网络文件系统上 SQLite 不能使用 WAL（依赖共享内存），任务库使用回滚日志；
+所有写事务另外在同目录的 .lock 文件上加 fcntl 记录锁，NFS 上由锁管理器在主机之间串行化
+"""
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台只依赖 SQLite 自身的锁
+    fcntl = None
+
+# 默认租约时长（秒）：worker 在这段时间内没有续租，任务被视为无人处理
+DEFAULT_LEASE = 300
+
+# 一个任务最多被领取的次数（超过后记为失败，避免一个让 worker 崩溃的文档反复被领取）
+DEFAULT_MAX_ATTEMPTS = 3
+
+# 每个写事务插入的任务数（入队上百万个文档时分批提交，避免长时间持有写锁）
+ENQUEUE_CHUNK = 5000
+
+# 积累多少条完成记录后由续租线程提前写入任务库
+COMPLETE_EVERY = 64
+
+# 没有可领取的任务、但其他 worker 仍持有租约时，重新检查的间隔（秒）
+QUEUE_POLL = 5.0
+
+# 等待锁的时间（秒）
+BUSY_TIMEOUT = 120
+
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+
+
+def worker_id() -> str:
+    """本进程的 worker 标识：主机名:进程号:随机后缀"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class JobQueue:
+    """
+    SQLite 任务队列
+
+    任务状态：pending（待领取）→ leased（已租出）→ done / failed；
+    租约过期的 leased 任务在下一次领取时回到 pending（领取次数达到上限时记为 failed）。
+    完成记录先在内存中积累，与续租一起批量写入，worker 数很多时任务库的写事务也不多
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        lease_seconds: float = DEFAULT_LEASE,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        owner: Optional[str] = None,
+    ):
+        """
+        参数:
+            db_path: 任务库路径（放在所有 worker 都能访问的共享文件系统上）
+            lease_seconds: 租约时长，续租间隔为其三分之一
+            max_attempts: 一个任务最多被领取的次数
+            owner: worker 标识，None 表示自动生成
+        """
+        self.db_path = Path(db_path)
+        self.lease_seconds = max(1.0, float(lease_seconds))
+        self.max_attempts = max(1, int(max_attempts))
+        self.owner = owner or worker_id()
+        self._lock = threading.Lock()  # 任务库连接（写事务期间一直持有，可能等待其他主机）
+        self._finished_lock = threading.Lock()  # 只保护完成记录缓冲，complete() 不会等待任务库
+        self._finished: List[Tuple[str, str, str, str]] = []  # (source, state, error, failure)
+        self._heartbeat: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+        self._lock_fd: Optional[int] = None
+        if fcntl is not None:
+            self._lock_fd = os.open(str(self.db_path) + ".lock", os.O_RDWR | os.O_CREAT, 0o664)
+        # isolation_level=None：事务由 BEGIN IMMEDIATE 显式开始
+        self._conn = sqlite3.connect(str(self.db_path), timeout=BUSY_TIMEOUT, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        with self._transaction():
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY, source TEXT UNIQUE NOT NULL, priority REAL NOT NULL DEFAULT 0,"
+                " state TEXT NOT NULL DEFAULT 'pending', owner TEXT, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0,"
+                " error TEXT, failure TEXT, enqueued_at REAL, finished_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, priority, id)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    # ------------------------------------------------------------------
+    # 事务
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """写事务：进程内加锁、lock 文件上加记录锁，再 BEGIN IMMEDIATE"""
+        with self._lock:
+            if self._lock_fd is not None:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield self._conn
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._conn.execute("COMMIT")
+            finally:
+                if self._lock_fd is not None:
+                    fcntl.lockf(self._lock_fd, fcntl.LOCK_UN)
+
+    # ------------------------------------------------------------------
+    # 入队
+    # ------------------------------------------------------------------
+
+    @property
+    def root(self) -> Optional[Path]:
+        """入队时的扫描根目录（worker 以它为根目录计算输出路径）"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'root'").fetchone()
+        return Path(row[0]) if row else None
+
+    def enqueue(self, root: Path, documents: Iterable[Tuple[Path, float]], retry_failed: bool = False) -> Tuple[int, int]:
+        """
+        把文档加入队列（已在队列中的文档保持原状态）
+
+        参数:
+            root: 扫描根目录
+            documents: (文档路径, 优先级)，优先级数值小的先被领取
+            retry_failed: 已失败的文档重新置为待领取
+
+        返回:
+            (新加入的任务数, 重新置为待领取的失败任务数)
+
+        异常:
+            ValueError: 队列中已有其他根目录的任务
+        """
+        root = root.resolve()
+        current = self.root
+        if current is not None and current != root:
+            raise ValueError(f"任务库 {self.db_path} 属于根目录 {current}，不能加入 {root} 下的文档")
+        added = 0
+        now = time.time()
+        chunk: List[Tuple[str, float, float]] = []
+
+        def flush() -> int:
+            with self._transaction() as conn:
+                before = conn.total_changes
+                conn.executemany("INSERT OR IGNORE INTO jobs (source, priority, enqueued_at) VALUES (?, ?, ?)", chunk)
+                return conn.total_changes - before
+
+        for doc_path, priority in documents:
+            chunk.append((str(doc_path.resolve()), float(priority), now))
+            if len(chunk) >= ENQUEUE_CHUNK:
+                added += flush()
+                chunk = []
+        if chunk:
+            added += flush()
+
+        retried = 0
+        with self._transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('root', ?)", (str(root),))
+            if retry_failed:
+                retried = conn.execute(
+                    "UPDATE jobs SET state = 'pending', owner = NULL, lease_until = NULL, attempts = 0, error = NULL,"
+                    " failure = NULL, finished_at = NULL WHERE state = 'failed'").rowcount
+        return added, retried
+
+    # ------------------------------------------------------------------
+    # 领取、续租与完成
+    # ------------------------------------------------------------------
+
+    def _expire(self, conn: sqlite3.Connection, now: float) -> None:
+        """租约过期的任务回到待领取状态；领取次数已达上限的记为失败"""
+        conn.execute(
+            "UPDATE jobs SET state = 'failed', owner = NULL, finished_at = ?,"
+            " error = '租约过期（worker 崩溃或失联）且领取次数已达上限', failure = 'lease'"
+            " WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+            (now, now, self.max_attempts))
+        conn.execute(
+            "UPDATE jobs SET state = 'pending', owner = NULL, lease_until = NULL"
+            " WHERE state = 'leased' AND lease_until < ?", (now,))
+
+    def claim(self, count: int) -> List[Path]:
+        """
+        原子地领取最多 count 个任务（同时写入积累的完成记录）
+
+        返回:
+            领取到的文档路径；没有可领取的任务时为空列表
+        """
+        self._flush()
+        with self._transaction() as conn:
+            now = time.time()
+            self._expire(conn, now)
+            rows = conn.execute(
+                "SELECT id, source FROM jobs WHERE state = 'pending' ORDER BY priority, id LIMIT ?",
+                (max(1, count),)).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE jobs SET state = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1"
+                    " WHERE id = ?",
+                    [(self.owner, now + self.lease_seconds, job_id) for job_id, _ in rows])
+        return [Path(source) for _, source in rows]
+
+    def renew(self) -> int:
+        """续租本 worker 持有的全部任务，返回续租的任务数"""
+        self._flush()
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE state = 'leased' AND owner = ?",
+                (time.time() + self.lease_seconds, self.owner)).rowcount
+
+    def complete(self, doc_path: Path, ok: bool, error: str = "", failure: str = "") -> None:
+        """
+        记录任务结果：不访问任务库，由下一次领取、续租线程（积累到 COMPLETE_EVERY 条时提前）或 close() 写入，
+        可以在事件循环中调用（只取完成记录缓冲的锁，其他线程等待共享存储上的写锁时不受影响）
+        """
+        with self._finished_lock:
+            self._finished.append((str(doc_path.resolve()), DONE if ok else FAILED, error, failure))
+            due = len(self._finished) >= COMPLETE_EVERY
+        if due:
+            self._wake.set()
+
+    def _flush(self) -> None:
+        with self._finished_lock:
+            finished, self._finished = self._finished, []
+        if not finished:
+            return
+        now = time.time()
+        # 租约已被其他 worker 接手的任务不覆盖（owner 不再是本 worker）
+        try:
+            with self._transaction() as conn:
+                conn.executemany(
+                    "UPDATE jobs SET state = ?, error = ?, failure = ?, finished_at = ?, owner = NULL,"
+                    " lease_until = NULL WHERE source = ? AND state = 'leased' AND owner = ?",
+                    [(state, error or None, failure or None, now, source, self.owner)
+                     for source, state, error, failure in finished])
+        except sqlite3.Error:
+            with self._finished_lock:
+                self._finished[:0] = finished  # 下一次再写
+            raise
+
+    def release(self, documents: Iterable[Path]) -> int:
+        """把未处理的任务交还队列（中断时），不计入领取次数"""
+        self._flush()
+        sources = [(str(p.resolve()), self.owner) for p in documents]
+        if not sources:
+            return 0
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "UPDATE jobs SET state = 'pending', owner = NULL, lease_until = NULL,"
+                " attempts = MAX(0, attempts - 1) WHERE source = ? AND state = 'leased' AND owner = ?", sources)
+            return conn.total_changes - before
+
+    def active_leases(self) -> int:
+        """其他 worker 持有的未过期租约数（为0且没有待领取的任务时队列已处理完）"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'leased' AND lease_until >= ? AND owner != ?",
+                (time.time(), self.owner)).fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        """各状态的任务数"""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def workers(self) -> Dict[str, int]:
+        """持有未过期租约的 worker 及其任务数"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT owner, COUNT(*) FROM jobs WHERE state = 'leased' AND lease_until >= ? GROUP BY owner",
+                (time.time(),)).fetchall()
+        return dict(rows)
+
+    def failures(self, limit: int = 20) -> List[Tuple[str, str]]:
+        """最近失败的任务 (路径, 原因)"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT source, error FROM jobs WHERE state = 'failed' ORDER BY finished_at DESC LIMIT ?",
+                (limit,)).fetchall()
+
+    # ------------------------------------------------------------------
+    # 续租线程
+    # ------------------------------------------------------------------
+
+    def start_heartbeat(self) -> None:
+        """启动后台续租线程（每三分之一个租约时长续租一次，并写入积累的完成记录）"""
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._beat, name="queue-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def _beat(self) -> None:
+        interval = self.lease_seconds / 3
+        next_renew = time.monotonic() + interval
+        while not self._stop.is_set():
+            self._wake.wait(max(0.0, next_renew - time.monotonic()))
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                if time.monotonic() >= next_renew:
+                    self.renew()
+                    next_renew = time.monotonic() + interval
+                else:
+                    self._flush()
+            except sqlite3.Error as e:
+                # 共享存储暂时不可用：下一轮再试，租约在过期前仍然有效
+                print(f"警告: 任务库写入失败: {e}")
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+        self._flush()
+        self._conn.close()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+
+def main() -> None:
+    """查看任务库状态：python doc_to_md/job_queue.py 任务库"""
+    import sys
+    if len(sys.argv) != 2:
+        print("用法: python doc_to_md/job_queue.py 任务库.sqlite")
+        sys.exit(2)
+    queue = JobQueue(Path(sys.argv[1]))
+    try:
+        print(f"根目录: {queue.root}")
+        print("任务: " + "，".join(f"{state} {count}" for state, count in queue.counts().items()))
+        for owner, count in queue.workers().items():
+            print(f"  worker {owner}: {count} 个")
+        for source, error in queue.failures():
+            print(f"  失败 {source}: {error}")
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+运行日志（断点续跑）
+每个根目录一个只追加的 JSON Lines 日志，记录每个文档转换的开始、完成（附输出的 SHA-256）和失败；
+每条记录写入后立即 flush（进程被杀不会丢失），按批 fsync（断电最多丢失最近一批）。
+--resume 重放日志：输出校验一致的已完成文档直接跳过，开始后未结束的文档重新排队并清理残留
+
+日志从不截断：每次运行以一条 run 记录开始一个新段，重放时按顺序合并所有段，
+崩溃后误跑一次不带 --resume 的运行也不会丢掉续跑所需的状态；超过 COMPACT_BYTES 时压缩为当前状态
+"""
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+try:
+    from .conversion_cache import file_sha256
+except ImportError:
+    from conversion_cache import file_sha256
+
+JOURNAL_NAME = ".doc_to_md_journal.jsonl"
+
+# 每积累多少条记录、或距上次 fsync 多少秒后 fsync 一次
+FSYNC_EVERY = 32
+FSYNC_INTERVAL = 2.0
+
+# 日志超过该大小时，打开前先把重放得到的状态重写为一份紧凑的日志
+COMPACT_BYTES = 16 * 1024 * 1024
+
+
+@dataclass
+class JournalState:
+    """重放日志得到的状态"""
+    completed: Dict[str, dict] = field(default_factory=dict)  # 源文件 -> 最近一条 done 记录
+    in_flight: Set[str] = field(default_factory=set)          # 已开始但没有结束记录
+    failed: Dict[str, str] = field(default_factory=dict)      # 源文件 -> 错误信息
+
+    def verified(self, doc_path: Path, final_md: Path) -> bool:
+        """
+        文档是否已在之前的运行中完成：输出文件与记录的大小和 SHA-256 一致，
+        且源文件的大小和修改时间与完成时相同（记录中有源文件信息时）
+        """
+        entry = self.completed.get(str(doc_path))
+        if entry is None or entry.get("output") != str(final_md):
+            return False
+        try:
+            if "source_mtime_ns" in entry:
+                st = doc_path.stat()
+                if (st.st_size, st.st_mtime_ns) != (entry.get("source_size"), entry["source_mtime_ns"]):
+                    return False
+            if final_md.stat().st_size != entry.get("size", -1):
+                return False
+            return file_sha256(final_md) == entry.get("sha256", "")
+        except OSError:
+            return False
+
+
+def replay(path: Path) -> JournalState:
+    """
+    重放日志（按顺序合并所有运行段）
+
+    返回:
+        JournalState；日志不存在时为空状态。崩溃时写了一半的末行被忽略
+    """
+    state = JournalState()
+    try:
+        f = open(path, 'r', encoding='utf-8')
+    except OSError:
+        return state
+    with f:
+        for line in f:
+            try:
+                event = json.loads(line)
+                kind, source = event["event"], event["source"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            if kind == "start":
+                state.in_flight.add(source)
+                state.completed.pop(source, None)
+                state.failed.pop(source, None)
+            elif kind == "done":
+                state.in_flight.discard(source)
+                state.completed[source] = event
+            elif kind == "fail":
+                state.in_flight.discard(source)
+                state.failed[source] = event.get("error", "")
+    return state
+
+
+def compact(path: Path) -> None:
+    """把日志重写为重放后的状态（每个文档最多一条记录），先写临时文件再 rename"""
+    state = replay(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for event in state.completed.values():
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+            for source, error in state.failed.items():
+                f.write(json.dumps({"event": "fail", "source": source, "error": error}, ensure_ascii=False) + "\n")
+            for source in state.in_flight:
+                f.write(json.dumps({"event": "start", "source": source}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+class RunJournal:
+    """
+    只追加的运行日志
+
+    多个 worker 线程共用；写入在锁内进行
+    """
+
+    def __init__(self, root: Path, path: Optional[Path] = None, resume: bool = False):
+        """
+        参数:
+            root: 扫描根目录
+            path: 日志文件路径，None 表示 <root>/.doc_to_md_journal.jsonl
+            resume: 本次运行是否为 --resume（记录在新段的 run 记录中；两种情况都追加，不截断）
+        """
+        self.path = Path(path) if path else root / JOURNAL_NAME
+        self._lock = threading.Lock()
+        try:
+            if self.path.stat().st_size > COMPACT_BYTES:
+                compact(self.path)
+        except OSError:
+            pass
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if self._file.tell() > 0:
+            # 崩溃时写了一半的末行没有换行符，先补上，避免与新记录连在一起
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._write({"event": "run", "resume": resume, "pid": os.getpid()})
+
+    def _write(self, event: dict) -> None:
+        event["ts"] = round(time.time(), 3)
+        line = json.dumps(event, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line)
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= FSYNC_EVERY or time.monotonic() - self._last_sync >= FSYNC_INTERVAL:
+                self._sync()
+
+    def _sync(self) -> None:
+        try:
+            os.fsync(self._file.fileno())
+        except OSError:
+            pass
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def start(self, doc_path: Path, final_md: Path) -> None:
+        self._write({"event": "start", "source": str(doc_path), "output": str(final_md)})
+
+    def done(self, doc_path: Path, final_md: Path, engine: str = "") -> None:
+        """记录完成，附输出文件的大小和 SHA-256（在调用线程中计算）"""
+        try:
+            size, digest = final_md.stat().st_size, file_sha256(final_md)
+        except OSError as e:
+            self.fail(doc_path, f"无法读取输出: {e}")
+            return
+        event = {"event": "done", "source": str(doc_path), "output": str(final_md),
+                 "size": size, "sha256": digest, "engine": engine}
+        try:
+            st = doc_path.stat()
+            event.update(source_size=st.st_size, source_mtime_ns=st.st_mtime_ns)
+        except OSError:
+            pass  # 源文件已被删除（转换后删除）
+        self._write(event)
+
+    def fail(self, doc_path: Path, error: str, failure: str = "") -> None:
+        event = {"event": "fail", "source": str(doc_path), "error": error.splitlines()[0] if error else ""}
+        if failure:
+            event["failure"] = failure
+        self._write(event)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+转换子进程的资源限制和优先级
+按引擎配置（performance.engine_limits），子进程启动后立即由父进程设置地址空间上限（RLIMIT_AS）、
+CPU 时间上限（RLIMIT_CPU，通过 prlimit）、nice 值和 I/O 调度类（ioprio_set）；不使用 preexec_fn，
+多线程的父进程中不在 fork 与 exec 之间执行 Python 代码。Linux 不执行 RLIMIT_RSS，
+常驻内存上限由父进程在等待期间轮询整个进程树检查。
+子进程以 start_new_session 启动，超时或超限时整个进程组一起终止。
+常驻进程池的 worker 在启动时对自身设置同样的限制，CPU 时间按任务计（见 cpu_budget）
+"""
+
+import ctypes
+import os
+import platform
+import re
+import signal
+import subprocess
+from contextlib import contextmanager
+from dataclasses import dataclass, fields
+from typing import Any, Callable, Dict, Iterator, Optional
+
+try:
+    import resource
+except ImportError:  # 非 POSIX 平台
+    resource = None
+
+try:
+    from .admission import process_tree_rss_mb
+except ImportError:
+    from admission import process_tree_rss_mb
+
+# CPU 软限制到硬限制之间的宽限（秒）：超过软限制收到 SIGXCPU，再超过宽限被 SIGKILL
+CPU_GRACE = 5
+
+# 轮询进程树RSS的间隔（秒）
+RSS_POLL_INTERVAL = 0.5
+
+# ioprio_set 的系统调用号（glibc 没有包装函数）
+_IOPRIO_SET_NR = {
+    "x86_64": 251, "amd64": 251,
+    "i386": 289, "i686": 289,
+    "aarch64": 30, "arm64": 30, "riscv64": 30,
+    "armv7l": 314, "armv6l": 314,
+    "ppc64le": 273, "ppc64": 273,
+    "s390x": 282,
+}
+_IOPRIO_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+_IOPRIO_CLASS_SHIFT = 13
+_IOPRIO_WHO_PROCESS = 1
+
+# 地址空间上限导致分配失败时，工具常见的错误输出
+_MEMORY_ERRORS = re.compile(
+    r"MemoryError|Cannot allocate memory|out of memory|bad_alloc|failed to allocate|"
+    r"Unable to allocate|mmap failed",
+    re.IGNORECASE,
+)
+
+
+class ResourceLimitExceeded(subprocess.SubprocessError):
+    """转换子进程超出了配置的资源限制"""
+
+    def __init__(self, cmd, reason: str, output: Optional[str] = None, stderr: Optional[str] = None,
+                 rusage=None):
+        super().__init__(reason)
+        self.cmd = cmd
+        self.reason = reason
+        self.output = output
+        self.stderr = stderr
+        self.rusage = rusage  # 子进程的资源使用（可用时）
+
+    def __str__(self) -> str:
+        return self.reason
+
+
+@dataclass(frozen=True)
+class EngineLimits:
+    """一个引擎的资源限制（0 或空表示不限制）"""
+    memory_mb: int = 0       # 地址空间上限（RLIMIT_AS）
+    rss_mb: int = 0          # 整个进程树的常驻内存上限（父进程轮询检查）
+    cpu_seconds: int = 0     # CPU 时间上限（RLIMIT_CPU）
+    nice: int = 0            # nice 增量
+    ionice: str = ""         # I/O 调度类：idle、best-effort[:0-7]、realtime[:0-7]
+
+    @property
+    def active(self) -> bool:
+        return any(getattr(self, f.name) for f in fields(self))
+
+    def scaled(self, documents: int) -> "EngineLimits":
+        """一个进程转换多个文档（marker 批次）时的限制：CPU 时间按文档数累加，内存不变"""
+        if not self.cpu_seconds or documents <= 1:
+            return self
+        return EngineLimits(self.memory_mb, self.rss_mb, self.cpu_seconds * documents, self.nice, self.ionice)
+
+    def describe(self) -> str:
+        parts = []
+        if self.memory_mb:
+            parts.append(f"地址空间 {self.memory_mb}MB")
+        if self.rss_mb:
+            parts.append(f"RSS {self.rss_mb}MB")
+        if self.cpu_seconds:
+            parts.append(f"CPU {self.cpu_seconds}秒")
+        if self.nice:
+            parts.append(f"nice {self.nice:+d}")
+        if self.ionice:
+            parts.append(f"ionice {self.ionice}")
+        return "，".join(parts)
+
+
+def parse_ionice(spec: str) -> Optional[int]:
+    """
+    解析 I/O 调度类
+
+    返回:
+        ioprio_set 使用的优先级值；空字符串返回 None
+
+    异常:
+        ValueError: 无法识别的调度类或级别
+    """
+    if not spec:
+        return None
+    name, _, level = str(spec).strip().lower().partition(":")
+    if name not in _IOPRIO_CLASSES:
+        raise ValueError(f"未知的 I/O 调度类: {spec}（可选 idle、best-effort、realtime）")
+    data = 0
+    if level:
+        data = int(level)
+        if not 0 <= data <= 7:
+            raise ValueError(f"I/O 优先级须在 0-7 之间: {spec}")
+    elif name == "best-effort":
+        data = 4
+    return (_IOPRIO_CLASSES[name] << _IOPRIO_CLASS_SHIFT) | data
+
+
+def limits_for(config, engine: str) -> EngineLimits:
+    """
+    从配置中取得引擎的资源限制
+
+    performance.engine_limits 中 default 项适用于所有引擎，引擎同名项逐个覆盖其中的字段
+    """
+    table: Dict[str, Any] = config["performance"].get("engine_limits") or {}
+    merged: Dict[str, Any] = dict(table.get("default") or {})
+    merged.update(table.get(engine) or {})
+    known = {f.name for f in fields(EngineLimits)}
+    values = {k: v for k, v in merged.items() if k in known and v is not None}
+    values = {k: (str(v) if k == "ionice" else int(v)) for k, v in values.items()}
+    return EngineLimits(**values)
+
+
+def validate_engine_limits(table: Any) -> Optional[str]:
+    """检查 performance.engine_limits，返回错误信息；没有问题时返回 None"""
+    if not table:
+        return None
+    if not isinstance(table, dict):
+        return "performance.engine_limits 必须是 引擎名 -> 限制 的映射"
+    known = {f.name for f in fields(EngineLimits)}
+    for engine, entry in table.items():
+        if not isinstance(entry, dict):
+            return f"performance.engine_limits.{engine} 必须是映射"
+        for key, value in entry.items():
+            if key not in known:
+                return f"performance.engine_limits.{engine}: 未知的限制项 {key}"
+            if key == "ionice":
+                try:
+                    parse_ionice(value)
+                except ValueError as e:
+                    return f"performance.engine_limits.{engine}: {e}"
+            elif not isinstance(value, int) or (key != "nice" and value < 0):
+                return f"performance.engine_limits.{engine}.{key} 必须是非负整数"
+    return None
+
+
+def _set_ioprio(pid: int, spec: str) -> None:
+    """设置进程的 I/O 调度类（pid 为 0 表示当前进程）；不支持的平台或失败（如 realtime 需要特权）时保持默认"""
+    value = parse_ionice(spec)
+    nr = _IOPRIO_SET_NR.get(platform.machine().lower())
+    if value is None or nr is None:
+        return
+    try:
+        syscall = ctypes.CDLL(None, use_errno=True).syscall
+    except (OSError, AttributeError):
+        return
+    syscall(ctypes.c_long(nr), ctypes.c_int(_IOPRIO_WHO_PROCESS), ctypes.c_int(pid), ctypes.c_int(value))
+
+
+def _capped(limit: int, value: int) -> int:
+    """不超过当前硬限制的值（非特权进程不能提高硬限制）"""
+    _, hard = resource.getrlimit(limit)
+    return value if hard == resource.RLIM_INFINITY else min(value, hard)
+
+
+def _set_rlimit(pid: int, which: int, values) -> None:
+    if pid == 0 or not hasattr(resource, "prlimit"):
+        resource.setrlimit(which, values)
+    else:
+        resource.prlimit(pid, which, values)
+
+
+def apply_limits(pid: int, limits: EngineLimits) -> None:
+    """
+    对已启动的进程设置资源限制和优先级（pid 为 0 表示当前进程）
+
+    在父进程中子进程启动后立即调用；之后子进程派生的进程继承这些限制。
+    CPU 时间上限在此之前已用掉的时间也计入，刚启动的进程可以忽略
+    """
+    if resource is None or pid < 0:
+        return
+    try:
+        if limits.memory_mb:
+            value = _capped(resource.RLIMIT_AS, limits.memory_mb * 1024 * 1024)
+            _set_rlimit(pid, resource.RLIMIT_AS, (value, value))
+        if limits.cpu_seconds:
+            soft = _capped(resource.RLIMIT_CPU, limits.cpu_seconds)
+            _set_rlimit(pid, resource.RLIMIT_CPU, (soft, _capped(resource.RLIMIT_CPU, soft + CPU_GRACE)))
+        if limits.nice:
+            try:
+                current = os.getpriority(os.PRIO_PROCESS, pid)
+                os.setpriority(os.PRIO_PROCESS, pid, max(-20, min(19, current + limits.nice)))
+            except PermissionError:
+                pass  # 负的 nice 需要特权
+        if limits.ionice:
+            _set_ioprio(pid, limits.ionice)
+    except ProcessLookupError:
+        pass  # 进程已经结束
+
+
+def limit_worker(limits: EngineLimits) -> None:
+    """
+    常驻 worker 进程启动时对自身设置资源限制（CPU 时间除外，由 cpu_budget 按任务设置）
+
+    超过按任务设置的 CPU 时间时收到的 SIGXCPU 转为 ResourceLimitExceeded，从正在执行的转换中抛出
+    """
+    apply_limits(0, EngineLimits(memory_mb=limits.memory_mb, nice=limits.nice, ionice=limits.ionice))
+    if limits.cpu_seconds and resource is not None and hasattr(signal, "SIGXCPU"):
+        def on_xcpu(signum, frame):
+            raise ResourceLimitExceeded(None, f"CPU 时间超过限制 {limits.cpu_seconds}秒")
+
+        signal.signal(signal.SIGXCPU, on_xcpu)
+
+
+@contextmanager
+def cpu_budget(limits: EngineLimits) -> Iterator[None]:
+    """
+    常驻 worker 中执行一个任务期间的 CPU 时间上限
+
+    把 RLIMIT_CPU 的软限制设为 已用 CPU 时间 + cpu_seconds，任务结束后恢复；
+    硬限制保持不变（非特权进程降低后不能再提高），由 limit_worker 安装的处理函数把 SIGXCPU 转为异常
+    """
+    if not limits.cpu_seconds or resource is None or not hasattr(signal, "SIGXCPU"):
+        yield
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    original = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(usage.ru_utime + usage.ru_stime) + 1 + limits.cpu_seconds
+    _, hard = original
+    resource.setrlimit(resource.RLIMIT_CPU, (soft if hard == resource.RLIM_INFINITY else min(soft, hard), hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, original)
+
+
+def rss_watchdog(limits: EngineLimits, pid: int) -> Optional[Callable[[], Optional[str]]]:
+    """
+    常驻内存检查函数：进程树的RSS超过上限时返回原因
+
+    返回:
+        未设置 rss_mb 时返回 None
+    """
+    if not limits.rss_mb:
+        return None
+
+    def check() -> Optional[str]:
+        rss = process_tree_rss_mb(pid)
+        if rss > limits.rss_mb:
+            return f"常驻内存 {rss}MB 超过限制 {limits.rss_mb}MB"
+        return None
+
+    return check
+
+
+def exit_reason(limits: EngineLimits, returncode: int, stderr: Optional[str], rusage=None) -> str:
+    """
+    判断非零退出是否由资源限制引起
+
+    参数:
+        returncode: 子进程退出码（被信号终止为负数；经 shell 运行时为 128+信号）
+        stderr: 子进程的错误输出
+        rusage: os.wait4 取得的资源使用
+
+    返回:
+        超限原因；不是资源限制引起的返回空字符串
+    """
+    if returncode == 0 or not limits.active:
+        return ""
+    signum = -returncode if returncode < 0 else (returncode - 128 if returncode > 128 else 0)
+    if limits.cpu_seconds:
+        used = rusage.ru_utime + rusage.ru_stime if rusage is not None else None
+        if signum == getattr(signal, "SIGXCPU", -1) or \
+                (signum == signal.SIGKILL and used is not None and used >= limits.cpu_seconds):
+            return f"CPU 时间超过限制 {limits.cpu_seconds}秒"
+    if limits.memory_mb and stderr and _MEMORY_ERRORS.search(stderr[-4000:]):
+        return f"内存分配失败（地址空间限制 {limits.memory_mb}MB）"
+    return ""
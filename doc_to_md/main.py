@@ -4,25 +4,74 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
 import concurrent.futures as cf
+import hashlib
+import itertools
+import multiprocessing as mp
 import os
 import shlex
 import shutil
 import subprocess
 import sys
 import time
-from dataclasses import dataclass
+from contextlib import nullcontext, suppress
+from functools import partial
+from dataclasses import dataclass, field, replace
 from pathlib import Path
-from typing import Optional, List, Tuple, Any
+from typing import Optional, List, Tuple, Any, Awaitable, Callable, Dict, Set
 
 # 导入配置管理器
 try:
     from .config_manager import ConfigManager, create_arg_parser
     from .delete_manager import DeleteManager
+    from .tool_registry import ToolRegistry, get_default_registry
+    from .worker_pool import PythonWorkerPool, POOL_ENGINES
+    from .conversion_cache import ConversionCache, file_sha256
+    from .manifest import Manifest
+    from .pdf_info import count_pdf_pages
+    from .pdf_split import SPLIT_ENGINES, page_ranges, extract_pdf_split
+    from .marker_batch import MarkerBatcher, mark_output_complete, marker_output_complete, remove_stale_batches
+    from .cost_model import CostModel, JobEstimate, ProgressEstimator, count_pages, format_eta
+    from .admission import MemoryGovernor, Slot
+    from .quality import check_output_quality
+    from .pdf_classify import MIXED, SCANNED, TEXT, UNKNOWN, PdfClassCache, classify_pdfs
+    from .scratch import LEGACY_DIR_NAME, choose_scratch_dir, publish_file, remove_empty_dir
+    from .journal import JOURNAL_NAME, JournalState, RunJournal, replay
+    from .run_log import JobStats, RunLog, engine_percentiles
+    from .autotune import WorkerTuner
+    from .limits import EngineLimits, ResourceLimitExceeded, limits_for
+    from .aio import EngineSlots, Orchestrator, install_interrupt_handler, run_process
+    from .job_queue import QUEUE_POLL, JobQueue
+    from .watch import TreeWatcher
+    from .server import ConversionServer
 except ImportError:
     # 当直接运行main.py时使用绝对导入
     from config_manager import ConfigManager, create_arg_parser
     from delete_manager import DeleteManager
+    from tool_registry import ToolRegistry, get_default_registry
+    from worker_pool import PythonWorkerPool, POOL_ENGINES
+    from conversion_cache import ConversionCache, file_sha256
+    from manifest import Manifest
+    from pdf_info import count_pdf_pages
+    from pdf_split import SPLIT_ENGINES, page_ranges, extract_pdf_split
+    from marker_batch import MarkerBatcher, mark_output_complete, marker_output_complete, remove_stale_batches
+    from cost_model import CostModel, JobEstimate, ProgressEstimator, count_pages, format_eta
+    from admission import MemoryGovernor, Slot
+    from quality import check_output_quality
+    from pdf_classify import MIXED, SCANNED, TEXT, UNKNOWN, PdfClassCache, classify_pdfs
+    from scratch import LEGACY_DIR_NAME, choose_scratch_dir, publish_file, remove_empty_dir
+    from journal import JOURNAL_NAME, JournalState, RunJournal, replay
+    from run_log import JobStats, RunLog, engine_percentiles
+    from autotune import WorkerTuner
+    from limits import EngineLimits, ResourceLimitExceeded, limits_for
+    from aio import EngineSlots, Orchestrator, install_interrupt_handler, run_process
+    from job_queue import QUEUE_POLL, JobQueue
+    from watch import TreeWatcher
+    from server import ConversionServer
+
+# 监视模式下每次等待文件变化的最长时间（秒），Ctrl-C 后最迟这么久退出等待
+WATCH_WAIT = 1.0
 
 
 def supports_color() -> bool:
@@ -45,6 +94,13 @@ def dim(s: str) -> str: return c(s, "2")
 def bold(s: str) -> str: return c(s, "1")
 
 
+# 引擎名 -> 工具注册表中的名称（决定缓存键里使用哪个版本号）
+ENGINE_TOOLS = {
+    "python": "pdfminer",
+    "docx-converter": "",
+}
+
+
 @dataclass(frozen=True)
 class TaskResult:
     doc_path: Path
@@ -53,35 +109,47 @@ class TaskResult:
     seconds: float
     message: str = ""
     cmd: Optional[List[str]] = None
+    engine: str = ""         # 实际运行的转换引擎（跳过、缓存命中时为空）
+    stats: Optional[JobStats] = None  # 各阶段耗时和子进程资源使用
+    failure: str = ""        # 失败类型："limit"（超出资源限制）| "timeout" | "error" | "cancelled"
+
+
+@dataclass
+class RunContext:
+    """一次运行中各任务共享的资源"""
+    tools: Optional[ToolRegistry] = None
+    pool: Optional[PythonWorkerPool] = None
+    cache: Optional[ConversionCache] = None
+    manifest: Optional[Manifest] = None
+    marker: Optional[MarkerBatcher] = None
+    governor: Optional[MemoryGovernor] = None
+    scratch: Optional[Path] = None  # 中间输出目录
+    cost_model: Optional[CostModel] = None
+    pdf_kinds: Dict[Path, str] = field(default_factory=dict)  # PDF 分类结果（text / scanned / ...）
+    estimates: Dict[Path, JobEstimate] = field(default_factory=dict)
+    # 源文件内容哈希 (大小, mtime_ns, sha256)：转换链中各引擎的缓存键共用，每个文档只读一遍
+    content_hashes: Dict[Path, Tuple[int, int, str]] = field(default_factory=dict)
+    journal: Optional[RunJournal] = None
+    resumed: Set[Path] = field(default_factory=set)  # --resume：上次运行已完成且输出校验一致
+    requeue: Set[Path] = field(default_factory=set)  # --resume：上次运行中断的文档，即使输出已存在也重新转换
+    io: Optional[cf.Executor] = None  # 文件读写、哈希等阻塞操作的线程池（事件循环中不直接执行）
+    engine_slots: EngineSlots = field(default_factory=EngineSlots)  # 各引擎的并发上限
+
 
+async def blocking(ctx: RunContext, func: Callable, *args, **kwargs):
+    """在 ctx.io 线程池中执行阻塞操作"""
+    return await asyncio.get_running_loop().run_in_executor(ctx.io, partial(func, *args, **kwargs))
 
-def ensure_converter_exists(file_types: List[str]) -> None:
+
+def ensure_converter_exists(file_types: List[str], tools: Optional[ToolRegistry] = None) -> None:
     """
     检查是否有可用的转换工具
     """
+    tools = tools or get_default_registry()
     errors = []
     
     if 'pdf' in file_types:
-        pdf_tools_available = False
-        
-        marker_bin = "marker"
-        if shutil.which(marker_bin) is not None:
-            try:
-                result = subprocess.run([marker_bin, "--help"], capture_output=True, text=True, timeout=2)
-                if "--output" in result.stdout or "--output" in result.stderr:
-                    pdf_tools_available = True
-            except:
-                pass
-        
-        if not pdf_tools_available and shutil.which("pdftotext") is not None:
-            pdf_tools_available = True
-        
-        if not pdf_tools_available:
-            try:
-                import pdfminer
-                pdf_tools_available = True
-            except ImportError:
-                pass
+        pdf_tools_available = any(tools.available(name) for name in ["marker", "pdftotext", "pdfminer"])
         
         if not pdf_tools_available:
             errors.append("PDF转换工具：请安装以下之一：\n"
@@ -91,106 +159,144 @@ def ensure_converter_exists(file_types: List[str]) -> None:
     
     word_types = [ft for ft in file_types if ft in ['docx', 'doc']]
     if word_types:
-        word_tools_available = False
+        # DOCX 总是可以用内置流式引擎转换
+        word_tools_available = tools.available("pandoc") or 'doc' not in word_types
         
-        if shutil.which("pandoc") is not None:
+        if not word_tools_available and 'doc' in word_types and tools.available("antiword"):
             word_tools_available = True
         
-        if not word_tools_available:
-            try:
-                import docx
-                word_tools_available = True
-            except ImportError:
-                pass
-        
-        if not word_tools_available and 'doc' in word_types and shutil.which("antiword") is not None:
-            word_tools_available = True
-        
-        if not word_tools_available and shutil.which("catdoc") is not None:
+        if not word_tools_available and tools.available("catdoc"):
             word_tools_available = True
         
         if not word_tools_available:
             errors.append("Word文档转换工具：请安装以下之一：\n"
                          "  1. pandoc（推荐）\n"
-                         "  2. python-docx（Python库）\n"
-                         "  3. antiword（针对.doc文件）\n"
-                         "  4. catdoc（文本提取）")
+                         "  2. antiword（针对.doc文件）\n"
+                         "  3. catdoc（文本提取）")
     
     if errors:
         error_msg = "找不到可用的转换工具：\n\n" + "\n\n".join(errors)
         raise RuntimeError(error_msg)
 
 
-def build_pdf_converter_cmd(pdf_path: Path, out_dir: Path) -> Tuple[str, List[str]]:
-    marker_bin = "marker"
-    if shutil.which(marker_bin) is not None:
-        try:
-            result = subprocess.run([marker_bin, "--help"], capture_output=True, text=True, timeout=2)
-            if "--output" in result.stdout or "--output" in result.stderr:
-                return ("marker", [marker_bin, str(pdf_path), "--output", str(out_dir)])
-        except:
-            pass
-    
-    if shutil.which("pdftotext") is not None:
-        output_file = out_dir / f"{pdf_path.stem}.txt"
-        return ("pdftotext", ["pdftotext", str(pdf_path), str(output_file)])
-    
-    return ("python", ["python3", "-c", f"""
-import sys
-sys.path.insert(0, '{Path(__file__).parent}')
-from pdf_converter import convert_pdf_to_markdown
-convert_pdf_to_markdown('{pdf_path}', '{out_dir}')
-"""])
+# tool_priority 中的名称 -> 引擎名
+PRIORITY_ENGINES = {"pdfminer": "python"}
 
+# 默认的工具优先级（配置中缺少 tool_priority 时使用）
+DEFAULT_TOOL_PRIORITY = {
+    "pdf": ["marker", "pdftotext", "pdfminer"],
+    "docx": ["pandoc", "docx-converter", "antiword", "catdoc"],
+    "doc": ["antiword", "catdoc", "pandoc"],
+}
 
-def build_word_converter_cmd(doc_path: Path, out_dir: Path) -> Tuple[str, List[str]]:
-    if shutil.which("pandoc") is not None:
-        output_file = out_dir / f"{doc_path.stem}.md"
-        return ("pandoc", ["pandoc", "-s", str(doc_path), "-t", "markdown", "-o", str(output_file)])
-    
-    try:
-        import docx
-        return ("python-docx", ["python3", "-c", f"""
+# build_engine_cmd 支持的全部引擎
+ENGINE_NAMES = ("marker", "pdftotext", "python", "pandoc", "antiword", "catdoc", "docx-converter")
+
+# 内置引擎，不依赖外部工具或第三方库，总是可用
+BUILTIN_ENGINES = {"docx-converter"}
+
+# 昂贵的引擎：转换链按“廉价优先”排序时放到最后，只在廉价引擎的输出不合格时使用
+EXPENSIVE_ENGINES = {"marker"}
+
+
+def _python_converter_script(doc_path: Path, out_dir: Path) -> str:
+    return f"""
 import sys
 sys.path.insert(0, '{Path(__file__).parent}')
-from docx_converter import convert_docx_to_markdown
-success, message, output_file = convert_docx_to_markdown('{doc_path}', '{out_dir}')
+from docx_converter import convert_docx_builtin
+success, message, output_file = convert_docx_builtin('{doc_path}', '{out_dir}')
 if not success:
     print(message, file=sys.stderr)
     sys.exit(1)
-"""])
-    except ImportError:
-        pass
-    
-    if doc_path.suffix.lower() == '.doc' and shutil.which("antiword") is not None:
-        output_file = out_dir / f"{doc_path.stem}.txt"
-        return ("antiword", ["antiword", str(doc_path), ">", str(output_file)])
-    
-    if shutil.which("catdoc") is not None:
-        output_file = out_dir / f"{doc_path.stem}.txt"
-        return ("catdoc", ["catdoc", str(doc_path), ">", str(output_file)])
-    
-    return ("docx-converter", ["python3", "-c", f"""
+"""
+
+
+def build_engine_cmd(engine: str, doc_path: Path, out_dir: Path, tools: Optional[ToolRegistry] = None) -> List[str]:
+    """构建指定引擎的转换命令"""
+    tools = tools or get_default_registry()
+    if engine == "marker":
+        return [tools.path("marker"), str(doc_path), "--output", str(out_dir)]
+    if engine == "pdftotext":
+        return [tools.path("pdftotext"), str(doc_path), str(out_dir / f"{doc_path.stem}.txt")]
+    if engine == "python":
+        return ["python3", "-c", f"""
 import sys
 sys.path.insert(0, '{Path(__file__).parent}')
-from docx_converter import convert_docx_to_markdown
-success, message, output_file = convert_docx_to_markdown('{doc_path}', '{out_dir}')
-if not success:
-    print(message, file=sys.stderr)
-    sys.exit(1)
-"""])
+from pdf_converter import convert_pdf_to_markdown
+convert_pdf_to_markdown('{doc_path}', '{out_dir}')
+"""]
+    if engine == "pandoc":
+        output_file = out_dir / f"{doc_path.stem}.md"
+        return [tools.path("pandoc"), "-s", str(doc_path), "-t", "markdown", "-o", str(output_file)]
+    if engine in ("antiword", "catdoc"):
+        return [tools.path(engine), str(doc_path), ">", str(out_dir / f"{doc_path.stem}.txt")]
+    if engine == "docx-converter":
+        return ["python3", "-c", _python_converter_script(doc_path, out_dir)]
+    raise ValueError(f"未知的转换引擎: {engine}")
 
 
-def build_converter_cmd(doc_path: Path, out_dir: Path) -> Tuple[str, List[str]]:
+def converter_chain(doc_path: Path, tools: Optional[ToolRegistry] = None, config=None,
+                    pdf_kind: Optional[str] = None) -> List[str]:
+    """
+    按 tool_priority 列出文档可用的转换引擎（依次尝试）
+
+    参数:
+        config: 配置字典；fallback.cheap_first 为真时昂贵引擎（marker）排到最后
+        pdf_kind: PDF 分类结果；扫描件直接把昂贵引擎（OCR）排到最前
+
+    返回:
+        引擎名列表，至少包含一个内置后备引擎
+    """
+    tools = tools or get_default_registry()
     suffix = doc_path.suffix.lower()
-    
-    if suffix == '.pdf':
-        return build_pdf_converter_cmd(doc_path, out_dir)
-    elif suffix in ['.docx', '.doc']:
-        return build_word_converter_cmd(doc_path, out_dir)
-    else:
+    file_type = suffix.lstrip(".")
+    if file_type not in DEFAULT_TOOL_PRIORITY:
         raise ValueError(f"不支持的文件类型: {suffix}")
 
+    priority = ((config or {}).get("tool_priority") or {}).get(file_type) or DEFAULT_TOOL_PRIORITY[file_type]
+    chain: List[str] = []
+    for name in priority:
+        engine = PRIORITY_ENGINES.get(name, name)
+        if engine in chain or not (engine in BUILTIN_ENGINES or tools.available(name)):
+            continue
+        if engine in BUILTIN_ENGINES and suffix != ".docx":
+            continue
+        if engine == "antiword" and suffix != ".doc":
+            continue
+        if engine == "python" and file_type != "pdf":
+            continue
+        chain.append(engine)
+
+    # 内置后备：pdfminer 转换器 / docx_converter 流式引擎
+    if not chain:
+        chain.append("python" if file_type == "pdf" else "docx-converter")
+
+    fallback = (config or {}).get("fallback") or {}
+    if pdf_kind == SCANNED:
+        chain.sort(key=lambda e: e not in EXPENSIVE_ENGINES)
+    elif fallback.get("cheap_first", True):
+        chain.sort(key=lambda e: e in EXPENSIVE_ENGINES)
+    if not fallback.get("enabled", True):
+        chain = chain[:1]
+    return chain
+
+
+def build_pdf_converter_cmd(pdf_path: Path, out_dir: Path, tools: Optional[ToolRegistry] = None) -> Tuple[str, List[str]]:
+    engine = converter_chain(pdf_path, tools)[0]
+    return (engine, build_engine_cmd(engine, pdf_path, out_dir, tools))
+
+
+def build_word_converter_cmd(doc_path: Path, out_dir: Path, tools: Optional[ToolRegistry] = None) -> Tuple[str, List[str]]:
+    engine = converter_chain(doc_path, tools)[0]
+    return (engine, build_engine_cmd(engine, doc_path, out_dir, tools))
+
+
+def build_converter_cmd(doc_path: Path, out_dir: Path, tools: Optional[ToolRegistry] = None,
+                        config=None) -> Tuple[str, List[str]]:
+    """转换链中第一个引擎的 (tool_name, command_args)"""
+    engine = converter_chain(doc_path, tools, config)[0]
+    return (engine, build_engine_cmd(engine, doc_path, out_dir, tools))
+
 
 def find_documents(root: Path, include_types: List[str], include_hidden: bool, exclude_dirs: List[str]) -> List[Path]:
     documents: List[Path] = []
@@ -214,11 +320,41 @@ def find_documents(root: Path, include_types: List[str], include_hidden: bool, e
             if not include_hidden and any(part.startswith(".") for part in p.relative_to(root).parts):
                 continue
             
+            # Word 打开文档时生成的锁文件
+            if p.name.startswith("~$"):
+                continue
+            
             documents.append(p)
     
     return sorted(documents)
 
 
+def document_filters(
+    root: Path, include_types: List[str], include_hidden: bool, exclude_dirs: List[str]
+) -> Tuple[Callable[[Path], bool], Callable[[Path], bool]]:
+    """
+    与 find_documents 相同的筛选规则，供目录监视逐个判断
+
+    返回:
+        (accept, skip_dir)：文件是否需要转换，子目录是否跳过
+    """
+    suffixes = {f".{t}" for t in include_types if t in ("pdf", "docx", "doc")}
+    exclude_set = set(exclude_dirs)
+
+    def hidden(path: Path) -> bool:
+        return not include_hidden and any(part.startswith(".") for part in path.relative_to(root).parts)
+
+    def accept(path: Path) -> bool:
+        # "~$" 开头的是 Word 打开文档时的锁文件
+        return (path.suffix in suffixes and not path.name.startswith("~$")
+                and not any(part in exclude_set for part in path.parts) and not hidden(path))
+
+    def skip_dir(path: Path) -> bool:
+        return path.name in exclude_set or hidden(path)
+
+    return accept, skip_dir
+
+
 def compute_final_md_path(doc_path: Path, config) -> Path:
     directory_mode = config.get("output.directory_mode", "same")
     
@@ -274,15 +410,522 @@ def ask_yes_no(prompt: str, default_no: bool = True) -> bool:
             return False
 
 
-def run_one(
+def delete_after_conversion(
+    delete_manager: Optional[DeleteManager],
+    doc_path: Path,
+    final_md: Path,
+    dry_run: bool,
+) -> str:
+    """转换后删除源文件（如果配置要求），返回附加到结果消息的说明"""
+    delete_after_msg = ""
+    if delete_manager and delete_manager.delete_source:
+        delete_mode = delete_manager.delete_mode
+        print(f"[DEBUG]   检查转换后删除，模式: {delete_mode}")
+        if delete_mode == "after_conversion":
+            # 转换后删除
+            print(f"[DEBUG]   执行转换后删除")
+            delete_success, delete_msg = delete_manager.delete_source_file(
+                doc_path, final_md, dry_run, user_confirmed=False
+            )
+            if delete_success:
+                delete_after_msg = f", 转换后删除: {delete_msg}"
+                print(f"[DEBUG]   转换后删除成功: {delete_msg}")
+            else:
+                delete_after_msg = f", 转换后删除失败: {delete_msg}"
+                print(f"[DEBUG]   转换后删除失败: {delete_msg}")
+    return delete_after_msg
+
+
+def content_hash_for(ctx: RunContext, doc_path: Path) -> str:
+    """源文件内容的 SHA-256；大小和修改时间未变时复用本次运行中已算过的结果"""
+    st = doc_path.stat()
+    cached = ctx.content_hashes.get(doc_path)
+    if cached is not None and cached[:2] == (st.st_size, st.st_mtime_ns):
+        return cached[2]
+    digest = file_sha256(doc_path)
+    ctx.content_hashes[doc_path] = (st.st_size, st.st_mtime_ns, digest)
+    return digest
+
+
+def cache_key_for(
+    cache: ConversionCache,
+    doc_path: Path,
+    tool_name: str,
+    tools: Optional[ToolRegistry],
+    content_hash: Optional[str] = None,
+) -> str:
+    """
+    计算文档在转换缓存中的键：内容哈希 + 工具名 + 工具版本 + 影响输出的选项
+
+    参数:
+        content_hash: 源文件内容哈希（content_hash_for），None 时读取文件计算
+    """
+    tools = tools or get_default_registry()
+    registry_name = ENGINE_TOOLS.get(tool_name, tool_name)
+    version = tools.get(registry_name).version if registry_name else ""
+    return cache.make_key(doc_path, tool_name, version, {"suffix": doc_path.suffix.lower()}, content_hash)
+
+
+def plan_pdf_split(
+    doc_path: Path,
+    tool_name: str,
+    config,
+    pool: Optional[PythonWorkerPool],
+) -> Optional[List[Tuple[int, int]]]:
+    """页数超过阈值的PDF返回分段提取的页码范围，否则返回 None"""
+    performance = config.get("performance", {})
+    threshold = performance.get("split_pages_threshold", 0)
+    if threshold <= 0 or tool_name not in SPLIT_ENGINES or doc_path.suffix.lower() != ".pdf":
+        return None
+    if tool_name == "python" and pool is None:
+        return None
+    pages = count_pdf_pages(doc_path)
+    if not pages or pages < threshold:
+        return None
+    return page_ranges(pages, performance.get("split_chunk_pages", 100))
+
+
+def up_to_date_reason(
+    doc_path: Path,
+    final_md: Path,
+    force: bool,
+    manifest: Optional[Manifest],
+    dry_run: bool,
+) -> Optional[str]:
+    """目标 Markdown 无需重新生成时返回跳过原因，否则返回 None"""
+    if force:
+        return None
+    if manifest is not None:
+        # 增量模式：按清单里记录的源文件元数据判断是否需要重新转换
+        fresh, reason = manifest.check(doc_path, final_md, adopt=not dry_run)
+        return f"增量模式跳过：{reason}" if fresh else None
+    if final_md.exists():
+        return "目标 Markdown 已存在，跳过（用 --force 覆盖）"
+    return None
+
+
+def doc_output_dir(scratch: Path, doc_path: Path) -> Path:
+    """
+    文档在临时目录下的输出目录
+
+    目录名由源文件的绝对路径确定（不使用进程内随机化的 hash()），
+    重新运行时能找到上次保留的中间输出
+    """
+    key = hashlib.sha1(os.path.abspath(doc_path).encode('utf-8', 'surrogateescape')).hexdigest()[:16]
+    return scratch / f"{safe_stem(doc_path)}__{key}"
+
+
+def attempt_output_dir(doc_out: Path, tool_name: str) -> Path:
+    """
+    引擎在转换链中的输出目录
+
+    marker 直接使用文档的输出目录（批次结果和可复用的完整输出都放在那里）；其他引擎各用一个同级目录，
+    被终止的引擎即使留下文件，也不会被后面的引擎当作自己的输出发布或写入缓存
+    """
+    return doc_out if tool_name == "marker" else doc_out.with_name(f"{doc_out.name}~{tool_name}")
+
+
+def remove_doc_outputs(doc_out: Path, keep_marker: bool = False) -> None:
+    """删除文档的输出目录和各引擎的输出目录（keep_marker 为真时保留 marker 的输出）"""
+    if not keep_marker:
+        shutil.rmtree(doc_out, ignore_errors=True)
+    for engine in ENGINE_NAMES:
+        if engine != "marker":
+            shutil.rmtree(attempt_output_dir(doc_out, engine), ignore_errors=True)
+
+
+def estimate_documents(
+    documents: List[Path],
+    root: Path,
+    config,
+    ctx: RunContext,
+    model: CostModel,
+    workers: int,
+) -> Dict[Path, JobEstimate]:
+    """并发估算每个文档的转换代价（无需转换的文档代价为0）"""
+    force = config["conversion"]["force"]
+
+    def estimate_one(doc_path: Path) -> JobEstimate:
+        final_md = compute_final_md_path(doc_path, config)
+        if up_to_date_reason(doc_path, final_md, force, ctx.manifest, dry_run=True):
+            return JobEstimate(doc_path, "", 0, 0, 0.0)
+        engine = converter_chain(doc_path, ctx.tools, config, ctx.pdf_kinds.get(doc_path))[0]
+        return model.estimate(doc_path, engine)
+
+    with cf.ThreadPoolExecutor(max_workers=max(4, workers)) as executor:
+        return dict(zip(documents, executor.map(estimate_one, documents)))
+
+
+def job_timeout(doc_path: Path, engine: str, config, ctx: RunContext) -> Optional[float]:
+    """
+    单个文档用指定引擎转换时的超时秒数
+
+    启用自适应超时时按估算耗时和该引擎的历史偏差计算，performance.timeout 作为上限；
+    否则使用固定的 performance.timeout（0表示不设超时）
+    """
+    perf = config["performance"]
+    fixed = perf.get("timeout", 0)
+    if ctx.cost_model is not None and perf.get("adaptive_timeout", True):
+        estimate = ctx.estimates.get(doc_path)
+        if estimate is None or estimate.engine != engine:
+            pages = estimate.pages if estimate is not None else None
+            estimate = ctx.cost_model.estimate(doc_path, engine, pages=pages)
+        return ctx.cost_model.timeout_for(
+            estimate,
+            factor=perf.get("timeout_factor", 4.0),
+            minimum=perf.get("timeout_min", 30),
+            maximum=fixed,
+        )
+    return fixed if fixed > 0 else None
+
+
+def reusable_marker_output(doc_out: Path, doc_path: Path, config) -> bool:
+    """doc_out 中是否有可以直接复用的 marker 输出（源文件未变化且未要求强制重新转换）"""
+    conversion = config["conversion"]
+    if conversion["force"] or not conversion.get("reuse_outputs", True):
+        return False
+    return marker_output_complete(doc_out, doc_path)
+
+
+def plan_marker_batch(documents: List[Path], root: Path, config, ctx: RunContext) -> List[Path]:
+    """挑出需要用 marker 转换的PDF（已是最新或缓存命中的文档不进入批次）"""
+    selected = []
+    for doc_path in documents:
+        if doc_path.suffix.lower() != ".pdf" or doc_path in ctx.resumed:
+            continue
+        force = config["conversion"]["force"] or doc_path in ctx.requeue
+        tool_name = converter_chain(doc_path, ctx.tools, config, ctx.pdf_kinds.get(doc_path))[0]
+        if tool_name != "marker":
+            continue
+        final_md = compute_final_md_path(doc_path, config)
+        if up_to_date_reason(doc_path, final_md, force, ctx.manifest, dry_run=True):
+            continue
+        if ctx.cache is not None and ctx.cache.contains(
+                cache_key_for(ctx.cache, doc_path, tool_name, ctx.tools, content_hash_for(ctx, doc_path))):
+            continue
+        if reusable_marker_output(doc_output_dir(ctx.scratch or root / LEGACY_DIR_NAME, doc_path), doc_path, config):
+            continue
+        selected.append(doc_path)
+    return selected
+
+
+def prepare_documents(
+    documents: List[Path],
+    root: Path,
+    config,
+    ctx: RunContext,
+    workers: int,
+) -> Tuple[List[Path], List[str]]:
+    """
+    转换前的准备：PDF 分类、代价估算、调度排序和 marker 批次安排，结果合并到 ctx 中
+
+    从任务队列陆续领取文档时，每批领取的文档分别调用一次
+
+    返回:
+        (提交顺序, 要输出的说明)；进入 marker 批次的文档排在最后，先处理其他文档，等待批次完成
+    """
+    notes: List[str] = []
+
+    # PDF 预分类：有文本层的交给廉价工具，扫描件直接交给 marker（结果按文件缓存）
+    pdfs = [d for d in documents if d.suffix.lower() == ".pdf"]
+    if pdfs and config["conversion"].get("classify_pdfs", True):
+        class_cache = PdfClassCache()
+        kinds, classified = classify_pdfs(pdfs, class_cache, workers=max(4, workers))
+        class_cache.close()
+        ctx.pdf_kinds.update(kinds)
+        counts = {kind: list(kinds.values()).count(kind) for kind in (TEXT, SCANNED, MIXED, UNKNOWN)}
+        notes.append(f"PDF 分类: 文本 {counts[TEXT]}，扫描 {counts[SCANNED]}，混合 {counts[MIXED]}，"
+                     f"未知 {counts[UNKNOWN]}（新分类 {classified} 个，其余来自缓存）")
+
+    # 代价估算：最长任务优先调度，并用于估计剩余时间
+    estimates = estimate_documents(documents, root, config, ctx, ctx.cost_model, workers)
+    ctx.estimates.update(estimates)
+    documents = list(documents)
+    if config["performance"].get("schedule", "longest_first") == "longest_first":
+        documents.sort(key=lambda d: estimates[d].seconds, reverse=True)
+
+    # marker 批处理：一个 marker 进程转换一批PDF，模型只加载一次
+    if ctx.marker is not None:
+        marker_docs = plan_marker_batch(documents, root, config, ctx)
+        if marker_docs:
+            timeouts = {d: job_timeout(d, "marker", config, ctx) for d in marker_docs}
+            batches = ctx.marker.schedule([(d, doc_output_dir(ctx.scratch, d)) for d in marker_docs], timeouts)
+            notes.append(f"marker 批处理: {len(marker_docs)} 个PDF，{batches} 批")
+            marker_set = set(marker_docs)
+            documents = [d for d in documents if d not in marker_set] + marker_docs
+    return documents, notes
+
+
+async def run_command(
+    cmd: List[str],
+    timeout: Optional[float],
+    slot: Optional[Slot] = None,
+    stats: Optional[JobStats] = None,
+    limits: Optional[EngineLimits] = None,
+) -> subprocess.CompletedProcess:
+    """
+    运行转换命令，启动后向准入控制登记子进程
+
+    参数:
+        stats: 记录启动耗时、运行耗时和子进程的资源使用
+        limits: 子进程的资源限制和优先级（启动后立即设置，RSS 上限在等待期间检查）
+
+    异常:
+        subprocess.TimeoutExpired: 超时（进程组已终止）
+        ResourceLimitExceeded: 超出资源限制
+    """
+    t0 = time.perf_counter()
+    started: List[float] = []
+
+    def on_start(pid: int) -> None:
+        started.append(time.perf_counter())
+        if slot is not None:
+            slot.attach(pid)
+
+    rusage = None
+    try:
+        proc, rusage = await run_process(cmd, timeout, limits, on_start)
+    except ResourceLimitExceeded as e:
+        rusage = e.rusage
+        raise
+    finally:
+        if stats is not None:
+            if started:
+                stats.add("spawn", started[0] - t0)
+                stats.add("tool", time.perf_counter() - started[0])
+            stats.add_rusage(rusage)
+    return proc
+
+
+def admit_job(ctx: RunContext, tool_name: str, split_ranges, config):
+    """按内存预算准入一个转换任务（分段提取按并行段数计权重；未启用准入控制时为空上下文）"""
+    if ctx.governor is None:
+        return nullcontext(None)
+    count = 1
+    if split_ranges:
+        split_workers = config["performance"].get("split_workers", 0) or (os.cpu_count() or 4)
+        count = min(len(split_ranges), split_workers)
+    return ctx.governor.admission_async(tool_name, count)
+
+
+async def execute_tool(
+    tool_name: str,
+    cmd: List[str],
+    doc_path: Path,
+    doc_out: Path,
+    split_ranges: Optional[List[Tuple[int, int]]],
+    timeout: Optional[float],
+    config,
+    ctx: RunContext,
+    slot: Optional[Slot] = None,
+    stats: Optional[JobStats] = None,
+) -> subprocess.CompletedProcess:
+    """运行转换工具（分段提取、进程池或子进程），返回统一的 CompletedProcess"""
+    pool = ctx.pool
+    if not split_ranges and not (pool is not None and tool_name in POOL_ENGINES):
+        return await run_command(cmd, timeout, slot, stats, limits_for(config, tool_name))
+
+    # 分段的 pdftotext 由 run_process 运行，资源使用逐段累加；进程池中的 Python 引擎只记录运行耗时，
+    # 常驻进程池的 worker 在启动时按 engine_limits.pdfminer 设置限制，CPU 时间按任务计。
+    # 与 run_command 相同，工具阶段从任务开始运行（取得 worker 或启动第一段）时计时，
+    # 等待进程池空出 worker 的时间计入 spawn，不会在争用时抬高代价模型的系数和自适应超时
+    t0 = time.perf_counter()
+    started: List[float] = []
+
+    def on_start() -> None:
+        if not started:
+            started.append(time.perf_counter())
+
+    try:
+        return await execute_in_pool(tool_name, cmd, doc_path, doc_out, split_ranges, timeout, config, ctx,
+                                     stats, on_start)
+    finally:
+        if stats is not None and started:
+            stats.add("spawn", started[0] - t0)
+            stats.add("tool", time.perf_counter() - started[0])
+
+
+async def execute_in_pool(
+    tool_name: str,
+    cmd: List[str],
+    doc_path: Path,
+    doc_out: Path,
+    split_ranges: Optional[List[Tuple[int, int]]],
+    timeout: Optional[float],
+    config,
+    ctx: RunContext,
+    stats: Optional[JobStats] = None,
+    on_start: Optional[Callable[[], None]] = None,
+) -> subprocess.CompletedProcess:
+    """分段并行提取，或交给 Python 引擎的常驻进程池（on_start 在任务开始运行时调用）"""
+    tools, pool = ctx.tools, ctx.pool
+    if split_ranges:
+        # 大PDF按页码范围分段并行提取，再按顺序拼接
+        split_workers = config["performance"].get("split_workers", 0) or (os.cpu_count() or 4)
+        try:
+            success, output = await extract_pdf_split(
+                tool_name, doc_path, doc_out, split_ranges, split_workers, timeout,
+                pdftotext_bin=(tools or get_default_registry()).path("pdftotext"), pool=pool,
+                limits=limits_for(config, tool_name), on_rusage=stats.add_rusage if stats is not None else None,
+                on_start=on_start,
+            )
+        except subprocess.TimeoutExpired:
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        proc = subprocess.CompletedProcess(cmd, 0 if success else 1, output, "")
+    else:
+        # Python 引擎交给常驻进程池，不再为每个文档启动解释器
+        try:
+            success, output = await pool.convert_async(tool_name, doc_path, doc_out, timeout, on_start)
+        except mp.TimeoutError:
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        proc = subprocess.CompletedProcess(cmd, 0 if success else 1, output, "")
+    return proc
+
+
+def locate_output(tool_name: str, doc_path: Path, doc_out: Path) -> Optional[Path]:
+    """找到引擎在 doc_out 中产生的输出文件（纯文本输出包装成 Markdown）"""
+    if tool_name == "pdftotext":
+        produced_file = doc_out / f"{doc_path.stem}.txt"
+        if not produced_file.exists():
+            produced_file = next(doc_out.rglob("*.txt"), None)
+    elif tool_name in ["antiword", "catdoc"]:
+        produced_file = doc_out / f"{doc_path.stem}.txt"
+        if not produced_file.exists():
+            produced_file = next(doc_out.rglob("*.txt"), None)
+        
+        if produced_file and produced_file.exists():
+            md_file = doc_out / f"{doc_path.stem}.md"
+            with open(produced_file, 'r', encoding='utf-8', errors='ignore') as f_in, \
+                 open(md_file, 'w', encoding='utf-8') as f_out:
+                f_out.write(f"# {doc_path.stem}\n\n")
+                f_out.write("```text\n")
+                f_out.write(f_in.read())
+                f_out.write("\n```\n")
+            produced_file = md_file
+    else:
+        produced_file = newest_md_in_dir(doc_out)
+    return produced_file
+
+
+async def run_engine(
+    tool_name: str,
+    cmd: List[str],
+    doc_path: Path,
+    doc_out: Path,
+    timeout: Optional[float],
+    config,
+    ctx: RunContext,
+    stats: Optional[JobStats] = None,
+) -> Tuple[Optional[Path], str, str]:
+    """
+    用一个引擎转换文档
+
+    返回:
+        (输出文件, 错误信息, 失败类型)；失败时输出文件为 None，失败类型见 TaskResult.failure
+    """
+    verbose_cmd = config["conversion"].get("verbose_cmd", False)
+    split_ranges = await blocking(ctx, plan_pdf_split, doc_path, tool_name, config, ctx.pool)
+    batch_ready, batch_msg = False, ""
+    if tool_name == "marker" and ctx.marker is not None and ctx.marker.has(doc_path):
+        # 批次失败时退回单独运行 marker
+        t_wait = time.perf_counter()
+        batch_ready, batch_msg = await ctx.marker.wait_async(doc_path)
+        if stats is not None:
+            # 批次运行时间按文档平分计入 tool，其余是排队和等待同批其他文档的时间
+            waited = time.perf_counter() - t_wait
+            share = min(waited, ctx.marker.seconds(doc_path) or 0.0)
+            stats.add("tool", share)
+            stats.add("batch", waited - share)
+            usage = ctx.marker.usage(doc_path)
+            if usage is not None:
+                stats.add_rusage(*usage)
+
+    reuse = tool_name == "marker" and not batch_ready and \
+        await blocking(ctx, reusable_marker_output, doc_out, doc_path, config)
+    try:
+        if batch_ready:
+            # 已在 marker 批次中转换，输出已放入 doc_out
+            proc = subprocess.CompletedProcess(cmd, 0, batch_msg, "")
+        elif reuse:
+            proc = subprocess.CompletedProcess(cmd, 0, "复用已有的 marker 输出", "")
+        else:
+            # 先等该引擎的并发名额，再按内存预算准入，排队时不占用内存预算
+            async with ctx.engine_slots.slot(tool_name):
+                async with admit_job(ctx, tool_name, split_ranges, config) as slot:
+                    proc = await execute_tool(tool_name, cmd, doc_path, doc_out, split_ranges, timeout, config,
+                                              ctx, slot, stats)
+    except subprocess.TimeoutExpired:
+        return None, f"{tool_name} 超时（{timeout:.0f}秒）", "timeout"
+    except ResourceLimitExceeded as e:
+        msg = f"{tool_name} 超出资源限制：{e.reason}"
+        if verbose_cmd:
+            details = (e.stderr or e.output or "").strip()[-600:]
+            if details:
+                msg += f"\n--- {tool_name} output tail ---\n{details}"
+        return None, msg, "limit"
+
+    if proc.returncode != 0:
+        stderr_tail = (proc.stderr or "").strip()[-1200:]
+        stdout_tail = (proc.stdout or "").strip()[-600:]
+        msg = f"{tool_name} 失败，exit code={proc.returncode}"
+        details = "\n".join([x for x in [stdout_tail, stderr_tail] if x])
+        if details:
+            msg += f"\n--- {tool_name} output tail ---\n{details}"
+        if verbose_cmd:
+            msg += f"\ncmd={shlex.join(cmd) if not '>' in ' '.join(cmd) else ' '.join(cmd)}"
+        return None, msg, "error"
+
+    if tool_name == "marker" and not batch_ready:
+        await blocking(ctx, mark_output_complete, doc_out, doc_path)
+    produced_file = await blocking(ctx, locate_output, tool_name, doc_path, doc_out)
+    if produced_file is None:
+        stderr_tail = (proc.stderr or "").strip()[-1200:]
+        stdout_tail = (proc.stdout or "").strip()[-1200:]
+        msg = (
+            f"{tool_name} 返回成功，但在输出目录里没有找到任何输出文件。\n"
+            f"输出目录：{doc_out}\n"
+            "请用 --verbose-cmd 查看实际输出了什么，或检查工具是否输出为其他格式。"
+        )
+        details = "\n".join([x for x in [stdout_tail, stderr_tail] if x])
+        if details:
+            msg += f"\n--- {tool_name} output tail ---\n{details}"
+        return None, msg, "error"
+    return produced_file, "", ""
+
+
+async def run_one(
     doc_path: Path,
     root: Path,
     config,
     dry_run: bool,
     delete_manager: Optional[DeleteManager] = None,
+    ctx: Optional[RunContext] = None,
+) -> TaskResult:
+    """转换一个文档，结果附带各阶段耗时和子进程资源使用"""
+    stats = JobStats()
+    t0 = time.perf_counter()
+    try:
+        result = await convert_document(doc_path, root, config, dry_run, delete_manager, ctx, stats)
+    except asyncio.CancelledError:
+        # 被第二次 Ctrl-C 取消：子进程已终止，日志中保留开始记录，--resume 时重新排队
+        return TaskResult(doc_path, compute_final_md_path(doc_path, config), "failed", time.perf_counter() - t0,
+                          "已中断", failure="cancelled", stats=stats)
+    return replace(result, stats=stats)
+
+
+async def convert_document(
+    doc_path: Path,
+    root: Path,
+    config,
+    dry_run: bool,
+    delete_manager: Optional[DeleteManager],
+    ctx: Optional[RunContext],
+    stats: JobStats,
 ) -> TaskResult:
     t0 = time.perf_counter()
     final_md = compute_final_md_path(doc_path, config)
+    ctx = ctx or RunContext()
+    tools, pool, cache, manifest = ctx.tools, ctx.pool, ctx.cache, ctx.manifest
 
     # 辅助函数：从嵌套字典获取值
     def get_nested(config_dict, key_path: str, default: Any = None) -> Any:
@@ -308,22 +951,28 @@ def run_one(
     #     print(f"[DEBUG]   delete_manager.delete_source: {delete_manager.delete_source}")
     #     print(f"[DEBUG]   delete_manager.delete_mode: {delete_manager.delete_mode}")
 
-    force = get_nested(config, "conversion.force", False)
+    if doc_path in ctx.resumed:
+        return TaskResult(doc_path, final_md, "skipped", time.perf_counter() - t0, "上次运行已完成（输出校验一致）")
+
+    force = get_nested(config, "conversion.force", False) or doc_path in ctx.requeue
     # print(f"[DEBUG]   force: {force}")
-    if final_md.exists() and not force:
+    skip_reason = await blocking(ctx, up_to_date_reason, doc_path, final_md, force, manifest, dry_run)
+    stats.add("scan", time.perf_counter() - t0)
+    if skip_reason:
         # print(f"[DEBUG]   文件已存在，跳过转换")
-        return TaskResult(doc_path, final_md, "skipped", time.perf_counter() - t0, "目标 Markdown 已存在，跳过（用 --force 覆盖）")
+        return TaskResult(doc_path, final_md, "skipped", time.perf_counter() - t0, skip_reason)
     
     # 转换前删除（如果配置要求）
     delete_before_msg = ""
     if delete_manager and delete_manager.delete_source:
+        t_delete = time.perf_counter()
         delete_mode = delete_manager.delete_mode
         print(f"[DEBUG]   检查转换前删除，模式: {delete_mode}")
         if delete_mode == "before_conversion":
             # 转换前删除
             print(f"[DEBUG]   执行转换前删除")
-            delete_success, delete_msg = delete_manager.delete_source_file(
-                doc_path, final_md, dry_run, user_confirmed=False
+            delete_success, delete_msg = await blocking(
+                ctx, delete_manager.delete_source_file, doc_path, final_md, dry_run, user_confirmed=False
             )
             if delete_success:
                 delete_before_msg = f", 转换前删除: {delete_msg}"
@@ -332,130 +981,502 @@ def run_one(
                 # 如果转换前删除失败，可以继续尝试转换
                 delete_before_msg = f", 转换前删除失败: {delete_msg}"
                 print(f"[DEBUG]   转换前删除失败: {delete_msg}")
+        stats.add("delete", time.perf_counter() - t_delete)
 
-    base_out = root / "_marker_outputs"
-    doc_out = base_out / f"{safe_stem(doc_path)}__{abs(hash(str(doc_path))) % 10**8}"
-    if doc_out.exists() and force and not dry_run:
-        shutil.rmtree(doc_out, ignore_errors=True)
+    doc_out = doc_output_dir(ctx.scratch or root / LEGACY_DIR_NAME, doc_path)
+    batched = ctx.marker is not None and ctx.marker.has(doc_path)
+    # 源文件未变化的完整 marker 输出可以直接复用（中断的运行按文档粒度续跑）；其余残留输出先清理
+    reuse_marker = await blocking(ctx, reusable_marker_output, doc_out, doc_path, config)
+    if not dry_run:
+        await blocking(ctx, remove_doc_outputs, doc_out, keep_marker=batched or reuse_marker)
 
     try:
-        tool_name, cmd = build_converter_cmd(doc_path, doc_out)
+        with stats.stage("probe"):
+            chain = await blocking(ctx, converter_chain, doc_path, tools, config, ctx.pdf_kinds.get(doc_path))
     except ValueError as e:
-        return TaskResult(doc_path, final_md, "failed", time.perf_counter() - t0, str(e))
+        return TaskResult(doc_path, final_md, "failed", time.perf_counter() - t0, str(e), failure="error")
+    if reuse_marker and "marker" in chain:
+        chain = ["marker"]
+    tool_name = chain[0]
+    cmd = build_engine_cmd(tool_name, doc_path, attempt_output_dir(doc_out, tool_name), tools)
 
     if dry_run:
         return TaskResult(doc_path, final_md, "skipped", time.perf_counter() - t0, "dry-run：未执行", cmd=cmd)
 
-    doc_out.mkdir(parents=True, exist_ok=True)
+    if ctx.journal is not None:
+        await blocking(ctx, ctx.journal.start, doc_path, final_md)
 
-    timeout = config.get("performance.timeout", 0)
-    timeout = None if timeout <= 0 else timeout
-    verbose_cmd = config.get("conversion.verbose_cmd", False)
-    
+    # 转换缓存：同样内容、同样工具版本的文档已转换过则直接落地缓存结果
+    # （按转换链顺序查找，之前升级到昂贵引擎的结果同样可以命中）
+    cache_keys: Dict[str, str] = {}
+    if cache is not None:
+        try:
+            with stats.stage("probe"):
+                content_hash = await blocking(ctx, content_hash_for, ctx, doc_path)
+            for engine in chain:
+                with stats.stage("probe"):
+                    cache_keys[engine] = await blocking(ctx, cache_key_for, cache, doc_path, engine, tools,
+                                                        content_hash)
+                with stats.stage("copy"):
+                    hit = await blocking(ctx, cache.materialize, cache_keys[engine], final_md)
+                if hit:
+                    if manifest is not None:
+                        await blocking(ctx, manifest.record, doc_path, final_md, engine)
+                    with stats.stage("delete"):
+                        delete_after_msg = await blocking(ctx, delete_after_conversion, delete_manager, doc_path,
+                                                          final_md, dry_run)
+                    return TaskResult(doc_path, final_md, "ok", time.perf_counter() - t0,
+                                     f"缓存命中{delete_before_msg}{delete_after_msg}", cmd=cmd)
+        except OSError as e:
+            cache_keys = {}
+            print(f"警告: 转换缓存不可用 {doc_path}: {e}")
+
+    # 转换链：依次尝试各引擎；非最后一个引擎失败、超时或输出质量不合格时升级到下一个
+    fallback = config.get("fallback") or {}
+    attempts: List[str] = []
+    produced_file, failure = None, ""
     try:
-        if '>' in ' '.join(cmd):
-            proc = subprocess.run(
-                ' '.join(cmd),
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=timeout,
-            )
-        else:
-            proc = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=timeout,
-            )
+        for index, tool_name in enumerate(chain):
+            last = index == len(chain) - 1
+            # 每个引擎写到自己的目录，上一个引擎（即使被终止）留下的文件不会被误认为本次结果
+            engine_out = attempt_output_dir(doc_out, tool_name)
+            engine_out.mkdir(parents=True, exist_ok=True)
+            cmd = build_engine_cmd(tool_name, doc_path, engine_out, tools)
+
+            timeout = await blocking(ctx, job_timeout, doc_path, tool_name, config, ctx)
+            if not last and tool_name not in EXPENSIVE_ENGINES:
+                # 廉价引擎只给较短的时间，卡住时尽快升级
+                cheap_timeout = fallback.get("cheap_timeout", 60)
+                if cheap_timeout > 0:
+                    timeout = min(timeout, cheap_timeout) if timeout else cheap_timeout
+            if tool_name == "marker" and index > 0 and ctx.marker is not None:
+                # 升级到 marker 的文档加入攒批队列，和其他升级的文档共用一次模型加载
+                ctx.marker.enqueue(doc_path, engine_out, timeout)
+
+            produced_file, error, failure = await run_engine(tool_name, cmd, doc_path, engine_out, timeout,
+                                                             config, ctx, stats)
+            if produced_file is None:
+                attempts.append(error)
+                continue
+            if last or tool_name in EXPENSIVE_ENGINES:
+                # 昂贵引擎的输出不会比廉价引擎差，不再因质量检查降级
+                break
+            estimate = ctx.estimates.get(doc_path)
+            with stats.stage("check"):
+                pages = estimate.pages if estimate is not None else await blocking(ctx, count_pages, doc_path)
+                passed, reason = await blocking(
+                    ctx, check_output_quality,
+                    produced_file,
+                    pages=pages,
+                    min_chars=fallback.get("min_chars", 20),
+                    min_chars_per_page=fallback.get("min_chars_per_page", 30),
+                    max_garbage_ratio=fallback.get("max_garbage_ratio", 0.1),
+                )
+            if passed:
+                break
+            attempts.append(f"{tool_name} 输出质量不合格：{reason}")
+            produced_file = None
 
-        if proc.returncode != 0:
-            stderr_tail = (proc.stderr or "").strip()[-1200:]
-            stdout_tail = (proc.stdout or "").strip()[-600:]
-            msg = f"{tool_name} 失败，exit code={proc.returncode}"
-            details = "\n".join([x for x in [stdout_tail, stderr_tail] if x])
-            if details:
-                msg += f"\n--- {tool_name} output tail ---\n{details}"
-            if verbose_cmd:
-                msg += f"\ncmd={shlex.join(cmd) if not '>' in ' '.join(cmd) else ' '.join(cmd)}"
-            return TaskResult(doc_path, final_md, "failed", time.perf_counter() - t0, msg, cmd=cmd)
-
-        suffix = doc_path.suffix.lower()
-        if tool_name == "pdftotext":
-            produced_file = doc_out / f"{doc_path.stem}.txt"
-            if not produced_file.exists():
-                produced_file = next(doc_out.rglob("*.txt"), None)
-        elif tool_name in ["antiword", "catdoc"]:
-            produced_file = doc_out / f"{doc_path.stem}.txt"
-            if not produced_file.exists():
-                produced_file = next(doc_out.rglob("*.txt"), None)
-            
-            if produced_file and produced_file.exists():
-                md_file = doc_out / f"{doc_path.stem}.md"
-                with open(produced_file, 'r', encoding='utf-8', errors='ignore') as f_in, \
-                     open(md_file, 'w', encoding='utf-8') as f_out:
-                    f_out.write(f"# {doc_path.stem}\n\n")
-                    f_out.write("```text\n")
-                    f_out.write(f_in.read())
-                    f_out.write("\n```\n")
-                produced_file = md_file
-        else:
-            produced_file = newest_md_in_dir(doc_out)
-            
         if produced_file is None:
-            stderr_tail = (proc.stderr or "").strip()[-1200:]
-            stdout_tail = (proc.stdout or "").strip()[-1200:]
-            msg = (
-                f"{tool_name} 返回成功，但在输出目录里没有找到任何输出文件。\n"
-                f"输出目录：{doc_out}\n"
-                "请用 --verbose-cmd 查看实际输出了什么，或检查工具是否输出为其他格式。"
-            )
-            details = "\n".join([x for x in [stdout_tail, stderr_tail] if x])
-            if details:
-                msg += f"\n--- {tool_name} output tail ---\n{details}"
-            return TaskResult(doc_path, final_md, "failed", time.perf_counter() - t0, msg, cmd=cmd)
+            return TaskResult(doc_path, final_md, "failed", time.perf_counter() - t0,
+                             "\n".join(attempts), cmd=cmd, failure=failure or "error")
 
-        # 复制到最终位置
+        t_copy = time.perf_counter()
+        if tool_name in cache_keys:
+            await blocking(ctx, cache.store, cache_keys[tool_name], produced_file)
+        
+        # 原子发布到最终位置：不保留中间输出且同一文件系统时直接 rename，否则复制到临时文件再 rename
+        # （rename 替换目录项，目标即使是缓存条目的硬链接也不会改写缓存）
+        keep_outputs = config["conversion"].get("keep_outputs", False)
         if produced_file != final_md:
-            shutil.copy2(produced_file, final_md)
+            await blocking(ctx, publish_file, produced_file, final_md, move=not keep_outputs)
+        stats.add("copy", time.perf_counter() - t_copy)
+        if manifest is not None:
+            await blocking(ctx, manifest.record, doc_path, final_md, tool_name)
         
         # 转换后删除（如果配置要求且不是转换前删除模式）
-        delete_after_msg = ""
-        if delete_manager and delete_manager.delete_source:
-            delete_mode = delete_manager.delete_mode
-            print(f"[DEBUG]   检查转换后删除，模式: {delete_mode}")
-            if delete_mode == "after_conversion":
-                # 转换后删除
-                print(f"[DEBUG]   执行转换后删除")
-                delete_success, delete_msg = delete_manager.delete_source_file(
-                    doc_path, final_md, dry_run, user_confirmed=False
-                )
-                if delete_success:
-                    delete_after_msg = f", 转换后删除: {delete_msg}"
-                    print(f"[DEBUG]   转换后删除成功: {delete_msg}")
-                else:
-                    delete_after_msg = f", 转换后删除失败: {delete_msg}"
-                    print(f"[DEBUG]   转换后删除失败: {delete_msg}")
+        with stats.stage("delete"):
+            delete_after_msg = await blocking(ctx, delete_after_conversion, delete_manager, doc_path, final_md,
+                                              dry_run)
         
         # 清理临时输出目录（如果配置要求）
-        keep_outputs = config.get("conversion.keep_outputs", False)
-        if not keep_outputs and doc_out.exists() and not dry_run:
-            shutil.rmtree(doc_out, ignore_errors=True)
+        if not keep_outputs and not dry_run:
+            await blocking(ctx, remove_doc_outputs, doc_out)
         
         delete_msg = delete_before_msg + delete_after_msg
+        escalated = f"（{'；'.join(a.splitlines()[0] for a in attempts)} → {tool_name}）" if attempts else ""
         return TaskResult(doc_path, final_md, "ok", time.perf_counter() - t0, 
-                         f"转换成功{delete_msg}", cmd=cmd)
+                         f"转换成功{escalated}{delete_msg}", cmd=cmd, engine=tool_name)
         
-    except subprocess.TimeoutExpired:
-        return TaskResult(doc_path, final_md, "failed", time.perf_counter() - t0, 
-                         f"{tool_name} 超时（{timeout}秒）", cmd=cmd)
     except Exception as e:
         return TaskResult(doc_path, final_md, "failed", time.perf_counter() - t0, 
-                         f"执行异常: {e}", cmd=cmd)
+                         f"执行异常: {e}", cmd=cmd, failure="error")
+
+
+def prepare_resume(documents: List[Path], root: Path, config, ctx: RunContext, state: JournalState) -> None:
+    """
+    按重放的日志准备续跑：输出校验一致的已完成文档放入 ctx.resumed，
+    中断（已开始未结束）或输出与记录不符的文档放入 ctx.requeue，并清理它们的发布临时文件和中间输出
+    """
+    for doc_path in documents:
+        final_md = compute_final_md_path(doc_path, config)
+        if state.verified(doc_path, final_md):
+            ctx.resumed.add(doc_path)
+            continue
+        if str(doc_path) not in state.in_flight and str(doc_path) not in state.completed:
+            continue
+        ctx.requeue.add(doc_path)
+        # 发布时被中断留下的临时文件（最终文件本身通过 rename 发布，不会写了一半）
+        for tmp in final_md.parent.glob(f".{final_md.name}.*.tmp"):
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+        # 完整的 marker 输出保留下来直接复用，其余中间输出清理掉
+        doc_out = doc_output_dir(ctx.scratch or root / LEGACY_DIR_NAME, doc_path)
+        remove_doc_outputs(doc_out, keep_marker=reusable_marker_output(doc_out, doc_path, config))
+
+
+def journal_result(journal: Optional[RunJournal], result: TaskResult) -> None:
+    """把任务结果写入运行日志（跳过的任务不记录）"""
+    if journal is None:
+        return
+    if result.status == "ok":
+        journal.done(result.doc_path, result.md_path, result.engine)
+    elif result.status == "failed" and result.failure != "cancelled":
+        # 被取消的文档只留开始记录，--resume 时按中断处理
+        journal.fail(result.doc_path, result.message, result.failure)
+
+
+def record_result(journal: Optional[RunJournal], queue: Optional[JobQueue], result: TaskResult) -> None:
+    """把任务结果写入运行日志和任务队列（两者都可能阻塞：fsync、共享存储上的任务库）"""
+    journal_result(journal, result)
+    queue_result(queue, result)
+
+
+def queue_result(queue: Optional[JobQueue], result: TaskResult) -> None:
+    """把任务结果记入任务队列：被中断的任务交还队列，其余记为完成或失败（跳过的文档算完成）"""
+    if queue is None:
+        return
+    if result.failure == "cancelled":
+        queue.release([result.doc_path])
+    else:
+        queue.complete(result.doc_path, result.status != "failed", result.message, result.failure)
+
+
+def warn_record_failure(future: cf.Future) -> None:
+    error = future.exception()
+    if error is not None:
+        print(red(f"警告: 无法记录任务结果: {error}"))
+
+
+def format_queue_counts(counts: Dict[str, int]) -> str:
+    return (f"待领取 {counts['pending']}，处理中 {counts['leased']}，"
+            f"完成 {counts['done']}，失败 {counts['failed']}")
+
+
+def enqueue_documents(queue: JobQueue, documents: List[Path], root: Path, config, retry_failed: bool = False) -> None:
+    """
+    把扫描到的文档加入任务队列
+
+    longest_first 调度时按文件大小从大到小领取（入队时不读取文件内容，页数等由 worker 领取后估算）
+    """
+    longest_first = config["performance"].get("schedule", "longest_first") == "longest_first"
+
+    def with_priority():
+        for doc_path in documents:
+            priority = 0.0
+            if longest_first:
+                try:
+                    priority = -float(doc_path.stat().st_size)
+                except OSError:
+                    pass
+            yield doc_path, priority
+
+    try:
+        added, retried = queue.enqueue(root, with_priority(), retry_failed=retry_failed)
+    except ValueError as e:
+        print(red("[FATAL]"), str(e))
+        sys.exit(1)
+    print(f"任务队列 {queue.db_path}: 扫描到 {len(documents)} 个文档，新加入 {added} 个"
+          + (f"，失败任务重新排队 {retried} 个" if retried else ""))
+    print(f"  {format_queue_counts(queue.counts())}")
+
+
+def log_result(run_log: Optional[RunLog], result: TaskResult, estimates: Dict[Path, JobEstimate]) -> None:
+    """把任务结果写入逐文件运行记录"""
+    if run_log is None:
+        return
+    estimate = estimates.get(result.doc_path)
+    run_log.write(
+        result.doc_path, result.status, result.engine, result.seconds, result.stats,
+        input_bytes=estimate.size_bytes if estimate is not None else None,
+        pages=estimate.pages if estimate is not None else None,
+        message=result.message,
+        failure=result.failure,
+    )
+
+
+def observe_cost(model: CostModel, estimate: Optional[JobEstimate], result: TaskResult) -> None:
+    """
+    用工具阶段的耗时更新代价模型
+
+    只在第一个引擎就转换成功时学习（估算按转换链的第一个引擎）；
+    准入排队、marker 批次等待、哈希和复制等不属于引擎本身的时间不计入
+    """
+    if not result.engine or estimate is None or estimate.engine != result.engine or result.stats is None:
+        return
+    seconds = result.stats.stages.get("tool", 0.0)
+    if seconds > 0:
+        model.observe(estimate, seconds)
+
+
+def record_progress(
+    result: TaskResult,
+    estimates: Dict[Path, JobEstimate],
+    model: CostModel,
+    progress: ProgressEstimator,
+) -> str:
+    """用完成的任务更新代价模型和进度估计，返回剩余时间文本"""
+    estimate = estimates.get(result.doc_path)
+    observe_cost(model, estimate, result)
+    progress.finish(estimate, skipped=result.status == "skipped")
+    return format_eta(progress.eta_seconds())
+
+
+async def run_documents(
+    documents: List[Path],
+    root: Path,
+    config,
+    dry_run: bool,
+    delete_manager: Optional[DeleteManager],
+    ctx: RunContext,
+    limit: Callable[[], int],
+    report: Callable[[TaskResult], None],
+    feed: Optional[Callable[[], Awaitable[Optional[List[Path]]]]] = None,
+    feed_poll: float = QUEUE_POLL,
+) -> List[Path]:
+    """
+    在事件循环中按给定顺序转换文档，同时运行的文档数不超过 limit()
+
+    参数:
+        report: 每个文档结束时以 TaskResult 调用（在事件循环线程中，按完成顺序）
+        feed: 待办文档少于 limit() 时调用，取得更多文档（任务队列模式、监视模式）；
+            返回空列表表示暂时没有，feed_poll 秒后再试，返回 None 表示不会再有
+        feed_poll: feed 暂时没有文档时的重试间隔（feed 自身会阻塞等待时为 0）
+
+    返回:
+        因 Ctrl-C 而没有开始的文档
+    """
+    loop = asyncio.get_running_loop()
+
+    def on_done(doc_path: Path, task: asyncio.Task) -> None:
+        if task.cancelled():
+            result = TaskResult(doc_path, compute_final_md_path(doc_path, config), "failed", 0.0, "已中断",
+                                failure="cancelled")
+        elif task.exception() is not None:
+            result = TaskResult(doc_path, compute_final_md_path(doc_path, config), "failed", 0.0,
+                                f"执行异常: {task.exception()}", failure="error")
+        else:
+            result = task.result()
+        report(result)
 
+    orchestrator = Orchestrator(limit, on_done)
+    order = itertools.count()
+
+    def submit(doc_path: Path) -> None:
+        orchestrator.submit(doc_path, partial(run_one, doc_path, root, config, dry_run, delete_manager, ctx),
+                            priority=next(order))
+
+    async def keep_fed() -> None:
+        try:
+            while not orchestrator.stopping:
+                if orchestrator.pending >= max(1, limit()):
+                    await asyncio.sleep(0.1)
+                    continue
+                more = await feed()
+                if more is None:
+                    break
+                if not more and feed_poll > 0:
+                    await asyncio.sleep(feed_poll)
+                for doc_path in more:
+                    submit(doc_path)
+        finally:
+            orchestrator.close()
+
+    for doc_path in documents:
+        submit(doc_path)
+    feeder = None
+    if feed is not None:
+        orchestrator.hold_open()
+        feeder = asyncio.ensure_future(keep_fed())
+    install_interrupt_handler(loop, orchestrator, report=lambda message: print(yellow(message)))
+    try:
+        return await orchestrator.run()
+    finally:
+        if feeder is not None:
+            feeder.cancel()
+            with suppress(asyncio.CancelledError):
+                await feeder
+
+
+def build_run_context(config, tools: ToolRegistry, root: Path, python_workers: int, dry_run: bool) -> RunContext:
+    """
+    创建各任务共享的资源：Python 引擎进程池、转换缓存、临时目录、内存准入、marker 批处理和代价模型
 
+    参数:
+        python_workers: performance.python_workers 未配置时 Python 引擎进程池的进程数
+    """
+    # Python 后备引擎的常驻进程池（首次使用时才启动）
+    pool = PythonWorkerPool(
+        processes=config["performance"].get("python_workers", 0) or python_workers,
+        max_jobs_per_worker=config["performance"].get("worker_max_jobs", 50),
+        limits=limits_for(config, "pdfminer"),
+    )
+    
+    # 跨运行共享的转换缓存（配置了缓存目录时启用）
+    cache = None
+    cache_dir = config["cache"].get("dir", "")
+    if cache_dir:
+        cache = ConversionCache(
+            Path(cache_dir),
+            max_size_mb=config["cache"].get("max_size_mb", 10240),
+            link_mode=config["cache"].get("link_mode", "reflink"),
+        )
+        print(f"转换缓存: {cache.cache_dir}")
+    
+    ctx = RunContext(tools=tools, pool=pool, cache=cache, cost_model=CostModel())
+    
+    # 中间输出写到本地磁盘或 tmpfs 上的临时目录
+    ctx.scratch = choose_scratch_dir(config["performance"].get("scratch_dir", ""), root,
+                                     config["performance"].get("scratch_min_free_mb", 1024))
+    if not dry_run:
+        ctx.scratch.mkdir(parents=True, exist_ok=True)
+        print(f"临时目录: {ctx.scratch}")
+    
+    # 按内存预算准入：重型工具（marker）的并发受内存限制，轻量工具不受影响
+    governor = MemoryGovernor(config["performance"].get("memory_budget_mb", 0),
+                              config["performance"].get("memory_weights") or {})
+    if governor.enabled and not dry_run:
+        ctx.governor = governor
+        print(f"内存预算: {governor.budget_mb} MB")
+    for engine in (config["performance"].get("engine_limits") or {}):
+        limits = limits_for(config, engine)
+        if limits.active:
+            print(f"资源限制: {engine}: {limits.describe()}")
+
+    # marker 批处理：一个 marker 进程转换一批PDF，模型只加载一次
+    # （转换链从 marker 开始的文档在 prepare_documents 中安排，升级到 marker 的文档在升级时攒批）
+    batch_size = config["performance"].get("marker_batch_size", 8)
+    if not dry_run and batch_size > 1 and "pdf" in config["file_types"] and tools.available("marker"):
+        marker_info = tools.get("marker")
+        output_flag = "--output_dir" if marker_info.supports("--output_dir") else "--output"
+        timeout = config["performance"].get("timeout", 0)
+        ctx.marker = MarkerBatcher(marker_info.path, ctx.scratch, batch_size,
+                                   output_flag=output_flag, timeout=timeout if timeout > 0 else None,
+                                   governor=ctx.governor, limits=limits_for(config, "marker"),
+                                   linger=config["performance"].get("marker_batch_linger", 2.0))
+    
+    ctx.engine_slots = EngineSlots(config["performance"].get("engine_concurrency") or {})
+    return ctx
+
+
+def open_run_log(config, dry_run: bool) -> Optional[RunLog]:
+    """逐文件运行记录（JSON Lines，需配置 performance.run_log 或 --run-log）"""
+    run_log_path = config["performance"].get("run_log", "")
+    if not run_log_path or dry_run:
+        return None
+    run_log = RunLog(Path(run_log_path).expanduser())
+    print(f"运行记录: {run_log.path}")
+    return run_log
+
+
+def serve_documents(config, tools: ToolRegistry, root: Path) -> int:
+    """
+    作为常驻转换服务运行（--serve），直到 SIGINT/SIGTERM
+
+    Python 引擎进程池在启动时预热，marker 按请求的到达时间成批转换；
+    服务中不删除源文件，也不写增量清单和运行日志（journal），每个请求的结果直接回答给调用方
+
+    返回:
+        退出码
+    """
+    workers = config["performance"]["workers"]
+    cpus = os.cpu_count() or 4
+    if workers == "auto" or workers <= 0:
+        workers = cpus
+    serve_config = config["serve"]
+    suffixes = {f".{t}" for t in config["file_types"]}
+    
+    print(bold("文档转换服务 → Markdown"))
+    print(f"根目录: {root}")
+    print(f"文件类型: {', '.join(config['file_types'])} | workers={workers} | force={config['conversion']['force']}")
+    print("-" * 72)
+    
+    ctx = build_run_context(config, tools, root, python_workers=workers, dry_run=False)
+    ctx.pool.start()
+    run_log = open_run_log(config, dry_run=False)
+    keep_outputs = config["conversion"]["keep_outputs"]
+    forced = {**config, "conversion": {**config["conversion"], "force": True}}
+    upload_dir = Path(serve_config.get("upload_dir") or ctx.scratch / "_uploads").expanduser()
+    
+    async def prepare(batch: List[Path]) -> List[Path]:
+        order, notes = await blocking(ctx, prepare_documents, batch, root, config, ctx, workers)
+        for note in notes:
+            print(dim(note))
+        return order
+    
+    async def convert(doc_path: Path, force: bool) -> TaskResult:
+        result = await run_one(doc_path, root, forced if force else config, False, None, ctx)
+        log_result(run_log, result, ctx.estimates)
+        # 常驻进程中按文档记录的状态在回答后丢弃，不随请求数增长
+        observe_cost(ctx.cost_model, ctx.estimates.pop(doc_path, None), result)
+        ctx.pdf_kinds.pop(doc_path, None)
+        ctx.content_hashes.pop(doc_path, None)
+        if ctx.marker is not None:
+            ctx.marker.forget(doc_path)
+        if not keep_outputs:
+            await blocking(ctx, remove_doc_outputs, doc_output_dir(ctx.scratch, doc_path))
+        status_color = {"ok": green("OK"), "skipped": yellow("SKIP"), "failed": red("FAIL")}.get(result.status)
+        print(f"{status_color:6} {doc_path}  {result.message}  {dim(f'{result.seconds:.2f}s')}")
+        return result
+    
+    def status() -> Dict[str, Any]:
+        engines = {tool for kind in config["file_types"] for tool in config.get("tool_priority", {}).get(kind, [])}
+        return {"engines": sorted(name for name in engines if name in BUILTIN_ENGINES or tools.available(name))}
+    
+    server = ConversionServer(
+        root, suffixes, limit=lambda: workers, convert=convert, prepare=prepare,
+        upload_dir=upload_dir,
+        max_upload_bytes=serve_config.get("max_upload_mb", 512) * 1024 * 1024,
+        batch_window=serve_config.get("batch_window", 0.2) if ctx.marker is not None else 0.0,
+        status=status,
+        log=lambda message: print(yellow(message)),
+    )
+    
+    async def run() -> None:
+        await server.serve(serve_config.get("listen", "127.0.0.1:8765"),
+                           ready=lambda address: print(green(f"监听: {address}")))
+    
+    ctx.io = cf.ThreadPoolExecutor(max_workers=min(32, workers + 4), thread_name_prefix="doc-io")
+    code = 0
+    try:
+        asyncio.run(run())
+    except (OSError, ValueError) as e:
+        print(red("[FATAL]"), f"无法启动服务: {e}")
+        code = 1
+    finally:
+        ctx.io.shutdown(wait=True)
+        ctx.pool.close()
+        if ctx.marker is not None:
+            ctx.marker.shutdown()
+        ctx.cost_model.save()
+        if run_log is not None:
+            run_log.close()
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        remove_empty_dir(ctx.scratch)
+    print(f"已处理请求: {server.served}（失败 {server.failed}）")
+    return code
 
 
 def main() -> None:
@@ -486,8 +1507,10 @@ def main() -> None:
     
     # 检查转换工具
     file_types = config_mgr.get("file_types", ["pdf", "docx"])
+    tools = ToolRegistry(use_cache=config_mgr.get("performance.probe_cache", True))
+    tools.probe_all()
     try:
-        ensure_converter_exists(file_types)
+        ensure_converter_exists(file_types, tools)
     except RuntimeError as e:
         print(red("[FATAL]"), str(e))
         sys.exit(1)
@@ -495,6 +1518,39 @@ def main() -> None:
     # 获取配置
     config = config_mgr.config
     root = Path.cwd()
+    include_types = config["file_types"]
+    include_hidden = config["conversion"]["include_hidden"]
+    exclude_dirs = config["file_handling"]["exclude_dirs"]
+    
+    # 常驻转换服务：配置、工具探测和进程池只初始化一次，之后按请求转换
+    if args.serve is not None:
+        if config["queue"].get("db") or args.enqueue or args.watch or args.dry_run:
+            print(red("[FATAL]"), "--serve 不能与 --queue、--enqueue、--watch 或 --dry-run 同时使用")
+            sys.exit(1)
+        sys.exit(serve_documents(config, tools, root))
+    
+    # 多机任务队列：--enqueue 扫描并入队后退出；否则作为 worker 从任务库领取文档
+    queue = None
+    queue_db = config["queue"].get("db", "")
+    if queue_db:
+        queue = JobQueue(Path(queue_db).expanduser(), lease_seconds=config["queue"].get("lease_seconds", 300),
+                         max_attempts=config["queue"].get("max_attempts", 3))
+        if args.enqueue:
+            documents = find_documents(root, include_types, include_hidden, exclude_dirs)
+            enqueue_documents(queue, documents, root, config, retry_failed=args.retry_failed)
+            queue.close()
+            sys.exit(0)
+        queue_root = queue.root
+        if queue_root is None:
+            print(red("[FATAL]"), f"任务库 {queue.db_path} 中没有任务（先在根目录下用 --enqueue 入队）")
+            sys.exit(1)
+        if not queue_root.is_dir():
+            print(red("[FATAL]"), f"任务库的根目录 {queue_root} 在本机不存在（各机器需在相同路径挂载共享存储）")
+            sys.exit(1)
+        root = queue_root
+    elif args.enqueue:
+        print(red("[FATAL]"), "--enqueue 需要用 --queue 指定任务库")
+        sys.exit(1)
     
     # 创建DeleteManager实例
     delete_manager = None
@@ -506,101 +1562,273 @@ def main() -> None:
         if config["file_handling"]["use_trash"]:
             print("将使用系统回收站（如果可用）")
     
-    # 查找文档
-    include_types = config["file_types"]
-    include_hidden = config["conversion"]["include_hidden"]
-    exclude_dirs = config["file_handling"]["exclude_dirs"]
+    # 监视模式：先建立监视再做初次扫描，扫描期间新建的文件不会遗漏
+    dry_run = args.dry_run
+    watcher = None
+    if args.watch:
+        if queue is not None or dry_run:
+            print(red("[FATAL]"), "--watch 不能与 --queue 或 --dry-run 同时使用")
+            sys.exit(1)
+        # 被修改的文档需要重新转换：按增量模式的清单判断，而不是只看 Markdown 是否存在
+        config["conversion"]["incremental"] = True
+        accept, skip_dir = document_filters(root, include_types, include_hidden, exclude_dirs)
+        watch_config = config["watch"]
+        watcher = TreeWatcher(root, accept, skip_dir,
+                              settle=watch_config.get("settle_seconds", 2.0),
+                              poll_interval=watch_config.get("poll_interval", 5.0),
+                              use_inotify=not watch_config.get("force_poll", False))
     
-    documents = find_documents(root, include_types, include_hidden, exclude_dirs)
+    # 查找文档（worker 从任务队列陆续领取，不扫描目录）
+    if queue is not None:
+        documents = []
+        counts = queue.counts()
+        planned = counts["pending"] + counts["leased"]
+        if not planned or dry_run:
+            print(f"任务队列 {queue.db_path}: {format_queue_counts(counts)}")
+            queue.close()
+            sys.exit(0)
+    else:
+        documents = find_documents(root, include_types, include_hidden, exclude_dirs)
+        planned = len(documents)
+        if watcher is not None:
+            # 监视模式下文档陆续到来，并发按机器规模而不是初次扫描的文档数确定
+            planned = max(planned, (os.cpu_count() or 4) * 4)
     
-    if not documents:
+    if not planned:
         print(yellow("未找到任何"), ", ".join(include_types), yellow("文件。"))
         print("当前目录:", root)
         sys.exit(0)
     
     # 显示计划
-    dry_run = args.dry_run
     workers = config["performance"]["workers"]
-    if workers <= 0:
-        workers = min(len(documents), os.cpu_count() or 4)
+    cpus = os.cpu_count() or 4
+    tuner = None
+    if workers == "auto":
+        # 自动调节：活动任务数由调节器在运行中增减，I/O 线程池按上限创建
+        tuner = WorkerTuner(initial=min(planned, max(2, cpus // 2)),
+                            maximum=min(planned, cpus * 4),
+                            report=lambda message: print(dim(message)))
+        workers = tuner.maximum
+    elif workers <= 0:
+        workers = min(planned, cpus)
+    workers_desc = f"auto（起始 {tuner.workers}，上限 {tuner.maximum}）" if tuner is not None else str(workers)
     
     print(bold("文档批量转换 → Markdown"))
     print(f"根目录: {root}")
     print(f"文件类型: {', '.join(include_types)}")
-    print(f"文件数: {len(documents)} | workers={workers} | force={config['conversion']['force']} | dry_run={dry_run}")
+    if queue is not None:
+        print(f"任务队列: {queue.db_path}（{format_queue_counts(counts)}）| worker: {queue.owner}")
+    if watcher is not None:
+        print(f"监视: {'inotify' if watcher.mode == 'inotify' else f'轮询（每 {watcher.poll_interval:g} 秒）'}"
+              + (f"，{watcher.reason}" if watcher.reason else "") + f" | 静默 {watcher.settle:g} 秒后转换")
+        print(f"文件数: {len(documents)}（之后新增或修改的文档持续转换，Ctrl-C 退出）| workers={workers_desc} | "
+              f"force={config['conversion']['force']}")
+    else:
+        print(f"文件数: {planned} | workers={workers_desc} | force={config['conversion']['force']} | dry_run={dry_run}")
     print("-" * 72)
     
+    # 增量模式清单
+    manifest = None
+    if config["conversion"].get("incremental", False):
+        manifest = Manifest(root, use_hash=config["conversion"].get("manifest_hash", False))
+        print(f"增量模式: {manifest.db_path}")
+    
+    ctx = build_run_context(config, tools, root,
+                            python_workers=cpus if tuner is not None else workers, dry_run=dry_run)
+    ctx.manifest = manifest
+    pool, cache, cost_model = ctx.pool, ctx.cache, ctx.cost_model
+    
+    # 运行日志：--resume 时重放上次的日志，跳过已完成的文档，中断的文档重新排队
+    # （任务队列模式下进度记录在任务库中，多台机器不共用根目录下的日志）
+    if queue is not None and args.resume:
+        print(yellow("任务队列模式下忽略 --resume：中断的任务已交还队列，由任意 worker 继续"))
+    if args.resume and not dry_run and queue is None:
+        journal_path = root / JOURNAL_NAME
+        state = replay(journal_path)
+        prepare_resume(documents, root, config, ctx, state)
+        stale = remove_stale_batches(ctx.scratch)
+        print(f"断点续跑: 已完成 {len(ctx.resumed)} 个（输出校验一致），重新排队 {len(ctx.requeue)} 个"
+              + (f"，清理残留批次目录 {stale} 个" if stale else ""))
+    if config["conversion"].get("journal", True) and not dry_run and queue is None:
+        ctx.journal = RunJournal(root, resume=args.resume)
+    
+    # 逐文件运行记录（JSON Lines，需配置 performance.run_log 或 --run-log）
+    run_log = open_run_log(config, dry_run)
+    
+    # 分类、代价估算和调度顺序（任务队列模式下对每批领取的文档进行）
+    estimates = ctx.estimates
+    documents, notes = prepare_documents(documents, root, config, ctx, workers)
+    for note in notes:
+        print(note)
+    progress = ProgressEstimator(sum(estimates[d].seconds for d in documents))
+    
     # 执行转换
     results: List[TaskResult] = []
     start_time = time.perf_counter()
+    submitted = len(documents)
     
-    if workers == 1 or dry_run:
-        # 单线程执行（用于dry-run或调试）
-        for i, doc_path in enumerate(documents, 1):
-            result = run_one(doc_path, root, config, dry_run, delete_manager)
-            results.append(result)
-            
-            # 显示进度
-            status_color = {
-                "ok": green("OK"),
-                "skipped": yellow("SKIP"),
-                "failed": red("FAIL")
-            }.get(result.status, result.status)
-            
-            print(f"[{i:4d}/{len(documents)}] {status_color:6} {doc_path.relative_to(root)}  {result.message}")
-            if result.cmd and config["conversion"]["verbose_cmd"]:
-                cmd_str = shlex.join(result.cmd) if not '>' in ' '.join(result.cmd) else ' '.join(result.cmd)
-                print(f"           cmd: {cmd_str}")
+    def report(result: TaskResult) -> None:
+        results.append(result)
+        if tuner is not None and result.status != "skipped":
+            # 跳过的文档不算吞吐
+            tuner.record_completion()
+        if ctx.journal is not None or queue is not None:
+            # 在 I/O 线程中写入，不阻塞事件循环；退出前 ctx.io.shutdown 等待写完再关闭日志和队列
+            ctx.io.submit(record_result, ctx.journal, queue, result).add_done_callback(warn_record_failure)
+        log_result(run_log, result, estimates)
+        eta = record_progress(result, estimates, cost_model, progress)
+        
+        # 显示进度
+        status_color = {
+            "ok": green("OK"),
+            "skipped": yellow("SKIP"),
+            "failed": red("FAIL")
+        }.get(result.status, result.status)
+        
+        print(f"[{len(results):4d}/{submitted}] {dim(eta)} {status_color:6} {result.doc_path.relative_to(root)}  {result.message}")
+        if result.cmd and config["conversion"]["verbose_cmd"]:
+            cmd_str = shlex.join(result.cmd) if not '>' in ' '.join(result.cmd) else ' '.join(result.cmd)
+            print(f"           cmd: {cmd_str}")
+    
+    # 同时转换的文档数：dry-run 或 --workers 1 时逐个执行（用于调试），auto 时由调节器在运行中调整
+    if (workers == 1 and tuner is None) or dry_run:
+        limit = lambda: 1
+    elif tuner is not None:
+        limit = lambda: tuner.workers
+        tuner.start()
     else:
-        # 多线程执行
-        with cf.ThreadPoolExecutor(max_workers=workers) as executor:
-            future_to_doc = {
-                executor.submit(run_one, doc_path, root, config, dry_run, delete_manager): doc_path
-                for doc_path in documents
-            }
-            
-            completed = 0
-            for future in cf.as_completed(future_to_doc):
-                completed += 1
-                result = future.result()
-                results.append(result)
-                
-                # 显示进度
-                status_color = {
-                    "ok": green("OK"),
-                    "skipped": yellow("SKIP"),
-                    "failed": red("FAIL")
-                }.get(result.status, result.status)
-                
-                print(f"[{completed:4d}/{len(documents)}] {status_color:6} {result.doc_path.relative_to(root)}  {result.message}")
-                if result.cmd and config["conversion"]["verbose_cmd"]:
-                    cmd_str = shlex.join(result.cmd) if not '>' in ' '.join(result.cmd) else ' '.join(result.cmd)
-                    print(f"           cmd: {cmd_str}")
+        limit = lambda: workers
+    
+    # 陆续到来的文档（任务队列领取的一批、监视到的变化）分别分类、估算和安排 marker 批次
+    async def prepared(batch: List[Path]) -> List[Path]:
+        nonlocal submitted
+        order, notes = await blocking(ctx, prepare_documents, batch, root, config, ctx, workers)
+        progress.add(sum(estimates[d].seconds for d in order))
+        submitted += len(order)
+        for note in notes:
+            print(dim(note))
+        return order
+    
+    feed = None
+    feed_poll = QUEUE_POLL
+    if queue is not None:
+        claim_batch = config["queue"].get("claim_batch", 0) or max(8, 2 * workers)
+        
+        async def feed() -> Optional[List[Path]]:
+            claimed = await blocking(ctx, queue.claim, claim_batch)
+            if not claimed:
+                # 其他 worker 仍持有租约时继续等待：它们崩溃后租约过期，任务由本 worker 接手
+                return None if await blocking(ctx, queue.active_leases) == 0 else []
+            return await prepared(claimed)
+        
+        queue.start_heartbeat()
+    elif watcher is not None:
+        # 监视：等待已写完的新增或修改文档（在 I/O 线程中阻塞等待，不需要再间隔重试）
+        feed_poll = 0
+        
+        async def feed() -> Optional[List[Path]]:
+            changed = await blocking(ctx, watcher.wait, WATCH_WAIT)
+            return await prepared(changed) if changed else []
+    
+    ctx.io = cf.ThreadPoolExecutor(max_workers=min(32, workers + 4), thread_name_prefix="doc-io")
+    try:
+        not_started = asyncio.run(run_documents(documents, root, config, dry_run, delete_manager, ctx, limit, report,
+                                                feed=feed, feed_poll=feed_poll))
+    finally:
+        ctx.io.shutdown(wait=True)
+        if watcher is not None:
+            watcher.close()
+        if delete_manager is not None:
+            # 后台队列中的源文件备份和删除（已转换完成的文档）在退出前做完
+            delete_manager.close()
+    cancelled = any(r.failure == "cancelled" for r in results)
+    if queue is not None:
+        # 已领取但没有开始的任务交还队列，不计入领取次数
+        queue.release(not_started)
+        counts = queue.counts()
+        queue.close()
+    
+    if tuner is not None:
+        tuner.stop()
+    if cancelled:
+        pool.terminate()
+    else:
+        pool.close()
+    if ctx.marker is not None:
+        if cancelled:
+            ctx.marker.abort()
+        ctx.marker.shutdown()
+    if not dry_run:
+        cost_model.save()
+    if ctx.journal is not None:
+        ctx.journal.close()
+    if run_log is not None:
+        run_log.close()
     
     # 统计结果
     total_time = time.perf_counter() - start_time
     ok_count = sum(1 for r in results if r.status == "ok")
     skip_count = sum(1 for r in results if r.status == "skipped")
     fail_count = sum(1 for r in results if r.status == "failed")
+    limit_count = sum(1 for r in results if r.failure == "limit")
+    timeout_count = sum(1 for r in results if r.failure == "timeout")
+    cancelled_count = sum(1 for r in results if r.failure == "cancelled")
     
     print("-" * 72)
     print(bold("总结"))
-    print(f"总计:   {len(documents)}")
+    print(f"总计:   {submitted}")
     print(f"成功:   {ok_count}")
     print(f"跳过:   {skip_count}")
-    print(f"失败:   {fail_count}")
+    fail_kinds = "，".join(f"{name} {count}" for name, count in (("资源限制", limit_count), ("超时", timeout_count),
+                                                                   ("中断", cancelled_count)) if count)
+    print(f"失败:   {fail_count}" + (f"（{fail_kinds}）" if fail_kinds else ""))
     print(f"耗时:   {total_time:.2f}s")
+    if not_started:
+        print(yellow(f"已中断: {len(not_started)} 个文档未开始"
+                     + ("（已交还任务队列）" if queue is not None else
+                        "（用 --resume 续跑）" if ctx.journal is not None else "")))
+    if queue is not None:
+        print(f"任务队列: {format_queue_counts(counts)}")
+    if tuner is not None:
+        print(f"并发:   结束时 {tuner.workers} 个 worker，最多 {tuner.peak} 个")
+    if cache is not None:
+        print(f"缓存:   {cache.summary()}")
+    
+    # 按引擎的单文件耗时分位数
+    percentiles = engine_percentiles((r.engine, r.seconds) for r in results if r.status == "ok" and r.engine)
+    if percentiles:
+        print("单文件耗时（秒）:")
+        for engine, (count, p50, p95, p99) in percentiles.items():
+            print(f"  {engine:<16} {count:>6} 个  p50 {p50:.2f}  p95 {p95:.2f}  p99 {p99:.2f}")
+    
+    # 报告源文件已消失的输出
+    if manifest is not None:
+        orphans = manifest.orphans()
+        if orphans:
+            print(yellow(f"源文件已消失的输出: {len(orphans)} 个"))
+            for entry in orphans[:20]:
+                print(f"  - {entry.output}  （源文件: {entry.source}）")
+            if len(orphans) > 20:
+                print(f"  ... 还有 {len(orphans) - 20} 个")
+        manifest.close()
     
     # 清理临时目录（如果配置要求且不是dry-run）
     if not dry_run and not config["conversion"]["keep_outputs"]:
-        base_out = root / "_marker_outputs"
-        if base_out.exists():
-            shutil.rmtree(base_out, ignore_errors=True)
+        if ctx.scratch == root / LEGACY_DIR_NAME:
+            shutil.rmtree(ctx.scratch, ignore_errors=True)
+        else:
+            # 共享的临时目录中只清理本次运行的文档目录，不影响其他运行
+            # （包括任务队列领取和监视到的文档）
+            for doc_path in {r.doc_path for r in results}.union(documents):
+                remove_doc_outputs(doc_output_dir(ctx.scratch, doc_path))
+            remove_empty_dir(ctx.scratch)
     
     # 显示删除摘要
     if delete_manager:
         delete_manager.print_summary()
     
+    if not_started or cancelled:
+        sys.exit(130)
     if fail_count > 0:
         sys.exit(1)
 
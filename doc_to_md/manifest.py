@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+增量转换清单
+每个根目录一个 SQLite 清单，记录源文件的大小、mtime、可选的内容哈希、输出路径和所用工具；
+元数据未变化的文件只需一次 stat 即可跳过，修改过或新增的文件才重新转换，
+源文件已消失的输出会在运行结束时报告
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from .conversion_cache import file_sha256
+except ImportError:
+    from conversion_cache import file_sha256
+
+MANIFEST_NAME = ".doc_to_md_manifest.sqlite"
+
+# 每积累多少条记录提交一次事务
+COMMIT_EVERY = 100
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    source: str
+    size: int
+    mtime_ns: int
+    sha256: str
+    output: str
+    tool: str
+    converted_at: float
+
+
+class Manifest:
+    """
+    增量转换清单
+
+    启动时把全部记录读入内存，查询不访问数据库；写入在锁内进行并批量提交
+    """
+
+    def __init__(self, root: Path, db_path: Optional[Path] = None, use_hash: bool = False):
+        """
+        参数:
+            root: 扫描根目录
+            db_path: 清单文件路径，None 表示 <root>/.doc_to_md_manifest.sqlite
+            use_hash: 是否记录并比较内容哈希（mtime 变化但内容不变的文件不会重新转换）
+        """
+        self.root = root
+        self.db_path = Path(db_path) if db_path else root / MANIFEST_NAME
+        self.use_hash = use_hash
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " source TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT,"
+            " output TEXT, tool TEXT, converted_at REAL)"
+        )
+        self._conn.commit()
+        self._entries: Dict[str, ManifestEntry] = {
+            row[0]: ManifestEntry(*row)
+            for row in self._conn.execute(
+                "SELECT source, size, mtime_ns, sha256, output, tool, converted_at FROM entries")
+        }
+
+    def _key(self, doc_path: Path) -> str:
+        try:
+            return str(doc_path.relative_to(self.root))
+        except ValueError:
+            return str(doc_path)
+
+    def check(self, doc_path: Path, final_md: Path, adopt: bool = True) -> Tuple[bool, str]:
+        """
+        判断源文件自上次转换以来是否未变化
+
+        参数:
+            adopt: 是否把启用清单前就已存在的有效输出补记到清单（dry-run 时不写入）
+
+        返回:
+            (fresh, reason)；fresh 为 True 时可以跳过转换
+        """
+        entry = self._entries.get(self._key(doc_path))
+        st = doc_path.stat()
+
+        if entry is None:
+            # 启用清单前已存在的输出：比源文件新则视为有效，补记录后跳过
+            try:
+                out_mtime = final_md.stat().st_mtime_ns
+            except OSError:
+                return False, "新文件"
+            if out_mtime >= st.st_mtime_ns:
+                if adopt:
+                    self.record(doc_path, final_md, "unknown")
+                return True, "已有输出，已补记清单"
+            return False, "输出早于源文件"
+
+        if entry.output != str(final_md) or not final_md.exists():
+            return False, "输出缺失"
+        if entry.size == st.st_size and entry.mtime_ns == st.st_mtime_ns:
+            return True, "未变化"
+        if self.use_hash and entry.size == st.st_size and entry.sha256:
+            # 只有 mtime 变化（如 touch、复制保留内容）时用哈希确认
+            if file_sha256(doc_path) == entry.sha256:
+                self.record(doc_path, final_md, entry.tool, entry.sha256)
+                return True, "内容未变化"
+        return False, "源文件已修改"
+
+    def record(self, doc_path: Path, final_md: Path, tool: str, sha256: Optional[str] = None) -> None:
+        """记录一次成功转换"""
+        try:
+            st = doc_path.stat()
+        except OSError:
+            # 源文件已被删除（如转换后删除），不再跟踪
+            self.forget(doc_path)
+            return
+        if sha256 is None and self.use_hash:
+            sha256 = file_sha256(doc_path)
+        entry = ManifestEntry(self._key(doc_path), st.st_size, st.st_mtime_ns,
+                              sha256 or "", str(final_md), tool, time.time())
+        with self._lock:
+            self._entries[entry.source] = entry
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (entry.source, entry.size, entry.mtime_ns, entry.sha256,
+                 entry.output, entry.tool, entry.converted_at))
+            self._maybe_commit()
+
+    def forget(self, doc_path: Path) -> None:
+        key = self._key(doc_path)
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._conn.execute("DELETE FROM entries WHERE source = ?", (key,))
+                self._maybe_commit()
+
+    def _maybe_commit(self) -> None:
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self._conn.commit()
+            self._pending = 0
+
+    def orphans(self) -> List[ManifestEntry]:
+        """源文件已不存在、但输出仍在的记录"""
+        result = []
+        for entry in self._entries.values():
+            source = self.root / entry.source
+            if not source.exists() and os.path.exists(entry.output):
+                result.append(entry)
+        return sorted(result, key=lambda e: e.source)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+marker 批量调用
+marker 每次启动都要重新加载版面/OCR 模型（数秒 CPU 和数GB内存），
+这里把多个PDF放进同一个输入目录，用一次 marker 进程（目录模式）转换一批文档，
+再把每个文档的输出放回各自的临时输出目录，由 run_one 按原有流程复制到最终位置
+
+转换链从 marker 开始的文档在转换前整批安排（schedule）；
+廉价引擎失败或质量检查不合格后才升级到 marker 的文档在升级时陆续加入（enqueue），攒成批次再运行
+"""
+
+import asyncio
+import concurrent.futures as cf
+import json
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from .run_log import communicate_with_rusage
+    from .limits import EngineLimits, ResourceLimitExceeded, apply_limits, exit_reason, rss_watchdog
+except ImportError:
+    from run_log import communicate_with_rusage
+    from limits import EngineLimits, ResourceLimitExceeded, apply_limits, exit_reason, rss_watchdog
+
+# 文档输出目录中的完成标记：表示该目录里是一份完整的 marker 输出，内容为源文件的大小和 mtime
+DONE_MARKER = ".marker_done"
+
+
+def _link_or_copy(src: Path, dest: Path) -> None:
+    try:
+        os.symlink(src.resolve(), dest)
+    except OSError:
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copy2(src, dest)
+
+
+def _source_fingerprint(doc_path: Path) -> Optional[dict]:
+    try:
+        st = doc_path.stat()
+    except OSError:
+        return None
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def mark_output_complete(doc_out: Path, doc_path: Path) -> None:
+    """在 doc_out 中写入完成标记，记录源文件的大小和 mtime"""
+    fingerprint = _source_fingerprint(doc_path) or {}
+    (doc_out / DONE_MARKER).write_text(json.dumps(fingerprint), encoding='utf-8')
+
+
+def marker_output_complete(doc_out: Path, doc_path: Optional[Path] = None) -> bool:
+    """
+    doc_out 中是否已有一份完整的 marker 输出
+
+    参数:
+        doc_path: 源文件；给出时还要求完成标记中记录的源文件大小和 mtime 与当前一致
+    """
+    marker = doc_out / DONE_MARKER
+    try:
+        recorded = marker.read_text(encoding='utf-8')
+    except OSError:
+        return False
+    if doc_path is not None:
+        try:
+            if json.loads(recorded or "{}") != _source_fingerprint(doc_path):
+                return False
+        except ValueError:
+            return False
+    return any(doc_out.rglob("*.md"))
+
+
+def _forward(done: cf.Future, waiter: cf.Future, pending: List[Tuple[Path, Path, Optional[float]]]) -> None:
+    """把批次结果转交给攒批文档共用的 Future（批次被取消时这些文档都按未就绪处理）"""
+    if done.cancelled():
+        waiter.set_result({doc_path: (False, "marker 批次已取消") for doc_path, _, _ in pending})
+    elif done.exception() is not None:
+        waiter.set_exception(done.exception())
+    else:
+        waiter.set_result(done.result())
+
+
+def _kill_group(proc: subprocess.Popen) -> None:
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        proc.kill()
+
+
+def remove_stale_batches(work_dir: Path) -> int:
+    """
+    清理被终止的运行留下的批次目录（目录名中的进程已不存在）
+
+    返回:
+        清理的目录数
+    """
+    removed = 0
+    try:
+        entries = list(work_dir.glob("_batch_*"))
+    except OSError:
+        return 0
+    for batch_dir in entries:
+        try:
+            pid = int(batch_dir.name.split("_")[2])
+        except (IndexError, ValueError):
+            continue
+        if pid == os.getpid():
+            continue
+        try:
+            os.kill(pid, 0)
+            continue
+        except ProcessLookupError:
+            pass
+        except OSError:
+            # 进程存在但属于其他用户
+            continue
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        removed += 1
+    return removed
+
+
+class MarkerBatcher:
+    """
+    marker 批处理调度器
+
+    schedule() 把文档分批后提交到后台线程依次执行（同一时间只运行一个 marker 进程，
+    避免多份模型同时占用内存）；enqueue() 把升级到 marker 的文档攒成批次，
+    攒满 batch_size 个或第一个文档等待 linger 秒后提交；run_one 通过 wait() 等待所属批次完成
+    """
+
+    def __init__(self, marker_bin: str, work_dir: Path, batch_size: int = 8,
+                 output_flag: str = "--output", timeout: Optional[float] = None, governor=None,
+                 limits: Optional[EngineLimits] = None, linger: float = 2.0):
+        """
+        参数:
+            marker_bin: marker 可执行文件路径
+            work_dir: 批次输入/输出的临时目录
+            batch_size: 每批文档数（受内存限制调节）
+            output_flag: marker 的输出目录参数（--output 或 --output_dir）
+            timeout: 单个文档的默认超时秒数，批次超时按文档累加
+            governor: 内存准入控制（MemoryGovernor），批次运行前按 marker 的内存权重准入
+            limits: marker 的资源限制，批次的 CPU 时间上限按文档数累加
+            linger: enqueue 的文档最多等待多少秒凑批（之后不满 batch_size 也提交）
+        """
+        self.marker_bin = marker_bin
+        self.work_dir = work_dir
+        self.batch_size = max(1, batch_size)
+        self.output_flag = output_flag
+        self.timeout = timeout
+        self.governor = governor
+        self.limits = limits or EngineLimits()
+        self._executor = cf.ThreadPoolExecutor(max_workers=1, thread_name_prefix="marker-batch")
+        self._futures: Dict[Path, cf.Future] = {}
+        self._usage: Dict[Path, Tuple[Any, int]] = {}
+        self._seconds: Dict[Path, float] = {}  # 批次 marker 进程的运行秒数按文档平分
+        self._lock = threading.Lock()
+        self._batches = 0  # 已安排的批次数（批次目录按此编号，多次 schedule 不会重名）
+        self._proc: Optional[subprocess.Popen] = None  # 运行中的批次进程
+        self.linger = max(0.0, linger)
+        # enqueue 攒批中的文档 (doc_path, doc_out, timeout)，它们共用 _pending_future，批次提交后转交结果
+        self._pending: List[Tuple[Path, Path, Optional[float]]] = []
+        self._pending_future: Optional[cf.Future] = None
+        self._timer: Optional[threading.Timer] = None
+        self._closed = False
+
+    def schedule(self, items: List[Tuple[Path, Path]],
+                 timeouts: Optional[Dict[Path, float]] = None) -> int:
+        """
+        安排批量转换
+
+        参数:
+            items: (doc_path, doc_out) 列表
+            timeouts: 各文档的超时秒数，批次超时为其总和（未给出的文档使用 self.timeout）
+
+        返回:
+            批次数
+        """
+        batches = [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+        with self._lock:
+            for batch in batches:
+                per_doc = [(timeouts or {}).get(doc_path, self.timeout) for doc_path, _ in batch]
+                future = self._submit(batch, per_doc)
+                for doc_path, _ in batch:
+                    self._futures[doc_path] = future
+        return len(batches)
+
+    def enqueue(self, doc_path: Path, doc_out: Path, timeout: Optional[float] = None) -> None:
+        """
+        把升级到 marker 的文档加入攒批队列，之后用 wait() 等待结果
+
+        攒满 batch_size 个立即提交，否则在第一个文档加入 linger 秒后提交；
+        批处理已关闭时 wait() 返回未就绪，调用方单独运行 marker
+
+        参数:
+            timeout: 该文档的超时秒数（None 使用 self.timeout）
+        """
+        with self._lock:
+            if doc_path in self._futures:
+                return
+            if self._pending_future is None:
+                self._pending_future = cf.Future()
+            self._futures[doc_path] = self._pending_future
+            self._pending.append((doc_path, doc_out, self.timeout if timeout is None else timeout))
+            if self._closed or len(self._pending) >= self.batch_size:
+                self._flush_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.linger, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        """提交攒批中的文档（调用方持有 self._lock）"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, waiter = self._pending, self._pending_future
+        self._pending, self._pending_future = [], None
+        if not pending:
+            return
+        if self._closed:
+            waiter.set_result({doc_path: (False, "marker 批处理已关闭") for doc_path, _, _ in pending})
+            return
+        future = self._submit([(doc_path, doc_out) for doc_path, doc_out, _ in pending],
+                              [timeout for _, _, timeout in pending])
+        future.add_done_callback(lambda done: _forward(done, waiter, pending))
+
+    def _submit(self, batch: List[Tuple[Path, Path]], per_doc: List[Optional[float]]) -> cf.Future:
+        """把一批文档提交到后台线程，批次超时为各文档超时之和（调用方持有 self._lock）"""
+        timeout = None if None in per_doc else sum(per_doc)
+        future = self._executor.submit(self._run_batch, self._batches, batch, timeout)
+        self._batches += 1
+        return future
+
+    def has(self, doc_path: Path) -> bool:
+        with self._lock:
+            return doc_path in self._futures
+
+    def wait(self, doc_path: Path) -> Tuple[bool, str]:
+        """
+        等待文档所属批次完成
+
+        返回:
+            (ready, message)；ready 为 False 时调用方应单独运行 marker
+        """
+        with self._lock:
+            future = self._futures.get(doc_path)
+        if future is None:
+            return False, "未加入批次"
+        try:
+            results = future.result()
+        except Exception as e:
+            return False, f"marker 批次异常: {e}"
+        return results.get(doc_path, (False, "批次结果缺失"))
+
+    async def wait_async(self, doc_path: Path) -> Tuple[bool, str]:
+        """wait 的 asyncio 版本；取消等待不会取消批次本身（批内还有其他文档）"""
+        with self._lock:
+            future = self._futures.get(doc_path)
+        if future is None:
+            return False, "未加入批次"
+        try:
+            results = await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return False, f"marker 批次异常: {e}"
+        return results.get(doc_path, (False, "批次结果缺失"))
+
+    def usage(self, doc_path: Path) -> Optional[Tuple[Any, int]]:
+        """文档所属批次 marker 进程的资源使用（rusage, 批次文档数）；批次未完成或无法获取时为 None"""
+        with self._lock:
+            return self._usage.get(doc_path)
+
+    def seconds(self, doc_path: Path) -> Optional[float]:
+        """文档所属批次 marker 进程的运行秒数按批内文档数平分（不含排队等待）；批次未运行时为 None"""
+        with self._lock:
+            return self._seconds.get(doc_path)
+
+    def forget(self, doc_path: Path) -> None:
+        """丢弃已完成文档的批次记录（常驻服务中记录不随请求无限增长）"""
+        with self._lock:
+            self._futures.pop(doc_path, None)
+            self._usage.pop(doc_path, None)
+            self._seconds.pop(doc_path, None)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._flush_locked()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def abort(self) -> None:
+        """终止运行中的批次（运行被取消时），尚未开始的批次由 shutdown 取消"""
+        with self._lock:
+            proc = self._proc
+        if proc is not None:
+            _kill_group(proc)
+
+    def _run_batch(self, index: int, batch: List[Tuple[Path, Path]],
+                   timeout: Optional[float]) -> Dict[Path, Tuple[bool, str]]:
+        batch_dir = self.work_dir / f"_batch_{os.getpid()}_{index:05d}"
+        in_dir = batch_dir / "in"
+        out_dir = batch_dir / "out"
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        in_dir.mkdir(parents=True)
+        out_dir.mkdir(parents=True)
+
+        # 输入文件以序号命名，避免不同目录下的同名PDF互相覆盖
+        names = {}
+        for i, (doc_path, _) in enumerate(batch):
+            name = f"doc{i:04d}"
+            _link_or_copy(doc_path, in_dir / f"{name}.pdf")
+            names[doc_path] = name
+
+        cmd = [self.marker_bin, str(in_dir), self.output_flag, str(out_dir)]
+        results: Dict[Path, Tuple[bool, str]] = {}
+        limits = self.limits.scaled(len(batch))
+        admission = self.governor.admission("marker") if self.governor is not None else nullcontext(None)
+        with admission as slot:
+            try:
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                        start_new_session=True)
+                if limits.active:
+                    apply_limits(proc.pid, limits)
+                with self._lock:
+                    self._proc = proc
+                if slot is not None:
+                    slot.attach(proc.pid)
+                # marker 会派生工作进程，超时时整个进程组一起终止
+                t0 = time.perf_counter()
+                try:
+                    stdout, stderr, rusage = communicate_with_rusage(proc, timeout, _kill_group,
+                                                                     rss_watchdog(limits, proc.pid))
+                finally:
+                    share = (time.perf_counter() - t0) / len(batch)
+                    with self._lock:
+                        self._proc = None
+                        for doc_path, _ in batch:
+                            self._seconds[doc_path] = share
+                if rusage is not None:
+                    with self._lock:
+                        for doc_path, _ in batch:
+                            self._usage[doc_path] = (rusage, len(batch))
+                tail = (stderr or stdout or "").strip()[-600:]
+                reason = exit_reason(limits, proc.returncode, stderr, rusage)
+                if reason:
+                    tail = f"marker 批次超出资源限制：{reason}\n{tail}"
+            except subprocess.TimeoutExpired:
+                proc, tail = None, f"marker 批次超时（{timeout:.0f}秒）"
+            except ResourceLimitExceeded as e:
+                proc, tail = None, f"marker 批次超出资源限制：{e.reason}"
+            except OSError as e:
+                proc, tail = None, f"marker 批次启动失败: {e}"
+
+        for doc_path, doc_out in batch:
+            name = names[doc_path]
+            produced = [p for p in out_dir.iterdir() if p.name == name or p.stem == name]
+            if not produced or not any(p.suffix == ".md" or (p.is_dir() and any(p.rglob("*.md")))
+                                       for p in produced):
+                code = proc.returncode if proc is not None else "-"
+                results[doc_path] = (False, f"marker 批次未产生该文档的输出（exit code={code}）\n{tail}")
+                continue
+
+            shutil.rmtree(doc_out, ignore_errors=True)
+            doc_out.mkdir(parents=True, exist_ok=True)
+            for p in produced:
+                shutil.move(str(p), str(doc_out / p.name))
+            mark_output_complete(doc_out, doc_path)
+            results[doc_path] = (True, f"marker 批量转换（{len(batch)} 个/批）")
+
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        return results
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+PDF 快速分类
+抽样检查少数几页的文本层（内容流里的文本绘制操作）、字体资源和整页图像，
+把PDF分为有文本层的（pdftotext 等廉价工具即可）和扫描件（需要 marker 的 OCR），不做完整解析；
+分类结果按文件大小和 mtime 缓存，重复运行时跳过预处理
+"""
+
+import concurrent.futures as cf
+import os
+import re
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    from .pdf_info import SCAN_BYTES, count_pdf_pages
+except ImportError:
+    from pdf_info import SCAN_BYTES, count_pdf_pages
+
+# 分类结果
+TEXT = "text"          # 有文本层
+SCANNED = "scanned"    # 扫描件（整页图像，无文本）
+MIXED = "mixed"        # 抽样页中扫描页多于文本页
+UNKNOWN = "unknown"    # 无法判断
+
+# 每个PDF抽样检查的页数（首页、中间页、末页）
+SAMPLE_PAGES = 3
+
+# 图像与页面宽高比相差不超过该比例、且宽度不低于 72dpi 时视为整页图像
+ASPECT_TOLERANCE = 0.15
+
+_TEXT_OP_RE = re.compile(rb"(?:\)|\]|>)\s*(?:T[jJ]|'|\")")
+
+
+def default_db_path() -> Path:
+    """分类缓存的默认位置：$XDG_CACHE_HOME/doc_to_md/pdf_classes.sqlite"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(cache_home) / "doc_to_md" / "pdf_classes.sqlite"
+
+
+def _sample_indices(total: Optional[int], samples: int) -> List[int]:
+    if not total:
+        return list(range(samples))
+    if total <= samples:
+        return list(range(total))
+    return sorted({round(i * (total - 1) / (samples - 1)) for i in range(samples)})
+
+
+def _name(value) -> str:
+    return getattr(value, "name", str(value))
+
+
+def _classify_page(page) -> str:
+    from pdfminer.pdftypes import resolve1
+
+    resources = resolve1(page.resources) or {}
+    fonts = resolve1(resources.get("Font")) or {}
+
+    has_text = False
+    if fonts:
+        contents = page.contents if isinstance(page.contents, list) else [page.contents]
+        for stream in contents:
+            stream = resolve1(stream)
+            if stream is None or not hasattr(stream, "get_data"):
+                continue
+            data = stream.get_data()
+            if b"BT" in data and _TEXT_OP_RE.search(data):
+                has_text = True
+                break
+    if has_text:
+        return TEXT
+
+    x0, y0, x1, y1 = (float(v) for v in page.mediabox)
+    page_w, page_h = abs(x1 - x0), abs(y1 - y0)
+    xobjects = resolve1(resources.get("XObject")) or {}
+    for ref in xobjects.values():
+        xobj = resolve1(ref)
+        if not hasattr(xobj, "get") or _name(xobj.get("Subtype")) != "Image":
+            continue
+        width, height = resolve1(xobj.get("Width")) or 0, resolve1(xobj.get("Height")) or 0
+        if not (width and height and page_w and page_h):
+            continue
+        # 横向放置的扫描页宽高互换
+        for w, h in ((width, height), (height, width)):
+            if abs(w / h - page_w / page_h) <= ASPECT_TOLERANCE * page_w / page_h and w >= page_w:
+                return SCANNED
+    return UNKNOWN
+
+
+def _classify_pdfminer(pdf_path: Path, samples: int) -> Optional[Tuple[str, str]]:
+    try:
+        from pdfminer.pdfparser import PDFParser
+        from pdfminer.pdfdocument import PDFDocument
+        from pdfminer.pdfpage import PDFPage
+    except ImportError:
+        return None
+
+    indices = _sample_indices(count_pdf_pages(pdf_path, deep=False), samples)
+    wanted = set(indices)
+    kinds: List[str] = []
+    with open(pdf_path, 'rb') as f:
+        doc = PDFDocument(PDFParser(f))
+        # create_pages 按页树顺序逐个生成页面对象，只解析到最后一个抽样页
+        for index, page in enumerate(PDFPage.create_pages(doc)):
+            if index in wanted:
+                kinds.append(_classify_page(page))
+            if index >= indices[-1]:
+                break
+
+    text, scanned = kinds.count(TEXT), kinds.count(SCANNED)
+    detail = f"抽样 {len(kinds)} 页：文本 {text}，扫描 {scanned}"
+    if text and text >= scanned:
+        return TEXT, detail
+    if scanned and not text:
+        return SCANNED, detail
+    if scanned:
+        return MIXED, detail
+    return UNKNOWN, detail
+
+
+def _classify_bytes(pdf_path: Path) -> Tuple[str, str]:
+    """没有 pdfminer 时按文件头尾的资源字典粗略判断"""
+    size = pdf_path.stat().st_size
+    with open(pdf_path, 'rb') as f:
+        data = f.read(SCAN_BYTES)
+        if size > SCAN_BYTES:
+            f.seek(max(SCAN_BYTES, size - SCAN_BYTES))
+            data += f.read()
+    has_font = b"/Font" in data
+    has_image = re.search(rb"/Subtype\s*/Image", data) is not None
+    if has_font:
+        return TEXT, "文件头尾有字体资源"
+    if has_image:
+        return SCANNED, "文件头尾只有图像资源"
+    return UNKNOWN, "文件头尾没有字体或图像资源"
+
+
+def classify_pdf(pdf_path: Path, samples: int = SAMPLE_PAGES) -> Tuple[str, str]:
+    """
+    判断PDF是否有文本层
+
+    参数:
+        samples: 抽样检查的页数
+
+    返回:
+        (kind, detail)；kind 为 text / scanned / mixed / unknown
+    """
+    try:
+        result = _classify_pdfminer(pdf_path, max(1, samples))
+        if result is not None:
+            return result
+        return _classify_bytes(pdf_path)
+    except Exception as e:
+        return UNKNOWN, f"无法分类: {e}"
+
+
+class PdfClassCache:
+    """
+    PDF 分类缓存（SQLite），按绝对路径、文件大小和 mtime 失效
+
+    启动时读入全部记录，查询不访问数据库；新结果由 update() 一次性写入
+    """
+
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = Path(db_path) if db_path else default_db_path()
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[int, int, str, str]] = {}
+        self._conn = None
+        try:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS classes ("
+                " path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, kind TEXT, detail TEXT)"
+            )
+            self._conn.commit()
+            for path, size, mtime_ns, kind, detail in self._conn.execute(
+                    "SELECT path, size, mtime_ns, kind, detail FROM classes"):
+                self._entries[path] = (size, mtime_ns, kind, detail)
+        except sqlite3.Error as e:
+            print(f"警告: PDF 分类缓存不可用 {self.db_path}: {e}")
+            self._conn = None
+
+    def get(self, pdf_path: Path) -> Optional[Tuple[str, str]]:
+        try:
+            st = pdf_path.stat()
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._entries.get(str(pdf_path.resolve()))
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2], entry[3]
+        return None
+
+    def update(self, results: Dict[Path, Tuple[str, str]]) -> None:
+        rows = []
+        for pdf_path, (kind, detail) in results.items():
+            try:
+                st = pdf_path.stat()
+            except OSError:
+                continue
+            rows.append((str(pdf_path.resolve()), st.st_size, st.st_mtime_ns, kind, detail))
+        with self._lock:
+            for path, size, mtime_ns, kind, detail in rows:
+                self._entries[path] = (size, mtime_ns, kind, detail)
+            if self._conn is None or not rows:
+                return
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO classes VALUES (?, ?, ?, ?, ?)", rows)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"警告: 无法写入 PDF 分类缓存: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def classify_pdfs(
+    pdf_paths: Iterable[Path],
+    cache: Optional[PdfClassCache] = None,
+    workers: int = 4,
+    samples: int = SAMPLE_PAGES,
+) -> Tuple[Dict[Path, str], int]:
+    """
+    并发分类多个PDF（缓存命中的文件不再读取）
+
+    返回:
+        ({pdf_path: kind}, 新分类的文件数)
+    """
+    kinds: Dict[Path, str] = {}
+    pending: List[Path] = []
+    for pdf_path in pdf_paths:
+        cached = cache.get(pdf_path) if cache is not None else None
+        if cached is not None:
+            kinds[pdf_path] = cached[0]
+        else:
+            pending.append(pdf_path)
+
+    if pending:
+        with cf.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            results = dict(zip(pending, executor.map(lambda p: classify_pdf(p, samples), pending)))
+        for pdf_path, (kind, _) in results.items():
+            kinds[pdf_path] = kind
+        if cache is not None:
+            cache.update(results)
+    return kinds, len(pending)
+
+
+if __name__ == "__main__":
+    for arg in sys.argv[1:]:
+        kind, detail = classify_pdf(Path(arg))
+        print(f"{arg}: {kind}（{detail}）")
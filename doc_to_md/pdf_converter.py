@@ -9,7 +9,36 @@
 import os
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Iterable, TextIO
+
+
+def write_pdf_text(pdf_path: Path, out: TextIO, page_numbers: Optional[Iterable[int]] = None) -> int:
+    """
+    流式提取PDF文本：用 extract_pages 逐页生成版面对象，每页处理完立即写入 out，
+    不在内存中拼接整份文档的文本（输出与 pdfminer 的 extract_text 一致）
+
+    返回:
+        写入的页数
+    """
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTContainer, LTText, LTTextBox
+
+    def render(item) -> None:
+        if isinstance(item, LTContainer):
+            for child in item:
+                render(child)
+        elif isinstance(item, LTText):
+            out.write(item.get_text())
+        if isinstance(item, LTTextBox):
+            out.write("\n")
+
+    pages = 0
+    for page in extract_pages(str(pdf_path), page_numbers=set(page_numbers) if page_numbers is not None else None):
+        render(page)
+        out.write("\f")
+        pages += 1
+    return pages
+
 
 def convert_pdf_to_markdown(pdf_path: Path, out_dir: Path) -> None:
     """
@@ -22,16 +51,14 @@ def convert_pdf_to_markdown(pdf_path: Path, out_dir: Path) -> None:
         out_dir_obj = Path(out_dir) if isinstance(out_dir, str) else out_dir
         
         # 尝试使用pdfminer
-        from pdfminer.high_level import extract_text
-        
-        text = extract_text(str(pdf_path_obj))
+        import pdfminer.high_level  # noqa: F401
         
-        # 创建Markdown文件
+        # 创建Markdown文件（逐页写入，内存占用只与最大的单页有关）
         md_file = out_dir_obj / f"{pdf_path_obj.stem}.md"
         with open(md_file, 'w', encoding='utf-8') as f:
             f.write(f"# {pdf_path_obj.stem}\n\n")
             f.write("```text\n")
-            f.write(text)
+            write_pdf_text(pdf_path_obj, f)
             f.write("\n```\n")
             
         print(f"转换完成: {pdf_path_obj} -> {md_file}")
@@ -56,6 +83,19 @@ def convert_pdf_to_markdown(pdf_path: Path, out_dir: Path) -> None:
             f.write(f"# {pdf_path_obj.stem}\n\n")
             f.write(f"PDF转换错误: {e}\n")
 
+def extract_pdf_text(pdf_path: Path, out_file: Path, page_numbers: Optional[Iterable[int]] = None) -> None:
+    """
+    提取PDF指定页的纯文本并写入 out_file（用于大文件分段并行提取）
+
+    参数:
+        pdf_path: PDF文件路径
+        out_file: 输出文本文件
+        page_numbers: 从0开始的页码，None 表示全部页
+    """
+    with open(out_file, 'w', encoding='utf-8') as f:
+        write_pdf_text(pdf_path, f, page_numbers)
+
+
 if __name__ == "__main__":
     if len(sys.argv) != 3:
         print("用法: python pdf_converter.py <pdf文件> <输出目录>")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+PDF 基本信息的快速读取
+只读取文件头尾少量字节获取页数，读不到时再借助 pdfminer 的交叉引用表解析页树根节点，
+不做完整解析
+"""
+
+import re
+import sys
+from pathlib import Path
+from typing import Optional
+
+# 文件头尾各读取的字节数
+SCAN_BYTES = 1024 * 1024
+
+# 快速模式下文件头尾各读取的字节数
+QUICK_SCAN_BYTES = 64 * 1024
+
+_PAGES_TYPE_RE = re.compile(rb"/Type\s*/Pages\b")
+_COUNT_RE = re.compile(rb"/Count\s+(\d+)")
+
+
+def _scan_page_count(data: bytes) -> Optional[int]:
+    counts = []
+    for m in _PAGES_TYPE_RE.finditer(data):
+        # 在包含该 /Type /Pages 的对象（obj ... endobj）内查找 /Count
+        start = data.rfind(b" obj", 0, m.start())
+        end = data.find(b"endobj", m.end())
+        obj = data[start if start >= 0 else 0:end if end >= 0 else len(data)]
+        counts.extend(int(c.group(1)) for c in _COUNT_RE.finditer(obj))
+    # 页树根节点的 /Count 是所有 Pages 节点中最大的
+    return max(counts) if counts else None
+
+
+def _pdfminer_page_count(pdf_path: Path) -> Optional[int]:
+    try:
+        from pdfminer.pdfparser import PDFParser
+        from pdfminer.pdfdocument import PDFDocument
+        from pdfminer.pdftypes import resolve1
+    except ImportError:
+        return None
+
+    try:
+        with open(pdf_path, 'rb') as f:
+            doc = PDFDocument(PDFParser(f))
+            pages = resolve1(doc.catalog.get("Pages"))
+            count = resolve1(pages.get("Count")) if isinstance(pages, dict) else None
+            return int(count) if count is not None else None
+    except Exception:
+        return None
+
+
+def count_pdf_pages(pdf_path: Path, deep: bool = True) -> Optional[int]:
+    """
+    快速获取PDF页数
+
+    参数:
+        deep: 头尾扫描找不到时是否借助 pdfminer 解析交叉引用表；
+              为 False 时只读取头尾各 64KB（用于批量估算任务代价）
+
+    返回:
+        页数；无法确定时返回 None
+    """
+    scan_bytes = SCAN_BYTES if deep else QUICK_SCAN_BYTES
+    try:
+        size = pdf_path.stat().st_size
+        with open(pdf_path, 'rb') as f:
+            head = f.read(scan_bytes)
+            tail = b""
+            if size > scan_bytes:
+                f.seek(max(scan_bytes, size - scan_bytes))
+                tail = f.read()
+    except OSError:
+        return None
+
+    count = _scan_page_count(tail) or _scan_page_count(head)
+    if count or not deep:
+        return count
+    # 页树位于对象流（PDF 1.5+ 压缩）或文件中部时，借助交叉引用表定位
+    return _pdfminer_page_count(pdf_path)
+
+
+if __name__ == "__main__":
+    for arg in sys.argv[1:]:
+        print(f"{arg}: {count_pdf_pages(Path(arg))}")
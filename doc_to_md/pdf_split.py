@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+大PDF分段并行提取
+页数超过阈值的PDF按页码范围拆成多段，由多个 worker 并行提取
+（pdftotext 使用 -f/-l，Python 引擎使用 pdfminer 的 page_numbers），再按顺序拼接，
+避免单个超大文件拖长整批任务的尾部
+"""
+
+import asyncio
+import multiprocessing as mp
+import shutil
+import subprocess
+import time
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+
+try:
+    from .aio import run_process
+    from .limits import EngineLimits
+except ImportError:
+    from aio import run_process
+    from limits import EngineLimits
+
+# 支持分段提取的引擎
+SPLIT_ENGINES = {"pdftotext", "python"}
+
+
+def page_ranges(total_pages: int, chunk_pages: int) -> List[Tuple[int, int]]:
+    """把 1..total_pages 拆成若干 (first, last) 闭区间（从1开始）"""
+    chunk_pages = max(1, chunk_pages)
+    return [(first, min(first + chunk_pages - 1, total_pages))
+            for first in range(1, total_pages + 1, chunk_pages)]
+
+
+def _join_parts(engine: str, pdf_path: Path, out_dir: Path, part_files: List[Path]) -> None:
+    """按顺序拼接各段的输出"""
+    if engine == "pdftotext":
+        out_file = out_dir / f"{pdf_path.stem}.txt"
+        with open(out_file, 'wb') as f_out:
+            for part_file in part_files:
+                with open(part_file, 'rb') as f_in:
+                    shutil.copyfileobj(f_in, f_out)
+    else:
+        # 与 pdf_converter.convert_pdf_to_markdown 的输出格式保持一致
+        out_file = out_dir / f"{pdf_path.stem}.md"
+        with open(out_file, 'w', encoding='utf-8') as f_out:
+            f_out.write(f"# {pdf_path.stem}\n\n")
+            f_out.write("```text\n")
+            for part_file in part_files:
+                with open(part_file, 'r', encoding='utf-8') as f_in:
+                    shutil.copyfileobj(f_in, f_out)
+            f_out.write("\n```\n")
+
+
+class _RangeFailed(Exception):
+    """某一段提取失败（用于取消同一文档的其他段）"""
+
+    def __init__(self, first: int, last: int, output: str):
+        super().__init__(output)
+        self.first, self.last, self.output = first, last, output
+
+
+async def _extract_range(engine: str, pdf_path: Path, part_file: Path, first: int, last: int,
+                         deadline: Optional[float], pdftotext_bin: str, pool, limits: EngineLimits,
+                         on_rusage: Optional[Callable[[Any], None]], on_start: Callable[[], None]) -> None:
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    if engine == "pdftotext":
+        cmd = [pdftotext_bin, "-f", str(first), "-l", str(last), str(pdf_path), str(part_file)]
+        proc, rusage = await run_process(cmd, timeout, limits, lambda pid: on_start())
+        if on_rusage is not None:
+            on_rusage(rusage)
+        ok = proc.returncode == 0
+        output = "\n".join(x for x in [(proc.stdout or "").strip(), (proc.stderr or "").strip()] if x)
+    else:
+        # pdfminer 的 page_numbers 从0开始
+        ok, output = await pool.extract_pdf_range_async(pdf_path, part_file, list(range(first - 1, last)), timeout,
+                                                        on_start)
+    if not ok:
+        raise _RangeFailed(first, last, output)
+
+
+async def extract_pdf_split(
+    engine: str,
+    pdf_path: Path,
+    out_dir: Path,
+    ranges: List[Tuple[int, int]],
+    workers: int,
+    timeout: Optional[float] = None,
+    pdftotext_bin: str = "pdftotext",
+    pool=None,
+    limits: Optional[EngineLimits] = None,
+    on_rusage: Optional[Callable[[Any], None]] = None,
+    on_start: Optional[Callable[[], None]] = None,
+) -> Tuple[bool, str]:
+    """
+    分段并行提取PDF并拼接到 out_dir 下，输出文件名与整文件提取时一致
+    （pdftotext 为 <stem>.txt，Python 引擎为 <stem>.md）
+
+    pdftotext 的各段由 aio.run_process 运行（资源限制、进程组终止、rusage 与整文件提取相同）；
+    timeout 是整个文档的期限，任何一段失败、超时或整体被取消时其余段一起取消
+
+    参数:
+        engine: "pdftotext" 或 "python"
+        ranges: page_ranges() 返回的页码范围
+        workers: 并行提取的段数
+        pool: Python 引擎使用的 PythonWorkerPool
+        limits: pdftotext 进程的资源限制（Python 引擎的限制由进程池的 worker 自己设置）
+        on_rusage: 每段 pdftotext 结束后以其资源使用调用
+        on_start: 第一段开始运行（pdftotext 进程已启动或取得了进程池的 worker）时调用一次
+
+    返回:
+        (success, output)
+
+    异常:
+        subprocess.TimeoutExpired: 超过整个文档的期限
+        ResourceLimitExceeded: 某一段超出资源限制
+    """
+    parts_dir = out_dir / "_parts"
+    parts_dir.mkdir(parents=True, exist_ok=True)
+    part_files = [parts_dir / f"part_{i:05d}.txt" for i in range(len(ranges))]
+    deadline = None if timeout is None else time.monotonic() + timeout
+    semaphore = asyncio.Semaphore(max(1, min(workers, len(ranges))))
+    limits = limits or EngineLimits()
+    loop = asyncio.get_running_loop()
+    started = False
+
+    def range_started() -> None:
+        nonlocal started
+        if not started:
+            started = True
+            if on_start is not None:
+                on_start()
+
+    async def run_range(part_file: Path, first: int, last: int) -> None:
+        async with semaphore:
+            await _extract_range(engine, pdf_path, part_file, first, last, deadline, pdftotext_bin, pool,
+                                 limits, on_rusage, range_started)
+
+    tasks = [asyncio.ensure_future(run_range(part_file, first, last))
+             for part_file, (first, last) in zip(part_files, ranges)]
+    try:
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        done, pending = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_EXCEPTION)
+        errors = [task.exception() for task in done if not task.cancelled() and task.exception() is not None]
+        if (pending and not errors) or any(isinstance(e, mp.TimeoutError) for e in errors):
+            raise subprocess.TimeoutExpired([engine, str(pdf_path)], timeout)
+        for error in errors:
+            if not isinstance(error, _RangeFailed):
+                raise error
+        if errors:
+            first = errors[0]
+            return False, f"第 {first.first}-{first.last} 页提取失败（共 {len(errors)} 段失败）\n{first.output}"
+        await loop.run_in_executor(None, _join_parts, engine, pdf_path, out_dir, part_files)
+        return True, f"分 {len(ranges)} 段并行提取"
+    finally:
+        # 第一段失败、超时或被取消时其余段一起取消（pdftotext 的进程组由 run_process 终止，
+        # 进程池中的任务随 worker 一起终止），等它们结束后再删除分段文件
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await loop.run_in_executor(None, shutil.rmtree, parts_dir, True)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+转换输出的质量检查
+廉价引擎（pdftotext、pandoc）的输出若几乎为空或乱码比例过高（扫描件、字体编码缺失等），
+由转换链升级到更昂贵的引擎（marker）重新转换
+"""
+
+import re
+import unicodedata
+from pathlib import Path
+from typing import Optional, Tuple
+
+# 逐块读取输出文件，超大输出也不会整体载入内存
+READ_CHUNK = 1024 * 1024
+
+# pdfminer 对无法映射的字形输出 (cid:123)
+_CID_RE = re.compile(r"\(cid:\d+\)")
+
+# 转换器包装纯文本时添加的代码块标记，不算作正文
+_FENCE_RE = re.compile(r"^```\w*$", re.MULTILINE)
+
+
+def _is_garbage(ch: str) -> bool:
+    if ch == "\ufffd":
+        return True
+    category = unicodedata.category(ch)
+    # 控制字符（换页、制表等空白除外）和私用区字符
+    return (category == "Cc" and ch not in "\n\r\t\f\v") or category == "Co"
+
+
+def text_stats(path: Path) -> Tuple[int, int]:
+    """
+    统计输出文件的正文字符数和乱码字符数
+
+    返回:
+        (非空白字符数, 乱码字符数)
+    """
+    chars = 0
+    garbage = 0
+    tail = ""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        # antiword/catdoc/pdfminer 的输出以文件名作为标题，不算作正文
+        first = f.readline()
+        if not first.startswith("# "):
+            tail = first
+        while True:
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                break
+            # 保留上一块末尾不完整的行，保证正则按整行匹配
+            text = tail + chunk
+            cut = text.rfind("\n") + 1
+            text, tail = (text[:cut], text[cut:]) if cut else ("", text)
+            c, g = _count(text)
+            chars += c
+            garbage += g
+    c, g = _count(tail)
+    return chars + c, garbage + g
+
+
+def _count(text: str) -> Tuple[int, int]:
+    text = _FENCE_RE.sub("", text)
+    cid = _CID_RE.findall(text)
+    text = _CID_RE.sub("", text)
+    chars = sum(1 for ch in text if not ch.isspace())
+    garbage = sum(1 for ch in text if _is_garbage(ch))
+    return chars + len(cid), garbage + len(cid)
+
+
+def check_output_quality(
+    path: Path,
+    pages: Optional[int] = None,
+    min_chars: int = 20,
+    min_chars_per_page: int = 30,
+    max_garbage_ratio: float = 0.1,
+) -> Tuple[bool, str]:
+    """
+    检查转换输出是否可用
+
+    参数:
+        path: 转换输出文件
+        pages: 源文档页数（未知时只检查总字符数）
+        min_chars: 正文最少字符数
+        min_chars_per_page: 每页平均最少字符数
+        max_garbage_ratio: 乱码字符（U+FFFD、控制字符、私用区字符、(cid:N)）占正文的最大比例
+
+    返回:
+        (passed, reason)
+    """
+    try:
+        chars, garbage = text_stats(path)
+    except OSError as e:
+        return False, f"无法读取输出: {e}"
+
+    if chars < min_chars:
+        return False, f"输出几乎为空（{chars} 个字符）"
+    if pages and chars < min_chars_per_page * pages:
+        return False, f"输出过少（{pages} 页共 {chars} 个字符）"
+    if garbage > chars * max_garbage_ratio:
+        return False, f"乱码比例过高（{garbage / chars:.0%}）"
+    return True, ""
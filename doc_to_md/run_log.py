@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+逐文件运行记录
+每个文档一行 JSON：引擎、输入字节数、页数、各阶段耗时（scan、probe、spawn、tool、check、copy、delete）
+以及转换子进程的 CPU 时间和峰值RSS（os.wait4 取得的该子进程资源使用）；
+运行结束时按引擎汇总耗时的 p50/p95/p99，吞吐下降时可以区分是引擎、磁盘还是个别文件的问题
+"""
+
+import json
+import math
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    from .limits import RSS_POLL_INTERVAL, ResourceLimitExceeded
+except ImportError:
+    from limits import RSS_POLL_INTERVAL, ResourceLimitExceeded
+
+# 记录中各阶段的顺序
+STAGES = ("scan", "probe", "spawn", "batch", "tool", "check", "copy", "delete")
+
+
+@dataclass
+class JobStats:
+    """一个文档的阶段耗时和子进程资源使用"""
+    stages: Dict[str, float] = field(default_factory=dict)
+    cpu_user: float = 0.0
+    cpu_sys: float = 0.0
+    max_rss_mb: float = 0.0
+    measured: bool = False  # 是否取得了子进程的资源使用（进程池中的 Python 引擎没有）
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def add_rusage(self, rusage, share: int = 1) -> None:
+        """
+        累加子进程的资源使用
+
+        参数:
+            share: 该进程处理的文档数（marker 批次），CPU 时间按文档平分，峰值RSS按整个进程计
+        """
+        if rusage is None:
+            return
+        share = max(1, share)
+        self.cpu_user += rusage.ru_utime / share
+        self.cpu_sys += rusage.ru_stime / share
+        # Linux 上 ru_maxrss 的单位是 KB
+        self.max_rss_mb = max(self.max_rss_mb, rusage.ru_maxrss / 1024)
+        self.measured = True
+
+
+def communicate_with_rusage(
+    proc: subprocess.Popen,
+    timeout: Optional[float],
+    kill: Callable[[subprocess.Popen], None],
+    watchdog: Optional[Callable[[], Optional[str]]] = None,
+) -> Tuple[Any, Any, Any]:
+    """
+    读取子进程输出并等待其结束，用 os.wait4 取得资源使用
+
+    subprocess 自己回收子进程时拿不到 rusage，这里由单独的线程阻塞在 wait4 上，
+    读管道的线程各自读到 EOF；超时时调用 kill 终止进程（组），等线程结束后抛出 TimeoutExpired
+
+    参数:
+        watchdog: 等待期间定期调用的检查函数，返回非空原因时终止进程（组）并抛出 ResourceLimitExceeded
+
+    返回:
+        (stdout, stderr, rusage)；不支持 wait4 的平台 rusage 为 None
+    """
+    if not hasattr(os, "wait4"):
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill(proc)
+            proc.communicate()
+            raise
+        return stdout, stderr, None
+
+    outputs: Dict[str, Any] = {}
+    reaped: Dict[str, Any] = {}
+
+    def read(name: str, stream) -> None:
+        try:
+            outputs[name] = stream.read()
+        finally:
+            stream.close()
+
+    def reap() -> None:
+        _, status, rusage = os.wait4(proc.pid, 0)
+        reaped["status"], reaped["rusage"] = status, rusage
+
+    threads = [threading.Thread(target=reap, daemon=True)]
+    threads += [threading.Thread(target=read, args=(name, stream), daemon=True)
+                for name, stream in (("stdout", proc.stdout), ("stderr", proc.stderr)) if stream is not None]
+    for t in threads:
+        t.start()
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    timed_out, limit_reason = False, None
+    for t in threads:
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if watchdog is not None:
+                remaining = RSS_POLL_INTERVAL if remaining is None else min(remaining, RSS_POLL_INTERVAL)
+            t.join(remaining)
+            if not t.is_alive():
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                timed_out = True
+                break
+            limit_reason = watchdog() if watchdog is not None else None
+            if limit_reason:
+                break
+        if timed_out or limit_reason:
+            break
+    if timed_out or limit_reason:
+        kill(proc)
+        for t in threads:
+            t.join()
+
+    if "status" in reaped:
+        proc.returncode = os.waitstatus_to_exitcode(reaped["status"])
+    else:
+        proc.wait()
+    if timed_out:
+        raise subprocess.TimeoutExpired(proc.args, timeout)
+    if limit_reason:
+        raise ResourceLimitExceeded(proc.args, limit_reason, outputs.get("stdout"), outputs.get("stderr"))
+    return outputs.get("stdout"), outputs.get("stderr"), reaped.get("rusage")
+
+
+def percentile(values: List[float], q: float) -> float:
+    """最近秩法分位数（values 须已排序）"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))
+    return values[index]
+
+
+def engine_percentiles(samples: Iterable[Tuple[str, float]]) -> Dict[str, Tuple[int, float, float, float]]:
+    """
+    按引擎汇总耗时分位数
+
+    参数:
+        samples: (引擎, 秒数) 序列
+
+    返回:
+        {引擎: (文档数, p50, p95, p99)}
+    """
+    by_engine: Dict[str, List[float]] = {}
+    for engine, seconds in samples:
+        by_engine.setdefault(engine, []).append(seconds)
+    summary = {}
+    for engine, values in sorted(by_engine.items()):
+        values.sort()
+        summary[engine] = (len(values), percentile(values, 0.50), percentile(values, 0.95), percentile(values, 0.99))
+    return summary
+
+
+class RunLog:
+    """逐文件运行记录（JSON Lines），多个线程共用"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def write(
+        self,
+        source: Path,
+        status: str,
+        engine: str,
+        seconds: float,
+        stats: Optional[JobStats],
+        input_bytes: Optional[int] = None,
+        pages: Optional[int] = None,
+        message: str = "",
+        failure: str = "",
+    ) -> None:
+        record: Dict[str, Any] = {
+            "ts": round(time.time(), 3),
+            "source": str(source),
+            "status": status,
+            "engine": engine,
+            "bytes": input_bytes,
+            "pages": pages,
+            "seconds": round(seconds, 4),
+        }
+        if stats is not None:
+            record["stages"] = {s: round(stats.stages[s], 4) for s in STAGES if s in stats.stages}
+            if stats.measured:
+                record["cpu_user"] = round(stats.cpu_user, 3)
+                record["cpu_sys"] = round(stats.cpu_sys, 3)
+                record["max_rss_mb"] = round(stats.max_rss_mb, 1)
+        if failure:
+            record["failure"] = failure
+        if status != "ok" and message:
+            record["message"] = message.splitlines()[0]
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+临时输出目录与原子发布
+转换工具的中间输出写到本地磁盘或 tmpfs 上的临时目录（而不是可能位于 NFS 上的扫描根目录），
+最终的 Markdown 通过一次同文件系统的 rename，或一次流式复制加 rename 发布，
+读取方永远看不到写了一半的文件
+"""
+
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Optional
+
+# 根目录下的旧式临时目录（没有合适的本地临时目录时使用）
+LEGACY_DIR_NAME = "_marker_outputs"
+
+
+def free_space_mb(path: Path) -> int:
+    try:
+        st = os.statvfs(path)
+    except (OSError, AttributeError):
+        return 0
+    return st.f_bavail * st.f_frsize // (1024 * 1024)
+
+
+def choose_scratch_dir(configured: str, root: Path, min_free_mb: int = 1024) -> Path:
+    """
+    选择临时输出目录
+
+    参数:
+        configured: 配置或命令行指定的目录，为空表示自动选择
+        root: 扫描根目录
+        min_free_mb: 自动选择时要求的最小可用空间（MB）
+
+    返回:
+        临时目录路径：指定目录；否则 $XDG_RUNTIME_DIR 或 /dev/shm 下的 doc_to_md-<uid>
+        （可用空间足够时）；都不合适时退回 <root>/_marker_outputs
+    """
+    if configured:
+        return Path(configured).expanduser().resolve()
+
+    candidates = [os.environ.get("XDG_RUNTIME_DIR", ""), "/dev/shm"]
+    for base in candidates:
+        if not base or not os.path.isdir(base) or not os.access(base, os.W_OK | os.X_OK):
+            continue
+        if free_space_mb(Path(base)) < min_free_mb:
+            continue
+        # 共享的 tmpfs 上按用户区分，避免与其他用户的目录冲突
+        uid = os.getuid() if hasattr(os, "getuid") else 0
+        return Path(base) / f"doc_to_md-{uid}"
+    return root / LEGACY_DIR_NAME
+
+
+def publish_file(src: Path, dest: Path, move: bool = False) -> None:
+    """
+    原子地把 src 发布为 dest
+
+    参数:
+        move: 为真且两者在同一文件系统上时直接 rename（src 随之消失）；
+              否则先流式复制到 dest 同目录下的临时文件，再 rename 覆盖 dest
+    """
+    if move:
+        try:
+            os.replace(src, dest)
+            return
+        except OSError:
+            # 跨文件系统（EXDEV）等情况退回复制
+            pass
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dest)
+    except BaseException:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        raise
+
+
+def remove_empty_dir(path: Optional[Path]) -> None:
+    if path is None:
+        return
+    try:
+        path.rmdir()
+    except OSError:
+        pass
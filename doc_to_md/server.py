@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+常驻转换服务（--serve）
+配置加载、工具探测和 Python 引擎进程池（预先导入 pdfminer 和内置 DOCX 引擎）只在启动时进行一次，
+之后通过 HTTP/1.1 接收转换请求，内部服务不必为每个文件启动一次命令行：
+- 监听 localhost 的 TCP 端口，或 Unix 套接字（unix:/path/to/sock，可用 curl --unix-socket 调用）
+- POST /convert              JSON {"path": ..., "force": false, "format": "path" | "markdown"}，转换根目录下的文件
+- POST /upload?name=a.pdf    请求体为文件内容，返回 Markdown（format=json 时返回 JSON）
+- GET  /health               服务状态
+同时到达的请求先收集 batch_window 秒再一起准备（PDF 分类、代价估算、marker 批次），
+同一个文件的并发请求共享一次转换
+"""
+
+import asyncio
+import json
+import shutil
+import signal
+import socket
+import time
+import uuid
+from contextlib import suppress
+from functools import partial
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    from .aio import Orchestrator
+except ImportError:
+    from aio import Orchestrator
+
+# 请求行加头部的最大长度（字节）
+MAX_HEADER_BYTES = 64 * 1024
+
+# JSON 请求体的上限（字节）
+MAX_JSON_BYTES = 1024 * 1024
+
+# 上传内容分块写入磁盘的块大小（字节）
+UPLOAD_CHUNK = 1024 * 1024
+
+# 长连接空闲多久后关闭（秒）
+IDLE_TIMEOUT = 300
+
+_JSON = "application/json; charset=utf-8"
+_MARKDOWN = "text/markdown; charset=utf-8"
+
+
+class HttpError(Exception):
+    """以给定状态码回答请求的错误"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """
+    解析监听地址
+
+    参数:
+        address: "主机:端口"、"端口"（监听 127.0.0.1）或 "unix:套接字路径"
+
+    返回:
+        ("unix", Path) 或 ("tcp", (host, port))
+
+    异常:
+        ValueError: 地址格式不正确
+    """
+    if address.startswith("unix:"):
+        if not address[5:]:
+            raise ValueError("unix: 后面需要套接字路径")
+        return "unix", Path(address[5:]).expanduser()
+    host, sep, port = address.rpartition(":")
+    if not sep:
+        host, port = "", address
+    try:
+        number = int(port)
+    except ValueError:
+        raise ValueError(f"无效的监听地址: {address}（应为 主机:端口 或 unix:路径）") from None
+    if not 0 <= number <= 65535:
+        raise ValueError(f"端口超出范围: {number}")
+    return "tcp", (host.strip("[]") or "127.0.0.1", number)
+
+
+def _json(payload: Dict[str, Any]) -> bytes:
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def _response(status: int, body: bytes, content_type: str, keep_alive: bool) -> bytes:
+    head = [
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+
+class ConversionServer:
+    """
+    HTTP 转换服务
+
+    转换本身由调用方提供（convert、prepare），本类负责协议、请求合并和调度：
+    文档按路径去重，转换开始后才到达的同一文件的请求在本次结束后再转换一次
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        suffixes: Set[str],
+        limit: Callable[[], int],
+        convert: Callable[[Path, bool], Awaitable[Any]],
+        prepare: Callable[[List[Path]], Awaitable[List[Path]]],
+        upload_dir: Path,
+        max_upload_bytes: int = 0,
+        batch_window: float = 0.0,
+        status: Optional[Callable[[], Dict[str, Any]]] = None,
+        log: Callable[[str], None] = print,
+    ):
+        """
+        参数:
+            root: /convert 允许转换的根目录（路径必须在其下）
+            suffixes: 接受的扩展名（小写，如 {".pdf", ".docx"}）
+            limit: 返回同时转换的文档数上限
+            convert: convert(doc_path, force) 转换一个文档，返回 TaskResult
+            prepare: 转换前准备一批文档（分类、估算、安排 marker 批次），返回提交顺序
+            upload_dir: 上传文件的临时目录（每个请求一个子目录，回答后删除）
+            max_upload_bytes: 上传大小上限，0 表示不限制
+            batch_window: 收集同时到达的请求的时间（秒），0 表示立即准备
+            status: 返回附加到 /health 的状态
+            log: 输出服务消息
+        """
+        self.root = root
+        self.suffixes = suffixes
+        self.upload_dir = upload_dir
+        self.max_upload_bytes = max_upload_bytes
+        self.batch_window = max(0.0, batch_window)
+        self._convert = convert
+        self._prepare = prepare
+        self._status = status
+        self._log = log
+        self._orchestrator = Orchestrator(limit, self._on_done)
+        self._waiting: Dict[Path, List[asyncio.Future]] = {}  # 等待下一次转换的请求
+        self._current: Dict[Path, List[asyncio.Future]] = {}  # 转换中的文档及其请求
+        self._later: Dict[Path, List[asyncio.Future]] = {}  # 转换开始后才到达的请求
+        self._force: Dict[Path, bool] = {}
+        self._intake: Optional[asyncio.Queue] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._connections: Set[asyncio.StreamWriter] = set()
+        self.started = time.time()
+        self.served = 0
+        self.failed = 0
+
+    # ------------------------------------------------------------------
+    # 调度
+    # ------------------------------------------------------------------
+
+    def _request(self, doc_path: Path, force: bool) -> asyncio.Future:
+        """登记一个转换请求，返回在转换结束时得到 TaskResult 的 future"""
+        future = asyncio.get_running_loop().create_future()
+        if doc_path in self._current:
+            # 文件可能在转换开始后才被改写：本次结束后为这些请求再转换一次
+            self._later.setdefault(doc_path, []).append(future)
+        else:
+            if doc_path not in self._waiting:
+                self._intake.put_nowait(doc_path)
+            self._waiting.setdefault(doc_path, []).append(future)
+        self._force[doc_path] = self._force.get(doc_path, False) or force
+        return future
+
+    async def _job(self, doc_path: Path):
+        self._current[doc_path] = self._waiting.pop(doc_path, [])
+        return await self._convert(doc_path, self._force.pop(doc_path, False))
+
+    def _on_done(self, doc_path: Path, task: asyncio.Task) -> None:
+        waiters = self._current.pop(doc_path, None)
+        if waiters is None:  # 还没开始就被取消
+            waiters = self._waiting.pop(doc_path, [])
+        for future in waiters:
+            if future.done():
+                continue
+            if task.cancelled():
+                future.set_exception(HttpError(503, "服务正在关闭，转换已取消"))
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+        later = self._later.pop(doc_path, None)
+        if later and not self._orchestrator.stopping:
+            self._waiting[doc_path] = later
+            self._intake.put_nowait(doc_path)
+        self._check_idle()
+
+    async def _gather(self) -> None:
+        """把同时到达的请求合在一起准备（marker 可以成批转换），再交给调度器"""
+        while True:
+            batch = [await self._intake.get()]
+            if self.batch_window:
+                await asyncio.sleep(self.batch_window)
+            while not self._intake.empty():
+                batch.append(self._intake.get_nowait())
+            try:
+                order = await self._prepare(batch)
+            except Exception as e:
+                # 准备失败不影响转换本身：按到达顺序提交
+                self._log(f"准备文档时出错: {e}")
+                order = batch
+            for doc_path in order:
+                self._orchestrator.submit(doc_path, partial(self._job, doc_path))
+
+    def _check_idle(self) -> None:
+        if self._closing is not None and self._closing.is_set() and self._intake.empty() \
+                and not self._waiting and not self._current and not self._later:
+            self._idle.set()
+
+    def _abort(self) -> None:
+        """第二次中断：终止运行中的转换，等待中的请求以 503 回答"""
+        self._orchestrator.stop()
+        self._orchestrator.cancel_running()
+        for waiters in (*self._waiting.values(), *self._later.values()):
+            for future in waiters:
+                if not future.done():
+                    future.set_exception(HttpError(503, "服务正在关闭"))
+        self._waiting.clear()
+        self._later.clear()
+        while not self._intake.empty():
+            self._intake.get_nowait()
+        self._idle.set()
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+
+    async def _read_head(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str]]]:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if not e.partial.strip():
+                return None  # 客户端关闭了连接
+            raise HttpError(400, "请求不完整")
+        except asyncio.LimitOverrunError:
+            raise HttpError(431, "请求头过长")
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split()
+        if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+            raise HttpError(400, "无法解析的请求行")
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        return parts[0].upper(), parts[1], headers
+
+    @staticmethod
+    def _content_length(headers: Dict[str, str], required: bool) -> int:
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HttpError(411, "不支持分块传输，请给出 Content-Length")
+        value = headers.get("content-length")
+        if value is None:
+            if required:
+                raise HttpError(411, "需要 Content-Length")
+            return 0
+        try:
+            length = int(value)
+        except ValueError:
+            raise HttpError(400, "无效的 Content-Length") from None
+        if length < 0:
+            raise HttpError(400, "无效的 Content-Length")
+        return length
+
+    @staticmethod
+    def _continue(headers: Dict[str, str], writer: asyncio.StreamWriter) -> None:
+        # curl 上传较大的文件时先发送 Expect: 100-continue，等待确认后才发送请求体
+        if headers.get("expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(writer)
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_head(reader), IDLE_TIMEOUT)
+                except (asyncio.TimeoutError, ConnectionError):
+                    break
+                except HttpError as e:
+                    writer.write(_response(e.status, _json({"status": "error", "message": e.message}), _JSON, False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, headers = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    status, body, content_type = await self._dispatch(method, target, headers, reader, writer)
+                except HttpError as e:
+                    # 请求体可能没有读完，不再复用这个连接
+                    status, body, content_type = e.status, _json({"status": "error", "message": e.message}), _JSON
+                    keep_alive = False
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                except Exception as e:
+                    status, body, content_type = 500, _json({"status": "error", "message": f"{type(e).__name__}: {e}"}), _JSON
+                    keep_alive = False
+                if self._closing.is_set():
+                    keep_alive = False
+                writer.write(_response(status, body, content_type, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+            with suppress(Exception):
+                await writer.wait_closed()
+
+    async def _dispatch(self, method: str, target: str, headers: Dict[str, str],
+                        reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Tuple[int, bytes, str]:
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        routes = {"/health": ("GET",), "/convert": ("POST",), "/upload": ("POST", "PUT")}
+        if url.path not in routes:
+            raise HttpError(404, f"未知的路径: {url.path}")
+        if method not in routes[url.path]:
+            raise HttpError(405, f"{url.path} 不支持 {method}")
+        if url.path == "/health":
+            return 200, _json(self.health()), _JSON
+        if self._closing.is_set():
+            raise HttpError(503, "服务正在关闭")
+        if url.path == "/convert":
+            return await self._convert_path(headers, reader, writer)
+        return await self._convert_upload(query, headers, reader, writer)
+
+    def health(self) -> Dict[str, Any]:
+        status = {
+            "status": "closing" if self._closing is not None and self._closing.is_set() else "ok",
+            "root": str(self.root),
+            "uptime": round(time.time() - self.started, 1),
+            "running": self._orchestrator.running,
+            "pending": self._orchestrator.pending + len(self._waiting),
+            "served": self.served,
+            "failed": self.failed,
+        }
+        if self._status is not None:
+            status.update(self._status())
+        return status
+
+    async def _convert_path(self, headers: Dict[str, str], reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter) -> Tuple[int, bytes, str]:
+        length = self._content_length(headers, required=False)
+        if length > MAX_JSON_BYTES:
+            raise HttpError(413, "请求体过大")
+        self._continue(headers, writer)
+        try:
+            payload = json.loads(await reader.readexactly(length) or b"{}")
+        except ValueError:
+            raise HttpError(400, "请求体不是有效的 JSON") from None
+        if not isinstance(payload, dict) or not isinstance(payload.get("path"), str) or not payload["path"]:
+            raise HttpError(400, '请求体应为 {"path": "..."}')
+        output_format = payload.get("format", "path")
+        if output_format not in ("path", "markdown"):
+            raise HttpError(400, "format 应为 path 或 markdown")
+
+        def locate() -> Path:
+            path = Path(payload["path"]).expanduser()
+            path = (path if path.is_absolute() else self.root / path).resolve()
+            if not path.is_relative_to(self.root):
+                raise HttpError(403, f"路径不在服务根目录 {self.root} 下")
+            if path.suffix.lower() not in self.suffixes:
+                raise HttpError(415, f"不支持的文件类型: {path.suffix or '（无扩展名）'}")
+            if not path.is_file():
+                raise HttpError(404, f"文件不存在: {path}")
+            return path
+
+        doc_path = await asyncio.to_thread(locate)
+        result = await self._request(doc_path, bool(payload.get("force", False)))
+        return await self._answer(result, output_format, include_paths=True)
+
+    async def _convert_upload(self, query: Dict[str, str], headers: Dict[str, str], reader: asyncio.StreamReader,
+                              writer: asyncio.StreamWriter) -> Tuple[int, bytes, str]:
+        name = Path(query.get("name", "")).name  # 只取文件名，上传不能指定目录
+        if not name:
+            raise HttpError(400, "需要 name 参数（含扩展名的文件名）")
+        if Path(name).suffix.lower() not in self.suffixes:
+            raise HttpError(415, f"不支持的文件类型: {Path(name).suffix or '（无扩展名）'}")
+        output_format = query.get("format", "markdown")
+        if output_format not in ("markdown", "json"):
+            raise HttpError(400, "format 应为 markdown 或 json")
+        length = self._content_length(headers, required=True)
+        if self.max_upload_bytes and length > self.max_upload_bytes:
+            raise HttpError(413, f"上传内容超过上限 {self.max_upload_bytes // (1024 * 1024)}MB")
+
+        job_dir = self.upload_dir / uuid.uuid4().hex
+        doc_path = job_dir / name
+        await asyncio.to_thread(job_dir.mkdir, parents=True)
+        try:
+            self._continue(headers, writer)
+            f = await asyncio.to_thread(open, doc_path, "wb")
+            try:
+                remaining = length
+                while remaining:
+                    chunk = await reader.read(min(UPLOAD_CHUNK, remaining))
+                    if not chunk:
+                        raise asyncio.IncompleteReadError(b"", remaining)
+                    await asyncio.to_thread(f.write, chunk)
+                    remaining -= len(chunk)
+            finally:
+                await asyncio.to_thread(f.close)
+            # 上传的文件总是新的，不受同名 Markdown 是否存在影响
+            result = await self._request(doc_path, True)
+            return await self._answer(result, output_format, include_paths=False)
+        finally:
+            await asyncio.to_thread(shutil.rmtree, job_dir, True)
+
+    async def _answer(self, result, output_format: str, include_paths: bool) -> Tuple[int, bytes, str]:
+        self.served += 1
+        payload: Dict[str, Any] = {"status": result.status, "engine": result.engine,
+                                   "seconds": round(result.seconds, 3), "message": result.message}
+        if include_paths:
+            payload.update(source=str(result.doc_path), output=str(result.md_path))
+        if result.status == "failed":
+            self.failed += 1
+            payload["failure"] = result.failure
+            status = {"cancelled": 503, "timeout": 504}.get(result.failure, 422)
+            return status, _json(payload), _JSON
+        if output_format == "path":
+            return 200, _json(payload), _JSON
+        markdown = await asyncio.to_thread(result.md_path.read_bytes)
+        if output_format == "markdown":
+            return 200, markdown, _MARKDOWN
+        payload["markdown"] = markdown.decode("utf-8", errors="replace")
+        return 200, _json(payload), _JSON
+
+    # ------------------------------------------------------------------
+    # 运行
+    # ------------------------------------------------------------------
+
+    async def serve(self, address: str, ready: Optional[Callable[[str], None]] = None) -> None:
+        """
+        监听并处理请求，直到 SIGINT/SIGTERM
+
+        第一次信号停止接受新请求，已接受的请求完成后返回；第二次信号终止运行中的转换
+
+        参数:
+            address: 监听地址（见 parse_address）
+            ready: 开始监听后以实际地址调用（端口为 0 时可得知分配的端口）
+
+        异常:
+            ValueError: 地址格式不正确
+            OSError: 无法监听（端口被占用、套接字已有服务在监听等）
+        """
+        kind, where = parse_address(address)
+        loop = asyncio.get_running_loop()
+        self._intake = asyncio.Queue()
+        self._closing = asyncio.Event()
+        self._idle = asyncio.Event()
+        if kind == "unix":
+            await asyncio.to_thread(_remove_stale_socket, where)
+            server = await asyncio.start_unix_server(self._handle, path=str(where), limit=MAX_HEADER_BYTES)
+            listening = f"unix:{where}"
+        else:
+            server = await asyncio.start_server(self._handle, host=where[0], port=where[1], limit=MAX_HEADER_BYTES)
+            host, port = server.sockets[0].getsockname()[:2]
+            listening = f"http://[{host}]:{port}" if ":" in host else f"http://{host}:{port}"
+
+        def on_signal() -> None:
+            if not self._closing.is_set():
+                self._closing.set()
+                self._log("正在关闭：不再接受新请求，等待已接受的请求完成（再按一次 Ctrl-C 立即终止）")
+            else:
+                self._log("再次中断：终止运行中的转换")
+                self._abort()
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            with suppress(NotImplementedError, RuntimeError):
+                loop.add_signal_handler(signum, on_signal)
+        self._orchestrator.hold_open()
+        runner = asyncio.ensure_future(self._orchestrator.run())
+        gatherer = asyncio.ensure_future(self._gather())
+        if ready is not None:
+            ready(listening)
+        try:
+            await self._closing.wait()
+            server.close()
+            self._check_idle()
+            await self._idle.wait()
+        finally:
+            gatherer.cancel()
+            self._orchestrator.close()
+            await runner
+            for writer in list(self._connections):
+                writer.close()  # 空闲的长连接
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                with suppress(NotImplementedError, RuntimeError):
+                    loop.remove_signal_handler(signum)
+            if kind == "unix":
+                with suppress(OSError):
+                    where.unlink()
+
+
+def _remove_stale_socket(path: Path) -> None:
+    """删除上次运行残留的套接字文件；仍有服务在监听时抛出 OSError"""
+    if not path.is_socket():
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(str(path))
+    except OSError:
+        path.unlink()
+        return
+    finally:
+        probe.close()
+    raise OSError(f"套接字 {path} 上已有服务在监听")
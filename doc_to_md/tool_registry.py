@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+转换工具能力注册表
+每次运行只探测一次各转换工具（路径、版本、支持的参数），
+并把探测结果缓存到磁盘（按可执行文件路径和 mtime 失效），下次运行直接复用
+"""
+
+import importlib.util
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+
+# 外部命令行工具：名称 -> 探测版本/参数时使用的命令参数
+EXTERNAL_TOOLS: Dict[str, List[str]] = {
+    "marker": ["--help"],
+    "pdftotext": ["-v"],
+    "pandoc": ["--version"],
+    "antiword": [],
+    "catdoc": [],
+}
+
+# Python 库工具：名称 -> 模块名 / 发行包名
+PYTHON_TOOLS: Dict[str, Tuple[str, str]] = {
+    "pdfminer": ("pdfminer", "pdfminer.six"),
+}
+
+CACHE_VERSION = 1
+
+
+@dataclass(frozen=True)
+class ToolInfo:
+    """单个转换工具的探测结果"""
+    name: str
+    available: bool
+    path: str = ""
+    version: str = ""
+    flags: Tuple[str, ...] = field(default_factory=tuple)
+
+    def supports(self, flag: str) -> bool:
+        """工具的帮助信息中是否出现过该参数"""
+        return flag in self.flags
+
+
+def default_cache_path() -> Path:
+    """探测缓存文件的默认位置：$XDG_CACHE_HOME/doc_to_md/tools.json"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(cache_home) / "doc_to_md" / "tools.json"
+
+
+def _binary_mtime(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return -1
+
+
+def _parse_flags(text: str) -> Tuple[str, ...]:
+    return tuple(sorted(set(re.findall(r"(?<![\w-])--[A-Za-z][\w-]*", text))))
+
+
+def _parse_version(text: str) -> str:
+    for line in text.splitlines():
+        m = re.search(r"\d+(?:\.\d+)+", line)
+        if m:
+            return m.group(0)
+    return ""
+
+
+class ToolRegistry:
+    """
+    转换工具注册表
+
+    get() 对每个工具只探测一次（线程安全），结果同时写入磁盘缓存；
+    缓存条目以可执行文件的路径和 mtime 为键，工具被升级或替换后自动重新探测
+    """
+
+    def __init__(self, cache_path: Optional[Path] = None, use_cache: bool = True):
+        """
+        参数:
+            cache_path: 磁盘缓存路径，None 使用默认位置
+            use_cache: 是否读写磁盘缓存
+        """
+        self.cache_path = Path(cache_path) if cache_path else default_cache_path()
+        self.use_cache = use_cache
+        self._tools: Dict[str, ToolInfo] = {}
+        self._lock = threading.Lock()
+        self._disk: Dict[str, Any] = self._load_disk_cache() if use_cache else {}
+        self._dirty = False
+
+    def _load_disk_cache(self) -> Dict[str, Any]:
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                return data.get("tools", {})
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def save(self) -> None:
+        """把新探测的结果写回磁盘缓存（原子替换）"""
+        if not self.use_cache or not self._dirty:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({"version": CACHE_VERSION, "tools": self._disk}, f, indent=2)
+            os.replace(tmp, self.cache_path)
+            self._dirty = False
+        except OSError as e:
+            print(f"警告: 无法写入工具探测缓存 {self.cache_path}: {e}")
+
+    def get(self, name: str) -> ToolInfo:
+        """获取工具信息，本次运行内只探测一次"""
+        with self._lock:
+            info = self._tools.get(name)
+            if info is None:
+                info = self._resolve(name)
+                self._tools[name] = info
+            return info
+
+    def available(self, name: str) -> bool:
+        return self.get(name).available
+
+    def path(self, name: str) -> str:
+        """工具的可执行文件路径（不可用时返回工具名本身）"""
+        return self.get(name).path or name
+
+    def probe_all(self, names: Optional[List[str]] = None) -> Dict[str, ToolInfo]:
+        """批量探测（启动时调用一次），并保存磁盘缓存"""
+        names = names or list(EXTERNAL_TOOLS) + list(PYTHON_TOOLS)
+        result = {name: self.get(name) for name in names}
+        self.save()
+        return result
+
+    def _resolve(self, name: str) -> ToolInfo:
+        if name in PYTHON_TOOLS:
+            return self._resolve_python(name)
+        return self._resolve_external(name)
+
+    def _resolve_python(self, name: str) -> ToolInfo:
+        module, dist = PYTHON_TOOLS[name]
+        if importlib.util.find_spec(module) is None:
+            return ToolInfo(name, False)
+        version = ""
+        try:
+            from importlib.metadata import version as dist_version
+            version = dist_version(dist)
+        except Exception:
+            pass
+        return ToolInfo(name, True, path=module, version=version)
+
+    def _resolve_external(self, name: str) -> ToolInfo:
+        path = shutil.which(name)
+        if path is None:
+            return ToolInfo(name, False)
+
+        mtime = _binary_mtime(path)
+        cached = self._disk.get(name)
+        if cached and cached.get("path") == path and cached.get("mtime") == mtime:
+            return ToolInfo(name, cached["available"], path=path,
+                            version=cached.get("version", ""),
+                            flags=tuple(cached.get("flags", ())))
+
+        info = self._probe_external(name, path)
+        self._disk[name] = {"mtime": mtime, **asdict(info)}
+        self._dirty = True
+        return info
+
+    def _probe_external(self, name: str, path: str) -> ToolInfo:
+        probe_args = EXTERNAL_TOOLS.get(name, [])
+        if not probe_args:
+            return ToolInfo(name, True, path=path)
+
+        try:
+            proc = subprocess.run([path, *probe_args], capture_output=True, text=True, timeout=5)
+            output = (proc.stdout or "") + "\n" + (proc.stderr or "")
+        except (OSError, subprocess.SubprocessError):
+            return ToolInfo(name, False, path=path)
+
+        flags = _parse_flags(output)
+        available = True
+        if name == "marker":
+            # 同名的其他 marker 程序不能用于 PDF 转换
+            available = "--output" in output
+        return ToolInfo(name, available, path=path, version=_parse_version(output), flags=flags)
+
+
+_default_registry: Optional[ToolRegistry] = None
+_default_lock = threading.Lock()
+
+
+def get_default_registry() -> ToolRegistry:
+    """进程内共享的注册表（未显式传入注册表时使用）"""
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = ToolRegistry()
+        return _default_registry
+
+
+if __name__ == "__main__":
+    registry = ToolRegistry()
+    for tool in registry.probe_all().values():
+        status = "可用" if tool.available else "不可用"
+        print(f"{tool.name:12} {status:4} {tool.version:10} {tool.path}")
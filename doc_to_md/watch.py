@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+目录监视（--watch）
+初次扫描之后只处理新增和修改的文件，不再反复遍历整个目录树：
+- Linux 上通过 inotify（ctypes 调用 libc）为每个目录添加监视，新建的子目录自动加入
+- 不支持 inotify、或监视数达到 fs.inotify.max_user_watches 上限时，退回按间隔轮询（比较大小和修改时间）
+- 仍在写入的文件先不交出：最后一次事件后静默 settle 秒、且修改时间早于 settle 秒之前才算写完；
+  inotify 模式下还要等写入者关闭文件（IN_CLOSE_WRITE），写到一半暂停的复制不会被提前转换
+
+md_to_pdf 和 xlsx_to_csv 的 --watch 也使用这里的 TreeWatcher，各自只提供 accept/skip_dir 判断
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# inotify 事件掩码（<sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+_DIR_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+             | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+# 默认的静默时间和轮询间隔（秒）
+DEFAULT_SETTLE = 2.0
+DEFAULT_POLL_INTERVAL = 5.0
+
+# 仍被打开写入（有修改事件而没有 IN_CLOSE_WRITE）的文件最多等待多久（秒）；
+# 一直不关闭的写入者（日志式追加、mmap）到时后按静默时间判断
+OPEN_WRITE_LIMIT = 300.0
+
+
+class _Inotify:
+    """inotify 文件描述符的最小封装"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self.fd = fd
+
+    def add(self, path: Path) -> int:
+        wd = self._add_watch(self.fd, os.fsencode(str(path)), _DIR_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), str(path))
+        return wd
+
+    def read(self, timeout: float) -> Iterator[Tuple[int, int, str]]:
+        """等待最多 timeout 秒，逐个产出 (wd, mask, name)"""
+        ready, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not ready:
+            return
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            yield wd, mask, name
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class TreeWatcher:
+    """
+    监视一个目录树中被接受的文件的新增和修改
+
+    wait() 返回已经写完（静默 settle 秒）的变化文件；在监视开始之前已存在的文件不会返回，
+    应在创建监视器之后再做初次扫描，两者之间新建的文件不会遗漏（重复出现无妨，转换时会跳过）
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        accept: Callable[[Path], bool],
+        skip_dir: Callable[[Path], bool],
+        settle: float = DEFAULT_SETTLE,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        use_inotify: bool = True,
+    ):
+        """
+        参数:
+            root: 监视的根目录
+            accept: 判断文件是否需要处理（按扩展名、隐藏文件等）
+            skip_dir: 判断子目录是否跳过（排除目录、隐藏目录、临时目录）
+            settle: 文件最后一次变化后的静默时间，之后才交出
+            poll_interval: 轮询模式下两次扫描的间隔
+            use_inotify: False 表示总是轮询（如监视 NFS/SMB 挂载，远端写入不产生 inotify 事件）
+        """
+        self.root = root
+        self.accept = accept
+        self.skip_dir = skip_dir
+        self.settle = max(0.0, settle)
+        self.poll_interval = max(0.5, poll_interval)
+        self.reason = ""  # 退回轮询的原因
+        self._pending: Dict[Path, float] = {}  # 变化文件 -> 最后一次事件的时间（monotonic）
+        self._writing: Dict[Path, float] = {}  # 打开写入尚未关闭的文件 -> 第一次写入事件的时间
+        self._inotify: Optional[_Inotify] = None
+        self._dirs: Dict[int, Path] = {}
+        self._snapshot: Dict[Path, Tuple[int, int]] = {}
+        self._next_poll = 0.0
+
+        if use_inotify:
+            try:
+                self._inotify = _Inotify()
+                self._watch_tree(root)
+            except (OSError, AttributeError) as e:
+                if self._inotify is not None:
+                    self._inotify.close()
+                    self._inotify = None
+                self.reason = e.strerror if isinstance(e, OSError) and e.strerror else str(e)
+                if isinstance(e, OSError) and e.errno == errno.ENOSPC:
+                    self.reason = "inotify 监视数达到上限（fs.inotify.max_user_watches）"
+                self._dirs.clear()
+        if self._inotify is None:
+            self._snapshot = dict(self._scan(root))
+            self._next_poll = time.monotonic() + self.poll_interval
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._inotify is not None else "poll"
+
+    # ------------------------------------------------------------------
+    # 目录树
+    # ------------------------------------------------------------------
+
+    def _walk_dirs(self, top: Path) -> Iterator[Path]:
+        stack = [top]
+        while stack:
+            directory = stack.pop()
+            yield directory
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False) and not self.skip_dir(Path(entry.path)):
+                            stack.append(Path(entry.path))
+            except OSError:
+                continue
+
+    def _scan(self, top: Path) -> Iterator[Tuple[Path, Tuple[int, int]]]:
+        """top 下所有被接受的文件及其 (大小, 修改时间)"""
+        for directory in self._walk_dirs(top):
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        path = Path(entry.path)
+                        if self.accept(path):
+                            st = entry.stat(follow_symlinks=False)
+                            yield path, (st.st_size, st.st_mtime_ns)
+            except OSError:
+                continue
+
+    def _watch_tree(self, top: Path) -> None:
+        for directory in self._walk_dirs(top):
+            try:
+                self._dirs[self._inotify.add(directory)] = directory
+            except OSError as e:
+                if e.errno in (errno.ENOSPC, errno.ENOMEM):
+                    raise
+                # 目录在遍历期间被删除或没有权限：跳过
+
+    # ------------------------------------------------------------------
+    # 事件
+    # ------------------------------------------------------------------
+
+    def _touch(self, path: Path) -> None:
+        self._pending[path] = time.monotonic()
+
+    def _read_events(self, timeout: float) -> None:
+        for wd, mask, name in self._inotify.read(timeout):
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出：无法知道哪些文件变了，把整个目录树的文件都重新交出（已是最新的文档会被跳过）
+                for path, _ in self._scan(self.root):
+                    self._touch(path)
+                continue
+            directory = self._dirs.get(wd)
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            if directory is None or not name:
+                continue
+            path = directory / name
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not self.skip_dir(path):
+                    # 新建或移入的目录：加入监视，其中已有的文件（监视建立之前写入的）也交出
+                    try:
+                        self._watch_tree(path)
+                    except OSError as e:
+                        print(f"警告: 无法监视新目录 {path}: {e}")
+                    for file_path, _ in self._scan(path):
+                        self._touch(file_path)
+                continue
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self._pending.pop(path, None)
+                self._writing.pop(path, None)
+            elif self.accept(path):
+                self._touch(path)
+                if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    self._writing.pop(path, None)
+                elif mask & (IN_CREATE | IN_MODIFY):
+                    self._writing.setdefault(path, time.monotonic())
+
+    def _poll(self) -> None:
+        snapshot = dict(self._scan(self.root))
+        for path, signature in snapshot.items():
+            if self._snapshot.get(path) != signature:
+                self._touch(path)
+        for path in self._snapshot.keys() - snapshot.keys():
+            self._pending.pop(path, None)
+        self._snapshot = snapshot
+
+    def _settled(self) -> List[Path]:
+        """静默时间已到、且修改时间早于 settle 秒之前的文件（远端写入、轮询模式下同样有效）"""
+        now, wall = time.monotonic(), time.time()
+        ready = []
+        for path, last in list(self._pending.items()):
+            if now - last < self.settle:
+                continue
+            opened = self._writing.get(path)
+            if opened is not None and now - opened < OPEN_WRITE_LIMIT:
+                continue
+            try:
+                st = path.stat()
+            except OSError:
+                del self._pending[path]  # 已被删除或移走
+                self._writing.pop(path, None)
+                continue
+            if wall - st.st_mtime < self.settle:
+                self._pending[path] = now  # 仍在写入：再等一个静默期
+                continue
+            del self._pending[path]
+            self._writing.pop(path, None)
+            ready.append(path)
+        return sorted(ready)
+
+    def wait(self, timeout: float) -> List[Path]:
+        """
+        等待最多 timeout 秒，返回已写完的新增或修改文件（可能为空）
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            ready = self._settled()
+            remaining = deadline - time.monotonic()
+            if ready or remaining <= 0:
+                return ready
+            # 有待确认的文件时，最迟在它的静默期结束时醒来
+            step = remaining
+            quiet = [last for path, last in self._pending.items() if path not in self._writing]
+            if quiet:
+                step = min(step, max(0.05, min(quiet) + self.settle - time.monotonic()))
+            if self._inotify is not None:
+                self._read_events(step)
+            else:
+                now = time.monotonic()
+                if now >= self._next_poll:
+                    self._poll()
+                    self._next_poll = now + self.poll_interval
+                    continue
+                time.sleep(min(step, self._next_poll - now))
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
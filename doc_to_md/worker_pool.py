@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Python 后备转换引擎的常驻进程池
+worker 进程启动时预先导入 pdf_converter / docx_converter 及 pdfminer，
+之后直接调用转换函数，避免每个文档都启动一次 python3 解释器并重新导入模块；
+每个 worker 处理固定数量的任务后自动回收，释放可能泄漏的内存。
+每个 worker 有自己的任务管道：任务超时或被取消时只终止并替换执行它的 worker，
+超时的任务不会在后台继续运行、写出过期的输出或占住进程池
+"""
+
+import asyncio
+import contextlib
+import io
+import multiprocessing as mp
+import os
+import signal
+import sys
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional, Set, Tuple
+
+# worker 进程中可以导入同目录下的转换器模块
+sys.path.insert(0, str(Path(__file__).parent))
+
+try:
+    from .limits import EngineLimits, ResourceLimitExceeded, cpu_budget, limit_worker
+except ImportError:
+    from limits import EngineLimits, ResourceLimitExceeded, cpu_budget, limit_worker
+
+# 进程池能处理的引擎名称（与 build_converter_cmd 返回的 tool_name 对应）
+POOL_ENGINES = {"python", "docx-converter"}
+
+# 关闭进程池时等待空闲 worker 自行退出的时间（秒），之后强制终止
+CLOSE_GRACE = 5
+
+
+def _init_worker(limits: Optional[EngineLimits] = None) -> None:
+    """worker 初始化：设置资源限制，预先导入转换模块（导入失败的库留给转换函数自行处理）"""
+    # Ctrl-C 由主进程处理（排空或 terminate），worker 不随终端的 SIGINT 中断正在进行的转换
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if limits is not None and limits.active:
+        limit_worker(limits)
+    import pdf_converter  # noqa: F401
+    import docx_converter  # noqa: F401
+    for module in ("pdfminer.high_level",):
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+
+
+def _run_job(engine: str, doc_path: str, out_dir: str,
+             page_numbers: Optional[List[int]] = None) -> Tuple[bool, str]:
+    """在 worker 进程中执行一个转换任务，返回 (success, output)"""
+    buf = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buf), contextlib.redirect_stderr(buf):
+            if engine == "pdf-range":
+                # 分段提取：out_dir 是该段的输出文本文件
+                from pdf_converter import extract_pdf_text
+                extract_pdf_text(doc_path, out_dir, page_numbers)
+                return True, buf.getvalue()
+
+            Path(out_dir).mkdir(parents=True, exist_ok=True)
+            if engine == "python":
+                from pdf_converter import convert_pdf_to_markdown
+                convert_pdf_to_markdown(doc_path, out_dir)
+                return True, buf.getvalue()
+
+            from docx_converter import convert_docx_builtin
+            success, message, _ = convert_docx_builtin(doc_path, out_dir)
+            if not success:
+                print(message)
+            return success, buf.getvalue()
+    except ResourceLimitExceeded:
+        raise
+    except Exception as e:
+        return False, buf.getvalue() + f"\n{type(e).__name__}: {e}"
+
+
+def _worker_main(conn, limits: Optional[EngineLimits] = None) -> None:
+    """
+    worker 进程主循环：逐个接收任务并返回结果，收到 None 或管道关闭时退出
+
+    结果为 ("ok", (success, output))，超出 CPU 时间限制时为 ("limit", 原因)
+    """
+    limits = limits or EngineLimits()
+    _init_worker(limits)
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        try:
+            with cpu_budget(limits):
+                result = ("ok", _run_job(*job))
+        except ResourceLimitExceeded as e:
+            result = ("limit", e.reason)
+        conn.send(result)
+
+
+class _Worker:
+    """一个 worker 进程及其任务管道"""
+
+    def __init__(self, context, limits: Optional[EngineLimits] = None):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, limits), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def stop(self, grace: float = 0) -> None:
+        """让 worker 退出：grace 秒内没有自行退出（或 grace 为 0）时强制终止"""
+        if grace > 0:
+            with contextlib.suppress(OSError):
+                self.conn.send(None)
+            self.process.join(grace)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class PythonWorkerPool:
+    """
+    预启动的转换进程池
+
+    任务和结果通过各 worker 的管道传递；进程在第一次提交任务时才启动，
+    dry-run 或没有文档使用 Python 引擎时不会产生任何子进程。
+    超时从任务交给 worker 时开始计算，在池中排队的时间不计入
+    """
+
+    def __init__(self, processes: int = 0, max_jobs_per_worker: int = 50,
+                 limits: Optional[EngineLimits] = None):
+        """
+        参数:
+            processes: worker 进程数，0 表示使用 CPU 核数
+            max_jobs_per_worker: 每个 worker 处理多少个任务后被回收（0 表示不回收）
+            limits: worker 的资源限制和优先级（cpu_seconds 按任务计，rss_mb 不适用）
+        """
+        self.processes = processes if processes > 0 else (os.cpu_count() or 4)
+        self.max_jobs_per_worker = max_jobs_per_worker if max_jobs_per_worker > 0 else None
+        self.limits = limits
+        # 不用默认的 fork：worker 在事件循环线程里持有 _cond 时启动，此时 io/备份/心跳等线程都在运行，
+        # fork 出的子进程可能继承到被其他线程持有的锁；forkserver/spawn 从干净的进程启动 worker
+        methods = mp.get_all_start_methods()
+        self._context = mp.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self._idle: List[_Worker] = []
+        self._workers: Set[_Worker] = set()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._cond = threading.Condition()
+
+    # -- worker 的借出和归还 ------------------------------------------------
+
+    def _try_checkout(self) -> Optional[_Worker]:
+        """取一个空闲 worker，进程数未满时启动新的；都在忙时返回 None（调用方持有 _cond）"""
+        if self._idle:
+            return self._idle.pop()
+        if len(self._workers) < self.processes:
+            worker = _Worker(self._context, self.limits)
+            self._workers.add(worker)
+            return worker
+        return None
+
+    def _checkout(self) -> _Worker:
+        with self._cond:
+            while True:
+                worker = self._try_checkout()
+                if worker is not None:
+                    return worker
+                self._cond.wait()
+
+    async def _checkout_async(self) -> _Worker:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                worker = self._try_checkout()
+                if worker is not None:
+                    return worker
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # 已经被唤醒却在恢复前被取消：把这次唤醒转给下一个等待者
+                if waiter.done() and not waiter.cancelled():
+                    with self._cond:
+                        self._wake_one()
+                raise
+            finally:
+                with self._cond:
+                    with contextlib.suppress(ValueError):
+                        self._waiters.remove((loop, waiter))
+
+    def _wake_one(self) -> None:
+        """有 worker 空出来：唤醒一个等待者（调用方持有 _cond）
+
+        已经被取消的等待者会被跳过，否则这次唤醒会被它吞掉，其他等待者一直挂着
+        """
+        while self._waiters:
+            loop, waiter = self._waiters.pop(0)
+            if waiter.done():
+                continue
+            loop.call_soon_threadsafe(self._resolve, loop, waiter)
+            break
+        self._cond.notify()
+
+    def _resolve(self, loop: asyncio.AbstractEventLoop, waiter: asyncio.Future) -> None:
+        """在等待者的事件循环中完成唤醒；等待者在这期间被取消时把唤醒转给下一个"""
+        if waiter.done():
+            with self._cond:
+                self._wake_one()
+        else:
+            waiter.set_result(None)
+
+    def _checkin(self, worker: _Worker) -> None:
+        """任务正常结束：归还 worker，达到任务数上限的 worker 被回收"""
+        worker.jobs += 1
+        recycle = self.max_jobs_per_worker is not None and worker.jobs >= self.max_jobs_per_worker
+        with self._cond:
+            keep = not recycle and worker in self._workers
+            if keep:
+                self._idle.append(worker)
+            else:
+                self._workers.discard(worker)
+            self._wake_one()
+        if not keep:
+            # 在后台等它退出，不阻塞调用方（可能是事件循环线程）
+            threading.Thread(target=worker.stop, args=(CLOSE_GRACE,), daemon=True).start()
+
+    def _discard(self, worker: _Worker) -> None:
+        """任务超时、被取消或 worker 意外退出：终止该 worker，下一个任务会启动新的"""
+        with self._cond:
+            self._workers.discard(worker)
+            self._wake_one()
+        worker.stop()
+
+    # -- 任务 ----------------------------------------------------------------
+
+    def _call(self, job: tuple, timeout: Optional[float]) -> Tuple[bool, str]:
+        worker = self._checkout()
+        try:
+            worker.conn.send(job)
+            if not worker.conn.poll(timeout):
+                raise mp.TimeoutError()
+            status, result = worker.conn.recv()
+        except mp.TimeoutError:
+            self._discard(worker)
+            raise
+        except (EOFError, OSError):
+            self._discard(worker)
+            return False, f"worker 进程意外退出（exit code={worker.process.exitcode}）"
+        except BaseException:
+            self._discard(worker)
+            raise
+        return self._finish(worker, job, status, result)
+
+    async def _call_async(self, job: tuple, timeout: Optional[float],
+                          on_start: Optional[Callable[[], None]] = None) -> Tuple[bool, str]:
+        worker = await self._checkout_async()
+        if on_start is not None:
+            on_start()
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = worker.conn.fileno()
+        try:
+            worker.conn.send(job)
+            loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+            try:
+                await asyncio.wait_for(ready, timeout)
+            finally:
+                loop.remove_reader(fd)
+            status, result = worker.conn.recv()
+        except asyncio.TimeoutError:
+            self._discard(worker)
+            raise mp.TimeoutError() from None
+        except (EOFError, OSError):
+            self._discard(worker)
+            return False, f"worker 进程意外退出（exit code={worker.process.exitcode}）"
+        except BaseException:
+            # 包括 asyncio.CancelledError：正在执行的转换随 worker 一起终止
+            self._discard(worker)
+            raise
+        return self._finish(worker, job, status, result)
+
+    def _finish(self, worker: _Worker, job: tuple, status: str, result):
+        if status == "limit":
+            # 转换被 SIGXCPU 打断，worker 中可能残留半完成的状态，换一个新的
+            self._discard(worker)
+            raise ResourceLimitExceeded(list(job[:2]), result)
+        self._checkin(worker)
+        return result
+
+    def start(self) -> None:
+        """立即启动全部 worker 进程（常驻服务启动时预热，第一个请求不必等待进程启动和模块导入）"""
+        with self._cond:
+            while len(self._workers) < self.processes:
+                worker = _Worker(self._context, self.limits)
+                self._workers.add(worker)
+                self._idle.append(worker)
+                self._wake_one()
+
+    def convert(self, engine: str, doc_path: Path, out_dir: Path,
+                timeout: Optional[float] = None) -> Tuple[bool, str]:
+        """
+        在进程池中转换一个文档（阻塞直到完成）
+
+        返回:
+            (success, output)；超时抛出 multiprocessing.TimeoutError（执行该任务的 worker 已终止并将被替换），
+            超出 CPU 时间限制抛出 ResourceLimitExceeded
+        """
+        return self._call((engine, str(doc_path), str(out_dir)), timeout)
+
+    async def convert_async(self, engine: str, doc_path: Path, out_dir: Path,
+                            timeout: Optional[float] = None,
+                            on_start: Optional[Callable[[], None]] = None) -> Tuple[bool, str]:
+        """
+        convert 的 asyncio 版本：事件循环直接监听 worker 的结果管道，等待时不占用线程
+
+        参数:
+            on_start: 取得 worker、任务即将交给它时调用（调用方据此把排队时间和运行时间分开计时）
+
+        返回:
+            (success, output)；超时抛出 multiprocessing.TimeoutError（执行该任务的 worker 已终止并将被替换）
+        """
+        return await self._call_async((engine, str(doc_path), str(out_dir)), timeout, on_start)
+
+    async def extract_pdf_range_async(self, pdf_path: Path, out_file: Path, page_numbers: List[int],
+                                      timeout: Optional[float] = None,
+                                      on_start: Optional[Callable[[], None]] = None) -> Tuple[bool, str]:
+        """在进程池中提取 PDF 的一段页面（从0开始的页码）到 out_file；取消时该 worker 被终止"""
+        return await self._call_async(("pdf-range", str(pdf_path), str(out_file), page_numbers), timeout,
+                                      on_start)
+
+    def close(self) -> None:
+        """关闭进程池：空闲 worker 正常退出，CLOSE_GRACE 秒内没有退出的强制终止"""
+        self._shutdown(CLOSE_GRACE)
+
+    def terminate(self) -> None:
+        """立即终止所有 worker（用于中断或超时后的清理）"""
+        self._shutdown(0)
+
+    def _shutdown(self, grace: float) -> None:
+        with self._cond:
+            workers, self._workers = list(self._workers), set()
+            self._idle.clear()
+        for worker in workers:
+            worker.stop(grace)
@@ -5,6 +5,9 @@
 md_batch_to_pdf.py
 递归搜索目录下所有 Markdown (.md)，调用 md-to-pdf 转为 PDF。
 可选：转换成功后删除原始 md（自动或交互式）。
+转换进程在 asyncio 事件循环中等待（不为每个任务占用线程），超时终止整个进程组；
+Ctrl-C 一次停止启动新任务并等待运行中的任务，两次立即终止。
+--watch 时转换完现有文件后继续监视目录（inotify，不可用时轮询），新增或修改的 md 写完后再转换。
 
 用法示例：
   python md_batch_to_pdf.py
@@ -12,6 +15,8 @@ md_batch_to_pdf.py
   python md_batch_to_pdf.py --delete-md
   python md_batch_to_pdf.py --ask-delete
   python md_batch_to_pdf.py --workers 4
+  python md_batch_to_pdf.py --timeout 120
+  python md_batch_to_pdf.py --watch
   python md_batch_to_pdf.py --force
   python md_batch_to_pdf.py --dry-run
   python md_batch_to_pdf.py --exclude .git node_modules dist
@@ -20,15 +25,30 @@ md_batch_to_pdf.py
 from __future__ import annotations
 
 import argparse
+import asyncio
 import os
 import shutil
+import signal
 import subprocess
 import sys
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext, suppress
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+
+# 目录监视、子进程的启动和回收、内存准入与 doc_to_md 共用同一份实现
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from doc_to_md.admission import MemoryGovernor
+from doc_to_md.aio import run_process
+from doc_to_md.watch import TreeWatcher
+
+# 内存准入中的工具名；md-to-pdf 每次转换都会启动一个 Chromium，按此估算单个任务的内存（MB）
+ENGINE = "md-to-pdf"
+DEFAULT_MEMORY_WEIGHT_MB = 400
+
+# --watch：每次等待文件变化的最长时间（秒）
+WATCH_WAIT = 1.0
 
 
 @dataclass(frozen=True)
@@ -52,6 +72,13 @@ def _is_excluded(path: Path, exclude_names: set[str]) -> bool:
     return any(part in exclude_names for part in path.parts)
 
 
+def _is_newer(path: Path, other: Path) -> bool:
+    try:
+        return path.stat().st_mtime > other.stat().st_mtime
+    except OSError:
+        return False
+
+
 def find_markdown_files(root: Path, exclude_names: set[str]) -> List[Path]:
     md_files: List[Path] = []
     for p in root.rglob("*.md"):
@@ -69,12 +96,20 @@ def build_cmd(md_path: Path, force: bool) -> List[str]:
     return ["md-to-pdf", str(md_path)]
 
 
-def convert_one(md_path: Path, root: Path, force: bool, dry_run: bool) -> JobResult:
+async def convert_one(
+    md_path: Path,
+    root: Path,
+    force: bool,
+    dry_run: bool,
+    budget: Optional[MemoryGovernor] = None,
+    timeout: float = 0,
+    refresh: bool = False,
+) -> JobResult:
     t0 = time.time()
     pdf_path = md_path.with_suffix(".pdf")
 
-    # 若已存在 PDF，且不 force，则跳过
-    if pdf_path.exists() and not force:
+    # 若已存在 PDF，且不 force，则跳过（refresh 时 md 比 PDF 新则重新生成）
+    if pdf_path.exists() and not force and not (refresh and _is_newer(md_path, pdf_path)):
         return JobResult(
             md_path=md_path,
             pdf_path=pdf_path,
@@ -94,14 +129,18 @@ def convert_one(md_path: Path, root: Path, force: bool, dry_run: bool) -> JobRes
             message=f"DRY-RUN: {' '.join(cmd)}",
         )
 
+    admission = budget.admission_async(ENGINE) if budget is not None else nullcontext(None)
     try:
-        # capture_output=True 便于把失败原因写入日志
-        proc = subprocess.run(
-            cmd,
-            check=False,
-            text=True,
-            capture_output=True,
-        )
+        # 捕获输出（只保留末尾）便于把失败原因写入日志；登记 pid 供内存准入测量实际占用。
+        # 由 doc_to_md 的 run_process 在新会话（进程组）中启动并用 pidfd + wait4 回收，
+        # 超时或中断时连同 Chromium 一起终止
+        try:
+            async with admission as slot:
+                proc, _ = await run_process(cmd, timeout or None,
+                                            on_start=slot.attach if slot is not None else None)
+        except subprocess.TimeoutExpired:
+            elapsed = time.time() - t0
+            return JobResult(md_path, pdf_path, False, elapsed, f"timed out after {timeout:g}s (process group killed)")
         elapsed = time.time() - t0
 
         if proc.returncode != 0:
@@ -173,11 +212,139 @@ def maybe_delete_md(
         return False, f"delete failed: {e}"
 
 
-def print_header(root: Path, total: int, workers: int, force: bool, dry_run: bool, delete_md: bool, ask_delete: bool):
+async def run_jobs(md_files: List[Path], root: Path, args: argparse.Namespace,
+                   budget: Optional[MemoryGovernor], counts: dict,
+                   watcher: Optional[TreeWatcher] = None) -> int:
+    """
+    并发转换所有文件，按完成顺序输出结果并处理删除
+
+    运行中的任务数不超过 --workers，尚未开始的文件不创建任务；
+    Ctrl-C 第一次停止启动新任务、等待运行中的转换完成，第二次终止运行中的转换。
+    给出 watcher 时转换完现有文件后继续转换监视到的变化，直到 Ctrl-C；
+    转换期间又被修改的文件在本次结束后再转换一次
+
+    返回:
+        因中断而没有开始的文件数
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(max(1, args.workers))
+    finished: asyncio.Queue = asyncio.Queue()
+    running: set = set()
+    active: Dict[Path, asyncio.Task] = {}
+    rerun: set = set()
+    stopping = asyncio.Event()
+    total = len(md_files)
+
+    def on_interrupt() -> None:
+        if not stopping.is_set():
+            stopping.set()
+            print(f"Interrupted: not starting new conversions, waiting for {len(running)} running "
+                  f"(press Ctrl-C again to kill them).")
+        else:
+            print("Interrupted again: killing running conversions.")
+            for task in list(running):
+                task.cancel()
+
+    with suppress(NotImplementedError, RuntimeError):
+        loop.add_signal_handler(signal.SIGINT, on_interrupt)
+
+    def on_done(task: asyncio.Task, md: Path) -> None:
+        running.discard(task)
+        active.pop(md, None)
+        slots.release()
+        finished.put_nowait((task, md))
+
+    async def launch(md: Path) -> bool:
+        await slots.acquire()
+        if stopping.is_set():
+            slots.release()
+            return False
+        task = asyncio.ensure_future(
+            convert_one(md, root, args.force, args.dry_run, budget, args.timeout, refresh=watcher is not None)
+        )
+        running.add(task)
+        active[md] = task
+        task.add_done_callback(lambda t, md=md: on_done(t, md))
+        return True
+
+    async def report() -> None:
+        # 删除逻辑按完成顺序串行处理；交互确认在线程中等待输入，不阻塞事件循环
+        done_idx = 0
+        while True:
+            item = await finished.get()
+            if item is None:
+                return
+            task, md = item
+            done_idx += 1
+            rel_md = _human_rel(md, root)
+            if task.cancelled():
+                counts["interrupted"] += 1
+                print(f"[{done_idx:>4}/{total}] KILL  {rel_md}  (interrupted)")
+                continue
+            res = task.result()
+            rel_pdf = _human_rel(res.pdf_path, root)
+
+            # 输出每个任务一行摘要 + 失败原因（若失败）
+            if res.message.startswith("SKIP"):
+                counts["skip"] += 1
+                print(f"[{done_idx:>4}/{total}] SKIP  {rel_md}  ->  {rel_pdf}")
+                continue
+
+            if res.ok:
+                counts["ok"] += 1
+                print(f"[{done_idx:>4}/{total}] OK    {rel_md}  ->  {rel_pdf}  ({res.elapsed_s:.2f}s)")
+                deleted, del_msg = await asyncio.to_thread(
+                    maybe_delete_md,
+                    res.md_path,
+                    mode_delete=args.delete_md,
+                    mode_ask=args.ask_delete,
+                    dry_run=args.dry_run,
+                )
+                if deleted:
+                    counts["deleted"] += 1
+                    print(f"              🧹 {del_msg}: {rel_md}")
+            else:
+                counts["fail"] += 1
+                print(f"[{done_idx:>4}/{total}] FAIL  {rel_md}  ({res.elapsed_s:.2f}s)")
+                print(f"              Reason: {res.message}")
+
+    reporter = asyncio.ensure_future(report())
+    started = 0
+    try:
+        for md in md_files:
+            if not await launch(md):
+                break
+            started += 1
+        not_started = len(md_files) - started
+        while watcher is not None and not stopping.is_set():
+            # 等待在线程中进行，事件循环照常处理完成的转换和 Ctrl-C
+            changed = await asyncio.to_thread(watcher.wait, WATCH_WAIT)
+            changed += [md for md in rerun if md not in active]
+            for md in changed:
+                if md in active:
+                    rerun.add(md)
+                    continue
+                rerun.discard(md)
+                if not await launch(md):
+                    break
+                total += 1
+        while running:
+            await asyncio.wait(set(running))
+        finished.put_nowait(None)
+        await reporter
+    finally:
+        with suppress(NotImplementedError, RuntimeError):
+            loop.remove_signal_handler(signal.SIGINT)
+    counts["total"] = total
+    return not_started
+
+
+def print_header(root: Path, total: int, workers: int, force: bool, dry_run: bool, delete_md: bool, ask_delete: bool,
+                 timeout: float = 0):
     print("md-to-pdf batch: Markdown → PDF")
     print(f"Root: {root}")
     print(
-        f"MD files: {total} | workers={workers} | force={force} | dry_run={dry_run} | "
+        f"MD files: {total} | workers={workers} | timeout={timeout:g}s | force={force} | dry_run={dry_run} | "
         f"delete_md={delete_md} | ask_delete={ask_delete}"
     )
     print("-" * 72)
@@ -198,7 +365,27 @@ def main(argv: Optional[List[str]] = None) -> int:
         "--workers",
         type=int,
         default=max(2, (os.cpu_count() or 4) // 2),
-        help="Number of concurrent conversions (thread pool).",
+        help="Number of concurrent conversions.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=0,
+        help="Per-file timeout in seconds (0 = no limit). On timeout the whole md-to-pdf process group "
+        "(Node + Chromium) is killed.",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        default=0,
+        help="Memory budget in MB for running conversions (0 = 80%% of available memory, -1 = unlimited). "
+        "New conversions wait while the running ones would exceed it.",
+    )
+    parser.add_argument(
+        "--memory-weight",
+        type=int,
+        default=DEFAULT_MEMORY_WEIGHT_MB,
+        help="Estimated memory in MB of one md-to-pdf conversion (Node + Chromium).",
     )
     parser.add_argument(
         "--force",
@@ -220,6 +407,23 @@ def main(argv: Optional[List[str]] = None) -> int:
         action="store_true",
         help="Ask interactively whether to delete each source .md after success.",
     )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After converting existing files, keep running and convert new or modified .md files "
+        "once they are fully written (Ctrl-C to stop). Modified files are re-rendered even if the PDF exists.",
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=2.0,
+        help="With --watch: seconds a file must stay unchanged before it is converted.",
+    )
+    parser.add_argument(
+        "--watch-poll",
+        action="store_true",
+        help="With --watch: poll the tree instead of using inotify (for NFS/SMB mounts).",
+    )
     parser.add_argument(
         "--exclude",
         nargs="*",
@@ -244,6 +448,19 @@ def main(argv: Optional[List[str]] = None) -> int:
         return 2
 
     exclude_names = set(args.exclude or [])
+    watcher = None
+    if args.watch:
+        if args.ask_delete:
+            print("❌ --watch cannot be combined with --ask-delete.")
+            return 2
+        # 先建立监视再扫描，扫描期间新建的文件不会遗漏
+        watcher = TreeWatcher(
+            root,
+            accept=lambda p: p.suffix == ".md" and not _is_excluded(p, exclude_names),
+            skip_dir=lambda p: p.name in exclude_names,
+            settle=args.settle,
+            use_inotify=not args.watch_poll,
+        )
     md_files = find_markdown_files(root, exclude_names)
 
     print_header(
@@ -254,63 +471,41 @@ def main(argv: Optional[List[str]] = None) -> int:
         dry_run=args.dry_run,
         delete_md=args.delete_md,
         ask_delete=args.ask_delete,
+        timeout=args.timeout,
     )
 
-    if not md_files:
+    if watcher is not None:
+        mode = "inotify" if watcher.mode == "inotify" else f"polling every {watcher.poll_interval:g}s"
+        print(f"Watching: {mode}" + (f" ({watcher.reason})" if watcher.reason else "")
+              + f" | settle={args.settle:g}s | Ctrl-C to stop")
+    elif not md_files:
         print("No markdown files found.")
         return 0
 
-    ok_count = 0
-    fail_count = 0
-    skip_count = 0
-    del_count = 0
-
-    # 并发转换（删除逻辑放在主线程按完成顺序处理，避免交互阻塞线程池）
-    results: List[JobResult] = []
-    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as ex:
-        future_map = {
-            ex.submit(convert_one, md, root, args.force, args.dry_run): md for md in md_files
-        }
-
-        done_idx = 0
-        total = len(future_map)
-
-        for fut in as_completed(future_map):
-            done_idx += 1
-            res = fut.result()
-            results.append(res)
+    budget = None
+    if not args.dry_run:
+        budget = MemoryGovernor(args.memory_budget, {ENGINE: args.memory_weight})
+        if budget.enabled:
+            print(f"Memory budget: {budget.budget_mb} MB ({args.memory_weight} MB per conversion)")
+        else:
+            budget = None
 
-            rel_md = _human_rel(res.md_path, root)
-            rel_pdf = _human_rel(res.pdf_path, root)
-
-            # 输出每个任务一行摘要 + 失败原因（若失败）
-            if res.message.startswith("SKIP"):
-                skip_count += 1
-                print(f"[{done_idx:>4}/{total}] SKIP  {rel_md}  ->  {rel_pdf}")
-                continue
-
-            if res.ok:
-                ok_count += 1
-                print(f"[{done_idx:>4}/{total}] OK    {rel_md}  ->  {rel_pdf}  ({res.elapsed_s:.2f}s)")
-                deleted, del_msg = maybe_delete_md(
-                    res.md_path,
-                    mode_delete=args.delete_md,
-                    mode_ask=args.ask_delete,
-                    dry_run=args.dry_run,
-                )
-                if deleted:
-                    del_count += 1
-                    print(f"              🧹 {del_msg}: {rel_md}")
-            else:
-                fail_count += 1
-                print(f"[{done_idx:>4}/{total}] FAIL  {rel_md}  ({res.elapsed_s:.2f}s)")
-                print(f"              Reason: {res.message}")
+    counts = {"ok": 0, "fail": 0, "skip": 0, "deleted": 0, "interrupted": 0, "total": len(md_files)}
+    try:
+        not_started = asyncio.run(run_jobs(md_files, root, args, budget, counts, watcher))
+    finally:
+        if watcher is not None:
+            watcher.close()
+    fail_count = counts["fail"]
 
     print("-" * 72)
     print(
-        f"Done. OK={ok_count} | FAIL={fail_count} | SKIP={skip_count} | "
-        f"Deleted MD={del_count} | Total MD={len(md_files)}"
+        f"Done. OK={counts['ok']} | FAIL={fail_count} | SKIP={counts['skip']} | "
+        f"Deleted MD={counts['deleted']} | Total MD={counts['total']}"
     )
+    if not_started or counts["interrupted"]:
+        print(f"Interrupted: {counts['interrupted']} conversion(s) killed, {not_started} not started.")
+        return 130
 
     return 0 if fail_count == 0 else 1
 
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+任务队列的多进程测试
+每个 worker 是独立进程、各自打开一个 JobQueue（与多台机器上的 worker 相同）：
+并发领取时每个任务恰好被领取一次；worker 在持有租约时被杀死，租约过期后任务被重新领取；
+领取次数达到 max_attempts 的任务记为失败
+"""
+
+import multiprocessing as mp
+import os
+import signal
+import sqlite3
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "doc_to_md"))
+
+from job_queue import DONE, FAILED, LEASED, PENDING, JobQueue  # noqa: E402
+
+# 各测试使用的租约时长（秒，JobQueue 允许的最小值）
+LEASE = 1.0
+
+# 等待子进程的时间上限（秒）
+JOIN_TIMEOUT = 60
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="依赖 POSIX 信号和 fcntl 锁")
+
+# spawn：子进程不继承 pytest 进程的线程和打开的连接
+CONTEXT = mp.get_context("spawn")
+
+
+def _enqueue(tmp_path: Path, count: int) -> Tuple[Path, List[Path]]:
+    """在 tmp_path 下建任务库并入队 count 个虚拟文档（文档不需要存在）"""
+    root = tmp_path / "docs"
+    root.mkdir()
+    documents = [root / f"doc_{i:04d}.pdf" for i in range(count)]
+    db_path = tmp_path / "queue.sqlite"
+    queue = JobQueue(db_path, lease_seconds=LEASE)
+    try:
+        added, _ = queue.enqueue(root, [(doc, 0.0) for doc in documents])
+    finally:
+        queue.close()
+    assert added == count
+    return db_path, [doc.resolve() for doc in documents]
+
+
+def _jobs(db_path: Path) -> Dict[str, Tuple[str, int, str]]:
+    """任务库中每个任务的 (状态, 领取次数, 失败类型)"""
+    with sqlite3.connect(str(db_path)) as conn:
+        rows = conn.execute("SELECT source, state, attempts, failure FROM jobs").fetchall()
+    return {source: (state, attempts, failure) for source, state, attempts, failure in rows}
+
+
+def _drain(db_path: str, results) -> None:
+    """领取并完成任务直到队列为空，把领取到的路径交回父进程"""
+    queue = JobQueue(Path(db_path), lease_seconds=LEASE)
+    queue.start_heartbeat()
+    claimed: List[str] = []
+    try:
+        while True:
+            batch = queue.claim(3)
+            if not batch:
+                if queue.active_leases() == 0:
+                    break
+                time.sleep(0.02)
+                continue
+            for doc_path in batch:
+                claimed.append(str(doc_path))
+                queue.complete(doc_path, ok=True)
+    finally:
+        queue.close()
+    results.put(claimed)
+
+
+def _claim_and_hang(db_path: str, count: int, max_attempts: int, ready) -> None:
+    """领取 count 个任务、启动续租线程后一直挂着，等父进程杀死"""
+    queue = JobQueue(Path(db_path), lease_seconds=LEASE, max_attempts=max_attempts)
+    queue.start_heartbeat()
+    ready.put([str(doc_path) for doc_path in queue.claim(count)])
+    while True:
+        time.sleep(1)
+
+
+def _kill_while_leased(db_path: Path, count: int, max_attempts: int) -> List[str]:
+    """启动一个领取任务后挂起的 worker，在它持有租约时用 SIGKILL 杀死，返回它领取的任务"""
+    ready = CONTEXT.Queue()
+    process = CONTEXT.Process(target=_claim_and_hang, args=(str(db_path), count, max_attempts, ready))
+    process.start()
+    try:
+        claimed = ready.get(timeout=JOIN_TIMEOUT)
+    finally:
+        os.kill(process.pid, signal.SIGKILL)
+        process.join(JOIN_TIMEOUT)
+    assert process.exitcode == -signal.SIGKILL
+    return claimed
+
+
+def test_concurrent_claims_are_exactly_once(tmp_path):
+    db_path, documents = _enqueue(tmp_path, 200)
+    results = CONTEXT.Queue()
+    processes = [CONTEXT.Process(target=_drain, args=(str(db_path), results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    claimed = [path for _ in processes for path in results.get(timeout=JOIN_TIMEOUT)]
+    for process in processes:
+        process.join(JOIN_TIMEOUT)
+        assert process.exitcode == 0
+
+    duplicates = [path for path, n in Counter(claimed).items() if n > 1]
+    assert duplicates == []
+    assert sorted(claimed) == sorted(str(doc) for doc in documents)
+    assert all(job == (DONE, 1, None) for job in _jobs(db_path).values())
+
+
+def test_killed_worker_jobs_are_released_after_lease(tmp_path):
+    db_path, _ = _enqueue(tmp_path, 5)
+    lost = _kill_while_leased(db_path, count=3, max_attempts=3)
+    assert len(lost) == 3
+
+    queue = JobQueue(db_path, lease_seconds=LEASE)
+    try:
+        # 租约未过期：被杀死的 worker 的任务仍属于它，只能领到其余的任务
+        first = {str(doc) for doc in queue.claim(10)}
+        assert first.isdisjoint(lost) and len(first) == 2
+        for doc in first:
+            queue.complete(Path(doc), ok=True)
+        assert queue.claim(10) == []
+
+        time.sleep(LEASE + 0.2)
+        second = {str(doc) for doc in queue.claim(10)}
+        assert second == set(lost)
+        for doc in second:
+            queue.complete(Path(doc), ok=True)
+    finally:
+        queue.close()
+
+    jobs = _jobs(db_path)
+    assert all(jobs[doc] == (DONE, 2, None) for doc in lost)
+    assert all(state == DONE for state, _, _ in jobs.values())
+
+
+def test_jobs_fail_after_max_attempts(tmp_path):
+    db_path, documents = _enqueue(tmp_path, 1)
+    (doc,) = (str(path) for path in documents)
+
+    # 每次领取都让 worker 崩溃：前两次租约过期后回到待领取状态
+    for attempt in (1, 2):
+        assert _kill_while_leased(db_path, count=1, max_attempts=2) == [doc]
+        assert _jobs(db_path)[doc] == (LEASED, attempt, None)
+        time.sleep(LEASE + 0.2)
+
+    queue = JobQueue(db_path, lease_seconds=LEASE, max_attempts=2)
+    try:
+        assert queue.claim(1) == []
+        assert queue.counts() == {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 1}
+    finally:
+        queue.close()
+    assert _jobs(db_path)[doc] == (FAILED, 2, "lease")
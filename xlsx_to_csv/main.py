@@ -9,6 +9,7 @@ xlsx_to_csv
 - 每个工作表输出一个 CSV。
 - 若只有一个工作表，输出文件名为 <stem>.csv。
 - 若有多个工作表，输出文件名为 <stem>__<sheet>.csv。
+- --watch 时转换完现有文件后继续监视目录（inotify，不可用时轮询），新增或修改的 xlsx 写完后再转换。
 
 用法示例：
   python xlsx_to_csv/main.py
@@ -18,6 +19,7 @@ xlsx_to_csv
   python xlsx_to_csv/main.py --workers 4
   python xlsx_to_csv/main.py --force
   python xlsx_to_csv/main.py --dry-run
+  python xlsx_to_csv/main.py --watch
   python xlsx_to_csv/main.py --exclude .git node_modules dist
 """
 
@@ -28,16 +30,23 @@ import csv
 import os
 import sys
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List, Optional, Set, Tuple
+from typing import Dict, Iterable, List, Optional, Set
+
+# 目录监视与 doc_to_md 共用同一份实现
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from doc_to_md.watch import TreeWatcher
 
 try:
     from openpyxl import load_workbook
 except ImportError:  # pragma: no cover
     load_workbook = None
 
+# --watch：每次等待文件变化的最长时间（秒）
+WATCH_WAIT = 1.0
+
 
 @dataclass(frozen=True)
 class JobResult:
@@ -61,20 +70,32 @@ def _is_excluded(path: Path, exclude_names: Set[str]) -> bool:
     return any(part in exclude_names for part in path.parts)
 
 
+def _is_newer(path: Path, other: Path) -> bool:
+    try:
+        return path.stat().st_mtime > other.stat().st_mtime
+    except OSError:
+        return False
+
+
 def _sanitize_filename(name: str) -> str:
     invalid = {'/', '\\', ':', '*', '?', '"', '<', '>', '|'}
     out = "".join("_" if ch in invalid else ch for ch in name)
     return out.strip() or "sheet"
 
 
+def _is_candidate(p: Path, root: Path, exclude_names: Set[str], include_hidden: bool) -> bool:
+    # "~$" 开头的是 Excel 打开工作簿时生成的锁文件
+    if p.name.startswith("~$") or _is_excluded(p, exclude_names):
+        return False
+    return include_hidden or not any(part.startswith(".") for part in p.relative_to(root).parts)
+
+
 def find_xlsx_files(root: Path, exclude_names: Set[str], include_hidden: bool) -> List[Path]:
     xlsx_files: List[Path] = []
     for p in root.rglob("*.xlsx"):
         if not p.is_file():
             continue
-        if _is_excluded(p, exclude_names):
-            continue
-        if not include_hidden and any(part.startswith(".") for part in p.relative_to(root).parts):
+        if not _is_candidate(p, root, exclude_names, include_hidden):
             continue
         xlsx_files.append(p)
     xlsx_files.sort(key=lambda x: str(x).lower())
@@ -111,6 +132,7 @@ def convert_one(
     sheet_name: Optional[str],
     force: bool,
     dry_run: bool,
+    refresh: bool = False,
 ) -> JobResult:
     t0 = time.time()
     if load_workbook is None:
@@ -147,7 +169,8 @@ def convert_one(
             csv_path = out_dir / csv_name
             output_paths.append(csv_path)
 
-            if csv_path.exists() and not force:
+            # refresh（--watch）时工作簿比 CSV 新则重新导出
+            if csv_path.exists() and not force and not (refresh and _is_newer(xlsx_path, csv_path)):
                 skipped += 1
                 continue
 
@@ -222,6 +245,23 @@ def main(argv: Optional[List[str]] = None) -> int:
         default=None,
         help="Only export the specified sheet name.",
     )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After converting existing files, keep running and convert new or modified .xlsx files "
+        "once they are fully written (Ctrl-C to stop). Modified workbooks are re-exported even if the CSV exists.",
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=2.0,
+        help="With --watch: seconds a file must stay unchanged before it is converted.",
+    )
+    parser.add_argument(
+        "--watch-poll",
+        action="store_true",
+        help="With --watch: poll the tree instead of using inotify (for NFS/SMB mounts).",
+    )
     parser.add_argument(
         "--exclude",
         nargs="*",
@@ -241,6 +281,16 @@ def main(argv: Optional[List[str]] = None) -> int:
         return 2
 
     exclude_names = set(args.exclude or [])
+    watcher = None
+    if args.watch:
+        # 先建立监视再扫描，扫描期间新建的文件不会遗漏
+        watcher = TreeWatcher(
+            root,
+            accept=lambda p: p.suffix == ".xlsx" and _is_candidate(p, root, exclude_names, args.include_hidden),
+            skip_dir=lambda p: p.name in exclude_names or (not args.include_hidden and p.name.startswith(".")),
+            settle=args.settle,
+            use_inotify=not args.watch_poll,
+        )
     xlsx_files = find_xlsx_files(root, exclude_names, include_hidden=args.include_hidden)
 
     print_header(
@@ -254,7 +304,11 @@ def main(argv: Optional[List[str]] = None) -> int:
         sheet_name=args.sheet,
     )
 
-    if not xlsx_files:
+    if watcher is not None:
+        mode = "inotify" if watcher.mode == "inotify" else f"polling every {watcher.poll_interval:g}s"
+        print(f"Watching: {mode}" + (f" ({watcher.reason})" if watcher.reason else "")
+              + f" | settle={args.settle:g}s | Ctrl-C to stop")
+    elif not xlsx_files:
         print("No xlsx files found.")
         return 0
 
@@ -262,11 +316,50 @@ def main(argv: Optional[List[str]] = None) -> int:
     fail_count = 0
     skip_count = 0
     created_total = 0
-
-    results: List[JobResult] = []
+    done_idx = 0
+    total = 0
+
+    def report(res: JobResult) -> None:
+        nonlocal ok_count, fail_count, skip_count, created_total, done_idx
+        done_idx += 1
+        rel_xlsx = _human_rel(res.xlsx_path, root)
+
+        if not res.ok:
+            fail_count += 1
+            print(f"[{done_idx:>4}/{total}] FAIL  {rel_xlsx}  ({res.elapsed_s:.2f}s)")
+            print(f"              Reason: {res.message}")
+            return
+
+        ok_count += 1
+        created_total += res.created
+        skip_count += res.skipped
+
+        created_msg = f"created={res.created}"
+        skipped_msg = f"skipped={res.skipped}"
+        print(f"[{done_idx:>4}/{total}] OK    {rel_xlsx}  ({res.elapsed_s:.2f}s)  {created_msg}, {skipped_msg}")
+
+    # 运行中的任务：工作簿 -> Future；转换期间又被修改的工作簿在本次结束后再转换一次
+    active: Dict[Path, Future] = {}
+    rerun: Set[Path] = set()
+
+    def collect(timeout: Optional[float]) -> None:
+        if not active:
+            return
+        done, _ = wait(list(active.values()), timeout=timeout, return_when=FIRST_COMPLETED)
+        for xlsx, fut in list(active.items()):
+            if fut in done:
+                del active[xlsx]
+                report(fut.result())
+
+    interrupted = False
     with ThreadPoolExecutor(max_workers=max(1, args.workers)) as ex:
-        future_map = {
-            ex.submit(
+        def submit(xlsx: Path) -> None:
+            nonlocal total
+            if xlsx in active:
+                rerun.add(xlsx)
+                return
+            rerun.discard(xlsx)
+            active[xlsx] = ex.submit(
                 convert_one,
                 xlsx,
                 root,
@@ -274,40 +367,41 @@ def main(argv: Optional[List[str]] = None) -> int:
                 args.sheet,
                 args.force,
                 args.dry_run,
-            ): xlsx
-            for xlsx in xlsx_files
-        }
-
-        done_idx = 0
-        total = len(future_map)
+                watcher is not None,
+            )
+            total += 1
 
-        for fut in as_completed(future_map):
-            done_idx += 1
-            res = fut.result()
-            results.append(res)
-
-            rel_xlsx = _human_rel(res.xlsx_path, root)
-
-            if not res.ok:
-                fail_count += 1
-                print(f"[{done_idx:>4}/{total}] FAIL  {rel_xlsx}  ({res.elapsed_s:.2f}s)")
-                print(f"              Reason: {res.message}")
-                continue
-
-            ok_count += 1
-            created_total += res.created
-            skip_count += res.skipped
-
-            created_msg = f"created={res.created}"
-            skipped_msg = f"skipped={res.skipped}"
-            print(f"[{done_idx:>4}/{total}] OK    {rel_xlsx}  ({res.elapsed_s:.2f}s)  {created_msg}, {skipped_msg}")
+        try:
+            for xlsx in xlsx_files:
+                submit(xlsx)
+            while active:
+                collect(None)
+            while watcher is not None:
+                # 监视：转换完成的结果和新的变化交替处理，直到 Ctrl-C
+                for xlsx in watcher.wait(WATCH_WAIT) + [x for x in rerun if x not in active]:
+                    submit(xlsx)
+                collect(0)
+        except KeyboardInterrupt:
+            # 不再提交新任务，尚未开始的取消，运行中的转换完成后退出
+            interrupted = True
+            print("Interrupted: waiting for running conversions to finish.")
+            for fut in active.values():
+                fut.cancel()
+            active = {x: f for x, f in active.items() if not f.cancelled()}
+            while active:
+                collect(None)
+        finally:
+            if watcher is not None:
+                watcher.close()
 
     print("-" * 72)
     print(
         f"Done. OK={ok_count} | FAIL={fail_count} | CSV created={created_total} | "
-        f"CSV skipped={skip_count} | Total XLSX={len(xlsx_files)}"
+        f"CSV skipped={skip_count} | Total XLSX={total}"
     )
 
+    if interrupted and watcher is None:
+        return 130
     return 0 if fail_count == 0 else 1
 
 